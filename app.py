@@ -2,7 +2,7 @@ import os
 import logging
 from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
-from models import db
+from models import db, sync_schema
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -29,6 +29,12 @@ app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
 
+# Configure processing settings
+app.config['MAX_CONCURRENT_JOBS'] = int(os.environ.get('MAX_CONCURRENT_JOBS', 0)) or None  # None = half the CPU cores
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 0)) or None  # None = 5GB
+# 0 = this process only queues jobs; run `python -m worker` to encode them (needs STATE_BACKEND sql or redis://)
+app.config['RUN_ENCODE_WORKERS'] = os.environ.get('RUN_ENCODE_WORKERS', '1') not in ('0', 'false', 'no')
+
 # Initialize database
 db.init_app(app)
 
@@ -39,6 +45,7 @@ os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 # Create database tables
 with app.app_context():
     db.create_all()
+    sync_schema()
 
 # Import routes after app creation
 from routes import *
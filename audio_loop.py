@@ -0,0 +1,124 @@
+import os
+import math
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import ffmpeg
+
+from probe import first_stream, media_duration
+
+# aloop keeps the decoded source in memory (about 380 MB for 15 minutes of
+# 48 kHz stereo float); longer sources are looped with -stream_loop instead
+LOOP_BUFFER_MAX_SECONDS = 900
+
+# Longest loop_audio output; longer requests are rejected rather than encoded
+MAX_LOOP_SECONDS = int(os.environ.get('MAX_LOOP_SECONDS', 0)) or 4 * 3600
+
+
+def loop_duration(options: Dict) -> float:
+    """Length of a loop_audio output from options['duration'], 60 seconds by default"""
+    # Form fields arrive as strings
+    duration = float(options.get('duration', 60))
+    # Also rejects nan and inf
+    if not 0 < duration <= MAX_LOOP_SECONDS:
+        raise ValueError(f"Loop duration must be between 0 and {MAX_LOOP_SECONDS} seconds")
+    return duration
+
+
+def crossfade_seconds(options: Dict) -> float:
+    """Seam crossfade requested with options['crossfade'], 0 for hard cuts"""
+    crossfade = float(options.get('crossfade') or 0)
+    if crossfade < 0:
+        raise ValueError("crossfade must not be negative")
+    return crossfade
+
+
+def write_concat_list(paths: List[str], directory: Optional[str] = None) -> str:
+    """Concat demuxer script that plays ``paths`` in order; the caller removes it"""
+    fd, list_path = tempfile.mkstemp(prefix='concat_', suffix='.txt', dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def _trimmed(stream, **bounds):
+    return stream.filter('atrim', **bounds).filter('asetpts', 'PTS-STARTPTS')
+
+
+def _decoded_loop(source, source_duration: float, sample_rate: int, crossfade: float):
+    """Repeat the samples of a decoded source stream with aloop.
+
+    With a crossfade the repeated cycle is body + (tail crossfaded into
+    head), played after the untouched head, so every seam overlaps by
+    ``crossfade`` seconds.
+    """
+    if not crossfade:
+        return source.filter('aloop', loop=-1, size=int(source_duration * sample_rate))
+
+    parts = source.filter_multi_output('asplit', 4)
+    head = _trimmed(parts[0], end=crossfade)
+    body = _trimmed(parts[1], start=crossfade, end=source_duration - crossfade)
+    tail = _trimmed(parts[2], start=source_duration - crossfade)
+    next_head = _trimmed(parts[3], end=crossfade)
+    seam = ffmpeg.filter([tail, next_head], 'acrossfade', d=crossfade)
+    cycle = ffmpeg.concat(body, seam, v=0, a=1).filter(
+        'aloop', loop=-1, size=int((source_duration - crossfade) * sample_rate)
+    )
+    return ffmpeg.concat(head, cycle, v=0, a=1)
+
+
+def _check_crossfade(crossfade: float, source_duration: float):
+    if crossfade and crossfade * 2 >= source_duration:
+        raise ValueError("crossfade must be shorter than half the source")
+
+
+def looped_audio(path: str, probe: Dict, duration: float, copy: bool = False,
+                 crossfade: float = 0.0) -> Tuple[object, Optional[str], str]:
+    """Audio stream repeating ``path`` for at least ``duration`` seconds.
+
+    Returns ``(stream, concat_list, mode)``; trim the output with ``t``.
+    ``copy`` stream-copies through the concat demuxer (nothing is decoded,
+    and ``t`` cuts on an audio frame); otherwise the source is decoded once
+    and repeated with aloop, falling back to -stream_loop for sources too
+    long to buffer. ``concat_list`` is a temporary file the caller removes.
+    """
+    source_duration = media_duration(probe)
+    if not source_duration:
+        raise ValueError(f"Could not determine duration of {os.path.basename(path)}")
+    _check_crossfade(crossfade, source_duration)
+
+    repeats = max(1, math.ceil(duration / source_duration))
+    if repeats == 1:
+        return ffmpeg.input(path).audio, None, 'trim'
+
+    if copy and not crossfade:
+        list_path = write_concat_list([path] * repeats)
+        return ffmpeg.input(list_path, f='concat', safe=0).audio, list_path, 'copy'
+
+    audio = first_stream(probe, 'audio') or {}
+    sample_rate = int(audio.get('sample_rate') or 0)
+    if sample_rate and source_duration <= LOOP_BUFFER_MAX_SECONDS:
+        return _decoded_loop(ffmpeg.input(path).audio, source_duration, sample_rate, crossfade), None, 'aloop'
+
+    if crossfade:
+        raise ValueError(f"Crossfaded loops need a source shorter than {LOOP_BUFFER_MAX_SECONDS} seconds")
+    return ffmpeg.input(path, stream_loop=repeats - 1).audio, None, 'stream_loop'
+
+
+def looped_stream(stream, source_duration: float, duration: float, sample_rate: int, crossfade: float = 0.0):
+    """Decoded ``stream`` repeated for at least ``duration`` seconds.
+
+    For sources that are the output of an earlier filter graph (fused
+    pipeline stages) rather than a file: the first ``source_duration``
+    seconds are resampled to ``sample_rate`` and repeated with aloop. Raises
+    ValueError when they are too long to buffer; trim the output with ``t``.
+    """
+    _check_crossfade(crossfade, source_duration)
+    source = _trimmed(stream.filter('aresample', sample_rate), end=source_duration)
+    if duration <= source_duration:
+        return source
+    if source_duration > LOOP_BUFFER_MAX_SECONDS:
+        raise ValueError(f"Only sources shorter than {LOOP_BUFFER_MAX_SECONDS} seconds can be looped in memory")
+    return _decoded_loop(source, source_duration, sample_rate, crossfade)
@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from streaming import stream_output_dir
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_RESULT_CACHE_BYTES = 5 * 1024 * 1024 * 1024  # 5GB
+
+# Options that change how a job is run but not what it produces
+NON_OUTPUT_OPTIONS = {'cache'}
+
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def content_name(sha256: str, original_filename: str) -> str:
+    """Content-addressed file name: the hash plus the original extension"""
+    ext = os.path.splitext(original_filename)[1].lower()
+    return f"{sha256}{ext}"
+
+
+def store_upload(temp_path: str, upload_folder: str, sha256: str, original_filename: str) -> str:
+    """Move a freshly written upload to its content address and return the saved name.
+
+    If the same content is already stored, the new copy is dropped and the
+    existing blob is touched so age-based cleanup treats it as fresh.
+    """
+    saved_name = content_name(sha256, original_filename)
+    target = os.path.join(upload_folder, saved_name)
+    if os.path.exists(target):
+        os.remove(temp_path)
+        os.utime(target)
+        logging.info(f"Upload deduplicated to existing blob {saved_name}")
+    else:
+        os.replace(temp_path, target)
+    return saved_name
+
+
+def stored_content_hash(path: str, compute: bool = True) -> Optional[str]:
+    """Hash of an uploaded file, read from its content-addressed name when possible"""
+    match = _CONTENT_NAME.match(os.path.basename(path))
+    if match:
+        return match.group(1)
+    if compute and os.path.exists(path):
+        return hash_file(path)
+    return None
+
+
+def result_cache_key(operation: str, files: List[Dict], options: Dict,
+                     upload_folder: str, compute_missing: bool = True) -> Optional[str]:
+    """Key identifying a job's output: operation, input contents and normalized options.
+
+    Returns None when an input hash is not available without hashing the file
+    and ``compute_missing`` is False.
+    """
+    inputs = []
+    for file in files:
+        content_hash = stored_content_hash(
+            os.path.join(upload_folder, file['saved_name']), compute=compute_missing
+        )
+        if content_hash is None:
+            return None
+        inputs.append([file['file_type'], content_hash])
+
+    normalized_options = {key: value for key, value in options.items()
+                          if key not in NON_OUTPUT_OPTIONS and value is not None}
+    key_source = json.dumps(
+        {'operation': operation, 'inputs': inputs, 'options': normalized_options},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(key_source.encode()).hexdigest()
+
+
+def output_size(output_folder: str, output_file: str) -> int:
+    """Bytes an output takes: the whole stream directory for HLS / fMP4 outputs"""
+    directory = stream_output_dir(output_folder, output_file)
+    if directory:
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+    return os.path.getsize(os.path.join(output_folder, output_file))
+
+
+def remove_output(output_folder: str, output_file: str):
+    """Delete an output, with its segments when it is a stream playlist"""
+    directory = stream_output_dir(output_folder, output_file)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+    output_path = os.path.join(output_folder, output_file)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+
+class ResultCache:
+    """Maps job cache keys to finished output files, evicting least recently used outputs"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or DEFAULT_RESULT_CACHE_BYTES
+
+    def lookup(self, cache_key: str, output_folder: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Output file for a key, if it is still on disk, and the task that produced it"""
+        try:
+            from models import db, CachedResult
+            from app import app
+
+            with app.app_context():
+                entry = CachedResult.query.filter_by(cache_key=cache_key).first()
+                if not entry:
+                    return None
+                if not os.path.exists(os.path.join(output_folder, entry.output_file)):
+                    # Removed by cleanup since it was cached
+                    db.session.delete(entry)
+                    db.session.commit()
+                    return None
+                entry.hits = (entry.hits or 0) + 1
+                entry.last_used_at = datetime.utcnow()
+                db.session.commit()
+                return entry.output_file, entry.task_id
+        except Exception as e:
+            logging.error(f"Result cache lookup failed: {str(e)}")
+            return None
+
+    def store(self, cache_key: str, output_file: str, output_folder: str, task_id: Optional[str] = None):
+        """Record a finished output and evict old entries beyond the size budget"""
+        try:
+            from models import db, CachedResult
+            from app import app
+
+            with app.app_context():
+                entry = CachedResult.query.filter_by(cache_key=cache_key).first()
+                if not entry:
+                    entry = CachedResult(cache_key=cache_key)
+                    db.session.add(entry)
+                entry.output_file = output_file
+                entry.task_id = task_id
+                entry.size_bytes = output_size(output_folder, output_file)
+                entry.last_used_at = datetime.utcnow()
+                db.session.commit()
+                self._evict(output_folder, keep=cache_key)
+        except Exception as e:
+            logging.error(f"Result cache store failed: {str(e)}")
+
+    def _evict(self, output_folder: str, keep: str):
+        """Delete least recently used outputs until the cache fits (needs an app context)"""
+        from models import db, CachedResult
+
+        total = db.session.query(db.func.coalesce(db.func.sum(CachedResult.size_bytes), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+
+        for entry in CachedResult.query.order_by(CachedResult.last_used_at).all():
+            if total <= self.max_bytes:
+                break
+            if entry.cache_key == keep:
+                continue
+            remove_output(output_folder, entry.output_file)
+            total -= entry.size_bytes or 0
+            db.session.delete(entry)
+            logging.info(f"Evicted cached result {entry.output_file}")
+        db.session.commit()
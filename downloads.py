@@ -0,0 +1,83 @@
+import os
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from typing import Dict, Optional, Mapping
+from werkzeug.security import safe_join
+
+# '' serves files from Python; 'x-accel' (nginx) or 'x-sendfile' (Apache,
+# lighttpd) hands the transfer to the front-end server, which then does the
+# ranges, conditional requests and zero-copy sendfile itself
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()
+
+# nginx `internal` location aliased to the output folder, e.g.
+#   location /protected-outputs/ { internal; alias /srv/app/outputs/; }
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-outputs/')
+
+# HLS types are missing from most mimetypes tables
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/iso.segment', '.m4s')
+
+
+def resolve_output_path(output_folder: str, filename: str) -> Optional[str]:
+    """Path of an output file (streaming outputs live in sub-folders); None if it escapes the folder"""
+    return safe_join(output_folder, filename)
+
+
+def wants_inline(value: Optional[str]) -> bool:
+    """True for ?inline=1/true/yes, i.e. play in the browser instead of saving"""
+    return (value or '').lower() in ('1', 'true', 'yes')
+
+
+def media_type(filename: str) -> str:
+    """Real MIME type, so browsers can play inline responses"""
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def content_disposition(filename: str, inline: bool) -> str:
+    disposition = 'inline' if inline else 'attachment'
+    ascii_name = filename.encode('ascii', 'ignore').decode() or 'download'
+    if ascii_name == filename:
+        return f'{disposition}; filename="{filename}"'
+    return f"{disposition}; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """Strong validator from modification time and size; outputs are never rewritten in place"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def last_modified(stat: os.stat_result) -> str:
+    return formatdate(stat.st_mtime, usegmt=True)
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, stat: os.stat_result) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since (RFC 9110 13.2.2)"""
+    if_none_match = headers.get('if-none-match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison: W/"x" matches "x"
+        return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def offload_headers(filename: str, file_path: str, inline: bool) -> Optional[Dict[str, str]]:
+    """Headers that make the front-end server send the file, or None to serve it ourselves"""
+    if DOWNLOAD_OFFLOAD == 'x-accel':
+        location = X_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+        header = {'X-Accel-Redirect': location}
+    elif DOWNLOAD_OFFLOAD == 'x-sendfile':
+        header = {'X-Sendfile': os.path.abspath(file_path)}
+    else:
+        return None
+    return dict(header, **{
+        'Content-Type': media_type(filename),
+        'Content-Disposition': content_disposition(os.path.basename(filename), inline)
+    })
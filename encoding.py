@@ -0,0 +1,80 @@
+import os
+from typing import Dict, Any, Optional
+
+# Named speed/quality trade-offs, picked per request with options['profile'].
+# Thread counts are not part of a profile: every encode gets the worker's
+# share of the cores (see FFmpegExecutor).
+ENCODER_PROFILES = {
+    # Roughly 3-5x faster than balanced for a visibly softer picture
+    'fast': {'preset': 'veryfast', 'crf': 26, 'audio_bitrate': '128k'},
+    # libx264 / encoder defaults
+    'balanced': {'preset': 'medium', 'crf': 23, 'audio_bitrate': '128k'},
+    # Slow, near-transparent masters
+    'archive': {'preset': 'slow', 'crf': 18, 'audio_bitrate': '256k'}
+}
+
+# Settings that always apply to an operation, whatever the profile. The
+# profiles leave tune unset: the right one depends on the content, not speed.
+OPERATION_OVERRIDES = {
+    'audio_to_image': {'tune': 'stillimage'}
+}
+
+DEFAULT_ENCODER_PROFILE = os.environ.get('ENCODER_PROFILE', 'balanced')
+
+# Encoders that take the profile's settings
+X264_ENCODERS = {'libx264'}
+LOSSY_AUDIO_ENCODERS = {'aac', 'mp3', 'libmp3lame'}
+
+# Pipeline stages that only feed another stage (options['intermediate']) write
+# lossless streams, so the last stage is the job's only lossy encode. FFV1 is
+# never mistaken for a final codec, so the next stage always re-encodes it,
+# while streams that were stream-copied stay copyable.
+INTERMEDIATE_CODECS = {'vcodec': 'ffv1', 'acodec': 'pcm_f32le'}
+INTERMEDIATE_VIDEO_OPTIONS = {'level': 3}  # sliced, multithreaded FFV1
+INTERMEDIATE_EXTENSION = '.mkv'  # Matroska carries FFV1, float PCM and copied streams alike
+
+
+def profile_name(options: Dict) -> str:
+    """Profile a job encodes with; raises ValueError for unknown names"""
+    name = options.get('profile') or DEFAULT_ENCODER_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile: {name} (use one of {', '.join(ENCODER_PROFILES)})")
+    return name
+
+
+def encoder_settings(options: Dict, operation: Optional[str] = None) -> Dict[str, Any]:
+    """The job's profile with the operation's overrides applied"""
+    settings = dict(ENCODER_PROFILES[profile_name(options)])
+    settings.update(OPERATION_OVERRIDES.get(operation, {}))
+    return settings
+
+
+def intermediate_codecs(options: Dict, codecs: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+    """``codecs`` with every encoder swapped for its lossless intermediate when the output feeds another stage"""
+    if not options.get('intermediate'):
+        return codecs
+    return {option: INTERMEDIATE_CODECS[option] if option in INTERMEDIATE_CODECS and codec not in ('copy', None)
+            else codec for option, codec in codecs.items()}
+
+
+def output_name(options: Dict, output_file: str) -> str:
+    """Output file name, in the intermediate container when the output feeds another stage"""
+    if not options.get('intermediate'):
+        return output_file
+    return os.path.splitext(output_file)[0] + INTERMEDIATE_EXTENSION
+
+
+def encoder_options(options: Dict, operation: str, codecs: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """ffmpeg output options for the encoders in ``codecs``; stream-copied streams get none"""
+    if codecs.get('vcodec') == INTERMEDIATE_CODECS['vcodec']:
+        return dict(INTERMEDIATE_VIDEO_OPTIONS)
+    settings = encoder_settings(options, operation)
+    output_options = {}
+    if codecs.get('vcodec') in X264_ENCODERS:
+        output_options['preset'] = settings['preset']
+        output_options['crf'] = settings['crf']
+        if settings.get('tune'):
+            output_options['tune'] = settings['tune']
+    if codecs.get('acodec') in LOSSY_AUDIO_ENCODERS and settings['audio_bitrate']:
+        output_options['b:a'] = settings['audio_bitrate']
+    return output_options
@@ -0,0 +1,469 @@
+import os
+import time
+import queue
+import shutil
+import signal
+import asyncio
+import logging
+import resource
+import threading
+import contextlib
+from collections import deque
+from typing import Dict, List, Any, Optional, Callable, Union, Collection
+
+import ffmpeg
+
+# Lines of ffmpeg stderr kept for error messages and analysis filter reports
+# (loudnorm prints about 15)
+STDERR_TAIL_LINES = 30
+
+# Seconds between SIGTERM and SIGKILL when stopping an encode
+KILL_GRACE_SECONDS = 5
+
+# Most ffmpeg processes running at once in this process, whichever task or
+# front started them (parallel segment and measurement commands included)
+MAX_FFMPEG_PROCESSES = int(os.environ.get('MAX_FFMPEG_PROCESSES', 0)) or max(2, os.cpu_count() or 1)
+
+# Longest stdout/stderr line read from ffmpeg
+STREAM_LINE_LIMIT = 1024 * 1024
+
+
+class FFmpegError(Exception):
+    """ffmpeg exited with a non-zero status"""
+
+    def __init__(self, returncode: int, stderr: str):
+        self.returncode = returncode
+        self.stderr = stderr
+        last_line = stderr.strip().splitlines()[-1] if stderr.strip() else 'no output'
+        super().__init__(f"ffmpeg exited with code {returncode}: {last_line}")
+
+
+def _broken_pipe(error: FFmpegError) -> bool:
+    """ffmpeg stopped because the process reading its output went away"""
+    return error.returncode == -signal.SIGPIPE or 'Broken pipe' in error.stderr
+
+
+class FFmpegTimeout(Exception):
+    """ffmpeg ran longer than its wall-clock budget and was killed"""
+
+
+class TaskCancelled(Exception):
+    """The task was cancelled; any running ffmpeg was killed"""
+
+
+class ExecutionLimits:
+    """Resource limits applied to every ffmpeg process.
+
+    By default a run may take ``timeout_factor`` times the duration of the
+    media it writes (at least ``min_timeout_seconds``, at most
+    ``max_timeout_seconds``), so a slow archive encode of a long video is
+    not cut off while a runaway one still is. Runs whose duration is not
+    known get ``default_timeout_seconds``. A fixed ``timeout_seconds`` and
+    the address-space cap are opt-in: 4K libx264 encodes routinely map
+    more than a few GB.
+    """
+
+    def __init__(self, timeout_seconds: Optional[float] = None, timeout_factor: Optional[float] = 30,
+                 min_timeout_seconds: float = 600, max_timeout_seconds: Optional[float] = 6 * 3600,
+                 default_timeout_seconds: Optional[float] = 3600, memory_limit_mb: Optional[int] = None,
+                 nice: int = 10, ionice: bool = True):
+        self.timeout_seconds = timeout_seconds or None  # 0/None = scale with the media duration
+        self.timeout_factor = timeout_factor or None  # 0/None = no duration-based timeout
+        self.min_timeout_seconds = min_timeout_seconds
+        self.max_timeout_seconds = max_timeout_seconds or None  # 0/None = no cap on the scaled timeout
+        self.default_timeout_seconds = default_timeout_seconds or None  # 0/None = unknown durations run unbounded
+        self.memory_limit_mb = memory_limit_mb or None  # 0/None = no address-space cap
+        self.nice = nice
+        self.ionice = ionice
+
+    @classmethod
+    def from_env(cls) -> 'ExecutionLimits':
+        """Limits from FFMPEG_TIMEOUT_SECONDS/_FACTOR, FFMPEG_MAX_/DEFAULT_TIMEOUT_SECONDS,
+        FFMPEG_MEMORY_LIMIT_MB, FFMPEG_NICE and FFMPEG_IONICE
+        """
+        return cls(
+            timeout_seconds=float(os.environ.get('FFMPEG_TIMEOUT_SECONDS', 0)),
+            timeout_factor=float(os.environ.get('FFMPEG_TIMEOUT_FACTOR', 30)),
+            max_timeout_seconds=float(os.environ.get('FFMPEG_MAX_TIMEOUT_SECONDS', 6 * 3600)),
+            default_timeout_seconds=float(os.environ.get('FFMPEG_DEFAULT_TIMEOUT_SECONDS', 3600)),
+            memory_limit_mb=int(os.environ.get('FFMPEG_MEMORY_LIMIT_MB', 0)),
+            nice=int(os.environ.get('FFMPEG_NICE', 10)),
+            ionice=os.environ.get('FFMPEG_IONICE', '1') not in ('0', 'false', 'no')
+        )
+
+    def timeout_for(self, duration: Optional[float]) -> Optional[float]:
+        """Wall-clock budget for a run writing ``duration`` seconds of media (None if unknown)"""
+        if self.timeout_seconds:
+            return self.timeout_seconds
+        if self.timeout_factor and duration:
+            timeout = max(self.min_timeout_seconds, duration * self.timeout_factor)
+            return min(timeout, self.max_timeout_seconds) if self.max_timeout_seconds else timeout
+        return self.default_timeout_seconds
+
+
+class ProgressParser:
+    """Incremental parser for the key=value blocks written by ``ffmpeg -progress``"""
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration
+        self.started = time.monotonic()
+        self._block = {}
+
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        """Consume one line; returns a progress snapshot at the end of each block"""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+        self._block[key] = value.strip()
+        if key != 'progress':
+            return None
+
+        block, self._block = self._block, {}
+        return self._snapshot(block)
+
+    def _snapshot(self, block: Dict[str, str]) -> Dict[str, Any]:
+        # out_time_ms is actually in microseconds; newer builds also write out_time_us
+        out_time_us = _to_float(block.get('out_time_us', block.get('out_time_ms')))
+        out_time = max(out_time_us / 1_000_000, 0.0) if out_time_us is not None else None
+        speed = _to_float(block.get('speed', '').rstrip('x'))
+        fps = _to_float(block.get('fps'))
+        finished = block.get('progress') == 'end'
+
+        percent = None
+        eta_seconds = None
+        if self.duration and out_time is not None:
+            percent = min(out_time / self.duration * 100, 100.0)
+            remaining = max(self.duration - out_time, 0.0)
+            if speed:
+                eta_seconds = remaining / speed
+            elif out_time > 0:
+                eta_seconds = (time.monotonic() - self.started) * remaining / out_time
+        if finished:
+            percent, eta_seconds = 100.0, 0.0
+
+        return {
+            'out_time': out_time,
+            'percent': percent,
+            'eta_seconds': eta_seconds,
+            'speed': speed,
+            'fps': fps,
+            'finished': finished
+        }
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def compile_command(command: Union[List[str], Any]) -> List[str]:
+    """Turn an ffmpeg-python stream graph or an argv list into an argv list"""
+    if isinstance(command, (list, tuple)):
+        return list(command)
+    # -y goes up front so the output file stays the last argument
+    args = ffmpeg.compile(command)
+    args.insert(1, '-y')
+    return args
+
+
+class FFmpegExecutor:
+    """Runs ffmpeg under resource limits and lets tasks cancel their processes.
+
+    Each ffmpeg gets its own process group (so ``cancel`` also stops any
+    children), a niceness and best-effort-low I/O priority, an address-space
+    rlimit, a ``-threads`` budget and a wall-clock timeout.
+
+    Processes are started with ``asyncio.create_subprocess_exec`` and driven
+    by one event loop on a daemon thread: progress is read from stdout,
+    stderr is drained, and timeouts and kills are timer callbacks, so a
+    running encode costs no thread of its own. Coroutines await
+    ``run_async`` / ``run_many_async`` from any event loop; worker threads
+    call ``run`` / ``run_many``, which block only the caller.
+    """
+
+    def __init__(self, limits: Optional[ExecutionLimits] = None, threads: Optional[int] = None,
+                 max_processes: Optional[int] = None):
+        self.limits = limits or ExecutionLimits.from_env()
+        self.threads = threads
+        self.max_processes = max_processes or MAX_FFMPEG_PROCESSES
+        self._processes = {}  # task_id -> set of running asyncio.subprocess.Process
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._ionice = shutil.which('ionice') if self.limits.ionice else None
+        self._loop = None
+        self._slots = None  # asyncio.Semaphore bounding processes across all tasks
+        self._loop_lock = threading.Lock()
+
+    def run(self, task_id: str, command: Union[List[str], Any], duration: Optional[float] = None,
+            on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Run ffmpeg with ``-progress pipe:1`` and report each progress block.
+
+        Blocks the calling thread, on which ``on_progress`` is called. Returns
+        the last lines ffmpeg wrote to stderr, where analysis filters such as
+        loudnorm print their results.
+        """
+        return self.run_many(task_id, [command], [duration], [on_progress])[0]
+
+    def run_many(self, task_id: str, commands: List[Union[List[str], Any]],
+                 durations: Optional[List[Optional[float]]] = None,
+                 progress_callbacks: Optional[List[Optional[Callable[[Dict[str, Any]], None]]]] = None,
+                 concurrency: Optional[int] = None, feeders: Collection[int] = ()) -> List[str]:
+        """Run several commands of one task at once (at most ``concurrency``) and wait for all.
+
+        Callbacks (one per command) are called on the calling thread, so they
+        may block without stalling the event loop. If a command fails the
+        others are killed. Returns each command's stderr tail, in order.
+        ``feeders`` are the indexes of commands that write into a pipe (FIFO)
+        another command reads; see ``run_piped``.
+        """
+        callbacks = progress_callbacks or [None] * len(commands)
+        updates = queue.SimpleQueue()  # (command index, snapshot), then None when all are done
+
+        def relay(index: int):
+            return lambda snapshot: updates.put((index, snapshot))
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_all(task_id, commands, durations or [None] * len(commands),
+                          [relay(index) if callback else None for index, callback in enumerate(callbacks)],
+                          concurrency, feeders),
+            self._engine_loop()
+        )
+        future.add_done_callback(lambda _: updates.put(None))
+        try:
+            while True:
+                update = updates.get()
+                if update is None:
+                    break
+                index, snapshot = update
+                callbacks[index](snapshot)
+        except BaseException:
+            # Cancelling the coroutine kills its processes
+            future.cancel()
+            raise
+        return future.result()
+
+    def run_piped(self, task_id: str, command: Union[List[str], Any], feeders: List[Union[List[str], Any]],
+                  duration: Optional[float] = None,
+                  on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Run ``command`` while ``feeders`` write the pipes (FIFOs) it reads.
+
+        A feeder runs under its reader's process slot, since it only makes
+        progress while the reader does, and gets the reader's time budget.
+        It may end on a broken pipe once the reader has all it needs (``-t``,
+        ``-shortest``); any other failure of either side kills the other, so
+        a reader never finishes on a truncated input. Returns ``command``'s
+        stderr tail.
+        """
+        count = len(feeders) + 1
+        return self.run_many(task_id, [command] + list(feeders), [duration] * count,
+                             [on_progress] + [None] * len(feeders), concurrency=count,
+                             feeders=range(1, count))[0]
+
+    async def run_async(self, task_id: str, command: Union[List[str], Any], duration: Optional[float] = None,
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Awaitable ``run`` for coroutines on any event loop.
+
+        ``on_progress`` is called on the caller's loop and must not block.
+        Cancelling the awaiting task kills the process.
+        """
+        return (await self.run_many_async(task_id, [command], [duration], [on_progress]))[0]
+
+    async def run_many_async(self, task_id: str, commands: List[Union[List[str], Any]],
+                             durations: Optional[List[Optional[float]]] = None,
+                             progress_callbacks: Optional[List[Optional[Callable[[Dict[str, Any]], None]]]] = None,
+                             concurrency: Optional[int] = None) -> List[str]:
+        """Awaitable ``run_many``; callbacks are called on the caller's loop"""
+        loop = asyncio.get_running_loop()
+        engine_loop = self._engine_loop()
+
+        def on_caller_loop(callback):
+            return lambda snapshot: loop.call_soon_threadsafe(callback, snapshot)
+
+        callbacks = progress_callbacks or [None] * len(commands)
+        coroutine = self._run_all(
+            task_id, commands, durations or [None] * len(commands),
+            [on_caller_loop(callback) if callback else None for callback in callbacks], concurrency
+        )
+        if loop is engine_loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, engine_loop))
+
+    def _engine_loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop every ffmpeg process is driven by, started on first use"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='ffmpeg-io')
+                thread.daemon = True
+                thread.start()
+                self._slots = asyncio.Semaphore(self.max_processes)
+                self._loop = loop
+            return self._loop
+
+    def _prepare(self, command: Union[List[str], Any]) -> List[str]:
+        args = compile_command(command)
+        args[1:1] = ['-hide_banner', '-nostats', '-progress', 'pipe:1']
+        if self.threads and '-threads' not in args:
+            # Encoder thread budget; placed right before the output file
+            args[-1:-1] = ['-threads', str(self.threads)]
+        if self._ionice:
+            args = [self._ionice, '-c', '2', '-n', '7'] + args
+        return args
+
+    async def _run_all(self, task_id: str, commands: List, durations: List[Optional[float]],
+                       callbacks: List[Optional[Callable]], concurrency: Optional[int],
+                       feeders: Collection[int] = ()) -> List[str]:
+        """Run on the engine loop: every command of a task, at most ``concurrency`` at a time"""
+        limit = asyncio.Semaphore(concurrency or len(commands))
+
+        async def run_one(index: int) -> str:
+            async with limit:
+                try:
+                    return await self._run(task_id, self._prepare(commands[index]), durations[index],
+                                           callbacks[index], use_slot=index not in feeders)
+                except FFmpegError as e:
+                    if index in feeders and _broken_pipe(e):
+                        return e.stderr
+                    raise
+
+        tasks = [asyncio.ensure_future(run_one(index)) for index in range(len(commands))]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            # Let every process be killed and reaped before reporting
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _run(self, task_id: str, args: List[str], duration: Optional[float],
+                   on_progress: Optional[Callable[[Dict[str, Any]], None]], use_slot: bool = True) -> str:
+        """Run one ffmpeg on the engine loop"""
+        async with (self._slots if use_slot else contextlib.nullcontext()):
+            if self.is_cancelled(task_id):
+                raise TaskCancelled(f"Task {task_id} was cancelled")
+            process = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE, start_new_session=True, limit=STREAM_LINE_LIMIT
+            )
+            self._apply_limits(process.pid)
+            with self._lock:
+                self._processes.setdefault(task_id, set()).add(process)
+                # cancel() may have run while the process was starting
+                cancelled = task_id in self._cancelled
+            if cancelled:
+                self._kill(process)
+
+            # Drain stderr alongside so a chatty encoder cannot fill the pipe and stall
+            stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+            stderr_reader = asyncio.ensure_future(self._drain(process.stderr, stderr_tail))
+
+            timed_out = False
+            watchdog = None
+            timeout = self.limits.timeout_for(duration)
+            if timeout:
+                def expire():
+                    nonlocal timed_out
+                    timed_out = True
+                    self._kill(process)
+                watchdog = asyncio.get_running_loop().call_later(timeout, expire)
+
+            try:
+                parser = ProgressParser(duration)
+                async for line in process.stdout:
+                    snapshot = parser.feed(line.decode(errors='replace'))
+                    if snapshot and on_progress:
+                        on_progress(snapshot)
+
+                await stderr_reader
+                returncode = await process.wait()
+            except BaseException:
+                self._kill(process)
+                stderr_reader.cancel()
+                raise
+            finally:
+                if watchdog:
+                    watchdog.cancel()
+                with self._lock:
+                    running = self._processes.get(task_id, set())
+                    running.discard(process)
+                    if not running:
+                        self._processes.pop(task_id, None)
+                    cancelled = task_id in self._cancelled
+
+        if cancelled:
+            raise TaskCancelled(f"Task {task_id} was cancelled")
+        if timed_out:
+            raise FFmpegTimeout(f"ffmpeg exceeded the {timeout:g}s time limit")
+        if returncode != 0:
+            raise FFmpegError(returncode, ''.join(stderr_tail))
+        return ''.join(stderr_tail)
+
+    @staticmethod
+    async def _drain(stream: asyncio.StreamReader, tail: deque):
+        async for line in stream:
+            tail.append(line.decode(errors='replace'))
+
+    def cancel(self, task_id: str) -> bool:
+        """Mark a task cancelled and kill its running ffmpeg, if any"""
+        with self._lock:
+            self._cancelled.add(task_id)
+            processes = list(self._processes.get(task_id, ()))
+        for process in processes:
+            self._loop.call_soon_threadsafe(self._kill, process)
+        return bool(processes)
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self._lock:
+            return task_id in self._cancelled
+
+    def release(self, task_id: str):
+        """Forget a finished task's cancellation flag"""
+        with self._lock:
+            self._cancelled.discard(task_id)
+
+    def kill_all(self):
+        """SIGKILL every running ffmpeg group without marking tasks cancelled (process shutdown)"""
+        with self._lock:
+            processes = [process for running in self._processes.values() for process in running]
+        for process in processes:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _apply_limits(self, pid: int):
+        """Lower a just-started ffmpeg's priority and cap its address space.
+
+        Set from the parent: a preexec_fn can deadlock the child of a process
+        running this many threads, and ffmpeg has barely started by now.
+        """
+        try:
+            if self.limits.nice:
+                niceness = min(os.getpriority(os.PRIO_PROCESS, pid) + self.limits.nice, 19)
+                os.setpriority(os.PRIO_PROCESS, pid, niceness)
+            if self.limits.memory_limit_mb:
+                limit = self.limits.memory_limit_mb * 1024 * 1024
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        except ProcessLookupError:
+            # Already exited; its status is read as usual
+            pass
+
+    def _kill(self, process: asyncio.subprocess.Process):
+        """SIGTERM the process group, then SIGKILL it if it does not exit in time (engine loop only)"""
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+
+        def force_kill():
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                logging.warning(f"ffmpeg process {process.pid} did not stop on SIGTERM, killed")
+
+        asyncio.get_running_loop().call_later(KILL_GRACE_SECONDS, force_kill)
@@ -1,15 +1,26 @@
 import os
+import json
 import uuid
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
 from typing import List, Dict, Optional
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from werkzeug.utils import secure_filename
-from processing import ProcessingManager
+from processing import get_manager, TERMINAL_STATUSES, expand_batch
+from resumable import ResumableUploadStore, ResumableUploadError
+from content_store import store_upload
+from probe import try_probe_summary
+from downloads import media_type, file_etag, last_modified, is_not_modified, offload_headers, resolve_output_path
+from streaming import STREAM_FILES, stream_url, stream_file_path, tail_file, cleanup_streams
+from peaks import PEAKS_SUFFIX, PeaksUnavailable, ensure_peaks, schedule_peaks, peaks_response
+from previews import load_previews, cleanup_previews
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -23,13 +34,26 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Templates
 templates = Jinja2Templates(directory="templates")
 
-# Initialize processing manager
-processing_manager = ProcessingManager()
-
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB, bounds memory held per upload
+STATUS_KEEPALIVE_SECONDS = 15
+STATUS_SYNC_SECONDS = 2  # re-read interval for watched tasks on a shared state backend
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', 0)) or None  # None = half the CPU cores
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 0)) or None  # None = 5GB
+RUN_ENCODE_WORKERS = os.environ.get('RUN_ENCODE_WORKERS', '1') not in ('0', 'false', 'no')
+
+# The process's shared processing manager; its first use picks up work left over from a previous run
+processing_manager = get_manager(
+    max_workers=MAX_CONCURRENT_JOBS,
+    cache_max_bytes=RESULT_CACHE_MAX_BYTES,
+    run_workers=RUN_ENCODE_WORKERS
+)
+
+# Resumable (chunked) upload sessions
+resumable_uploads = ResumableUploadStore(UPLOAD_FOLDER, MAX_FILE_SIZE)
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -47,6 +71,18 @@ class ProcessRequest(BaseModel):
     operation: str
     files: List[Dict]
     options: Dict = {}
+    priority: int = 0
+
+class BatchRequest(BaseModel):
+    files: List[Dict]
+    jobs: List[Dict]
+    options: Dict = {}
+    priority: int = 0
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    file_type: str = 'unknown'
 
 class StatusResponse(BaseModel):
     status: str
@@ -67,6 +103,73 @@ def generate_unique_filename(original_filename: str) -> str:
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"{name}_{timestamp}_{unique_id}{ext}"
 
+def detect_file_type(filename: str, file_type: str) -> str:
+    """Resolve an 'unknown' file type from the file extension"""
+    if file_type in ALLOWED_EXTENSIONS:
+        return file_type
+    ext = filename.rsplit('.', 1)[-1].lower()
+    for ftype, extensions in ALLOWED_EXTENSIONS.items():
+        if ext in extensions:
+            return ftype
+    return 'unknown'
+
+def upload_session_response(session: Dict, status_code: int = 200) -> JSONResponse:
+    """JSON body plus tus-style offset headers for an upload session"""
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "success": True,
+            "upload_id": session['upload_id'],
+            "offset": session['offset'],
+            "length": session['length']
+        },
+        headers={
+            "Upload-Offset": str(session['offset']),
+            "Upload-Length": str(session['length']),
+            "Cache-Control": "no-store"
+        }
+    )
+
+def upload_error_response(error: ResumableUploadError) -> JSONResponse:
+    """JSON error for upload session failures (bypasses the HTML 404 page)"""
+    return JSONResponse(status_code=error.status_code, content={"success": False, "error": str(error)})
+
+async def save_upload(upload_file: UploadFile, file_path: str) -> Dict:
+    """Copy an upload to disk chunk by chunk, hashing it and enforcing the size limit.
+
+    Starlette has already spooled the whole multipart body to a temporary
+    file before the endpoint runs, so the limit stops the copy, not the
+    transfer; clients sending large files should use the resumable upload
+    endpoints, which check the size as chunks arrive.
+
+    Returns the byte count and SHA-256 of the content. A partial file is
+    removed if the upload turns out to be too large or fails.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    
+    def write_chunk(out, chunk: bytes):
+        hasher.update(chunk)
+        out.write(chunk)
+    
+    out = await run_in_threadpool(open, file_path, 'wb')
+    try:
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                raise HTTPException(status_code=413, detail="File too large. Maximum size is 500MB.")
+            await run_in_threadpool(write_chunk, out, chunk)
+    except BaseException:
+        await run_in_threadpool(out.close)
+        os.remove(file_path)
+        raise
+    await run_in_threadpool(out.close)
+    
+    return {'size': size, 'sha256': hasher.hexdigest()}
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Main page with upload forms and processing options"""
@@ -91,37 +194,37 @@ async def upload_files(
             (file or [], 'unknown')
         ]
         
-        for files, file_type in file_groups:
+        for files, group_type in file_groups:
             for upload_file in files:
                 if upload_file and upload_file.filename:
-                    # Check file size
-                    content = await upload_file.read()
-                    if len(content) > MAX_FILE_SIZE:
-                        raise HTTPException(status_code=413, detail="File too large. Maximum size is 500MB.")
-                    
                     # Determine actual file type if unknown
-                    if file_type == 'unknown':
-                        ext = upload_file.filename.rsplit('.', 1)[-1].lower()
-                        for ftype, extensions in ALLOWED_EXTENSIONS.items():
-                            if ext in extensions:
-                                file_type = ftype
-                                break
+                    file_type = detect_file_type(upload_file.filename, group_type)
                     
                     if not allowed_file(upload_file.filename, file_type):
                         raise HTTPException(status_code=400, detail=f"File type not allowed for {upload_file.filename}")
                     
-                    filename = generate_unique_filename(upload_file.filename)
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)
+                    temp_path = os.path.join(UPLOAD_FOLDER, generate_unique_filename(upload_file.filename))
                     
-                    # Write file
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
+                    # Stream to disk; size limit is checked per chunk
+                    saved = await save_upload(upload_file, temp_path)
+                    
+                    # Identical content is stored once, under its hash
+                    filename = await run_in_threadpool(
+                        store_upload, temp_path, UPLOAD_FOLDER, saved['sha256'], upload_file.filename
+                    )
+                    if file_type == 'audio':
+                        schedule_peaks(os.path.join(UPLOAD_FOLDER, filename))
                     
                     uploaded_files.append({
                         'original_name': upload_file.filename,
                         'saved_name': filename,
                         'file_type': file_type,
-                        'size': len(content)
+                        'size': saved['size'],
+                        'sha256': saved['sha256'],
+                        # Probing now also warms the probe cache for /process
+                        'metadata': await run_in_threadpool(
+                            try_probe_summary, os.path.join(UPLOAD_FOLDER, filename)
+                        )
                     })
         
         return {"success": True, "files": uploaded_files}
@@ -132,6 +235,75 @@ async def upload_files(
         logging.error(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@app.post("/uploads")
+async def create_upload_session(request: UploadSessionRequest):
+    """Start a resumable upload"""
+    try:
+        file_type = detect_file_type(request.filename, request.file_type)
+        if not allowed_file(request.filename, file_type):
+            raise HTTPException(status_code=400, detail=f"File type not allowed for {request.filename}")
+        
+        session = await run_in_threadpool(resumable_uploads.create, request.filename, file_type, request.size)
+        return upload_session_response(session, 201)
+    
+    except ResumableUploadError as e:
+        return upload_error_response(e)
+
+@app.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"])
+async def get_upload_session(upload_id: str):
+    """Current offset of a resumable upload"""
+    try:
+        session = await run_in_threadpool(resumable_uploads.get, upload_id)
+        return upload_session_response(session)
+    except ResumableUploadError as e:
+        return upload_error_response(e)
+
+@app.api_route("/uploads/{upload_id}", methods=["PUT", "PATCH"])
+async def upload_chunk(upload_id: str, request: Request):
+    """Append the request body at the byte given by the Upload-Offset header"""
+    try:
+        offset = request.headers.get('Upload-Offset')
+        offset = int(offset) if offset is not None and offset.isdigit() else None
+        writer = await run_in_threadpool(resumable_uploads.open_chunk, upload_id, offset)
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    await run_in_threadpool(writer.write, chunk)
+        finally:
+            await run_in_threadpool(writer.close)
+        
+        session = await run_in_threadpool(resumable_uploads.get, upload_id)
+        return upload_session_response(session)
+    
+    except ResumableUploadError as e:
+        return upload_error_response(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Chunk upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Chunk upload failed: {str(e)}")
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str):
+    """Finish a resumable upload and return the same file record as /upload"""
+    try:
+        session = await run_in_threadpool(resumable_uploads.get, upload_id)
+        file_record = await run_in_threadpool(
+            resumable_uploads.complete, upload_id, generate_unique_filename(session['original_name'])
+        )
+        file_record['saved_name'] = await run_in_threadpool(
+            store_upload, os.path.join(UPLOAD_FOLDER, file_record['saved_name']),
+            UPLOAD_FOLDER, file_record['sha256'], file_record['original_name']
+        )
+        upload_path = os.path.join(UPLOAD_FOLDER, file_record['saved_name'])
+        file_record['metadata'] = await run_in_threadpool(try_probe_summary, upload_path)
+        if file_record['file_type'] == 'audio':
+            schedule_peaks(upload_path)
+        return {"success": True, "files": [file_record]}
+    
+    except ResumableUploadError as e:
+        return upload_error_response(e)
+
 @app.post("/process")
 async def process_files(request: ProcessRequest):
     """Process files based on operation type"""
@@ -142,18 +314,23 @@ async def process_files(request: ProcessRequest):
         # Generate unique task ID
         task_id = str(uuid.uuid4())
         
-        # Start processing in background
-        result = processing_manager.process_files(
+        # Queueing writes to the state backend and may copy a cached result, so keep it off the event loop
+        result = await run_in_threadpool(
+            processing_manager.process_files,
             task_id=task_id,
             operation=request.operation,
             files=request.files,
             options=request.options,
             upload_folder=UPLOAD_FOLDER,
-            output_folder=OUTPUT_FOLDER
+            output_folder=OUTPUT_FOLDER,
+            priority=request.priority
         )
         
         if result['success']:
-            return {"success": True, "task_id": task_id, "message": "Processing started"}
+            response = {"success": True, "task_id": task_id, "message": "Processing queued"}
+            if request.options.get('streaming') in STREAM_FILES:
+                response['stream_url'] = stream_url(task_id, request.options['streaming'])
+            return response
         else:
             raise HTTPException(status_code=400, detail=result['error'])
     
@@ -163,28 +340,202 @@ async def process_files(request: ProcessRequest):
         logging.error(f"Processing error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
+@app.post("/batch")
+async def process_batch(request: BatchRequest):
+    """Queue many operations over a shared set of uploaded files in one request"""
+    try:
+        try:
+            jobs = expand_batch(request.files, request.jobs, request.options)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        batch_id = str(uuid.uuid4())
+        for job in jobs:
+            job['task_id'] = str(uuid.uuid4())
+        
+        # Task rows for the whole batch are written in one transaction by the scheduler
+        result = await run_in_threadpool(
+            processing_manager.process_batch,
+            batch_id=batch_id,
+            jobs=jobs,
+            upload_folder=UPLOAD_FOLDER,
+            output_folder=OUTPUT_FOLDER,
+            priority=request.priority
+        )
+        
+        if result['success']:
+            return {
+                "success": True,
+                "batch_id": batch_id,
+                "task_ids": result['task_ids'],
+                "message": f"{len(jobs)} jobs queued"
+            }
+        else:
+            raise HTTPException(status_code=400, detail=result['error'])
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Batch error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch failed: {str(e)}")
+
+@app.get("/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Aggregate progress and per-task results for a batch"""
+    try:
+        return await run_in_threadpool(processing_manager.get_batch_status, batch_id)
+    except Exception as e:
+        logging.error(f"Batch status error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch status check failed: {str(e)}")
+
 @app.get("/status/{task_id}")
 async def get_status(task_id: str):
     """Get processing status for a task"""
     try:
-        status = processing_manager.get_status(task_id)
+        status = await run_in_threadpool(processing_manager.get_status, task_id)
         return status
     except Exception as e:
         logging.error(f"Status check error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Status check failed: {str(e)}")
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Download processed file"""
+@app.post("/cancel/{task_id}")
+async def cancel_task(task_id: str):
+    """Cancel a queued or running task"""
     try:
-        file_path = os.path.join(OUTPUT_FOLDER, filename)
-        if not os.path.exists(file_path):
+        result = await run_in_threadpool(processing_manager.cancel_task, task_id)
+        if result['success']:
+            return result
+        status_code = 404 if result['error'] == 'Task not found' else 409
+        return JSONResponse(status_code=status_code, content=result)
+    except Exception as e:
+        logging.error(f"Cancel error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Cancel failed: {str(e)}")
+
+_status_sync = None  # asyncio task re-reading watched tasks from a shared state backend
+
+async def sync_shared_status():
+    """Re-read every watched task once per interval and publish what changed.
+    
+    Updates made by other processes never reach this process's hub, so on a
+    shared backend one batched read serves all of a task's watchers, however
+    many there are, instead of each stream polling on its own.
+    """
+    known = {}  # task_id -> status last read
+    hub = processing_manager.hub
+    while True:
+        await asyncio.sleep(STATUS_SYNC_SECONDS)
+        task_ids = hub.subscribed_tasks()
+        known = {task_id: known[task_id] for task_id in task_ids if task_id in known}
+        if not task_ids:
+            continue
+        try:
+            latest = await run_in_threadpool(processing_manager.state.get_tasks, task_ids)
+        except Exception as e:
+            logging.error(f"Status sync failed: {str(e)}")
+            continue
+        for task_id, status in zip(task_ids, latest):
+            if status is None:
+                continue
+            previous = known.get(task_id, {})
+            known[task_id] = status
+            delta = {key: value for key, value in status.items() if previous.get(key) != value}
+            if delta:
+                # Watchers diff against what they have already sent, so repeats are dropped there
+                hub.publish(task_id, delta)
+
+def ensure_status_sync():
+    global _status_sync
+    if processing_manager.state.shared and (_status_sync is None or _status_sync.done()):
+        _status_sync = asyncio.ensure_future(sync_shared_status())
+
+async def status_updates(task_id: str):
+    """Yield the task's current status, then each change until it finishes"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # Takes the manager lock and reads the state backend, so keep it off the loop
+    snapshot, unsubscribe = await run_in_threadpool(
+        processing_manager.subscribe, task_id, lambda delta: loop.call_soon_threadsafe(queue.put_nowait, delta)
+    )
+    try:
+        yield 'status', snapshot
+        if snapshot['status'] in TERMINAL_STATUSES or snapshot['status'] == 'not_found':
+            return
+        
+        ensure_status_sync()
+        current = dict(snapshot)
+        while True:
+            try:
+                update = await asyncio.wait_for(queue.get(), timeout=STATUS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield 'keepalive', None
+                continue
+            delta = {key: value for key, value in update.items() if current.get(key) != value}
+            if not delta:
+                continue
+            current.update(delta)
+            yield 'delta', delta
+            if delta.get('status') in TERMINAL_STATUSES:
+                return
+    finally:
+        unsubscribe()
+
+@app.get("/events/{task_id}")
+async def stream_status(task_id: str):
+    """Server-Sent Events stream of status changes for a task"""
+    async def event_stream():
+        async for event, data in status_updates(task_id):
+            if event == 'keepalive':
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/status/{task_id}")
+async def websocket_status(websocket: WebSocket, task_id: str):
+    """WebSocket stream of status changes for a task"""
+    await websocket.accept()
+    try:
+        async for event, data in status_updates(task_id):
+            # Keepalives also surface a vanished client on the next send
+            await websocket.send_json({"event": event, "data": data})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@app.api_route("/download/{filename:path}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request, inline: bool = False):
+    """Download processed file; ?inline=1 plays it in the browser instead.
+
+    Supports Range requests (206), If-Range and ETag/Last-Modified conditional
+    GETs; with DOWNLOAD_OFFLOAD the front-end server sends the file.
+    """
+    try:
+        file_path = resolve_output_path(OUTPUT_FOLDER, filename)
+        if not file_path or not os.path.isfile(file_path):
             raise HTTPException(status_code=404, detail="File not found")
         
+        offload = offload_headers(filename, file_path, inline)
+        if offload:
+            return Response(status_code=200, headers=offload)
+        
+        stat = os.stat(file_path)
+        validators = {'ETag': file_etag(stat), 'Last-Modified': last_modified(stat)}
+        if is_not_modified(request.headers, validators['ETag'], stat):
+            return Response(status_code=304, headers=validators)
+        
+        # FileResponse answers Range/If-Range itself and uses pathsend when the server offers it
         return FileResponse(
             path=file_path,
-            filename=filename,
-            media_type='application/octet-stream'
+            filename=os.path.basename(filename),
+            media_type=media_type(filename),
+            headers=validators,
+            stat_result=stat,
+            content_disposition_type='inline' if inline else 'attachment'
         )
     except HTTPException:
         raise
@@ -192,6 +543,68 @@ async def download_file(filename: str):
         logging.error(f"Download error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
+@app.get("/previews/{task_id}")
+async def get_previews(task_id: str):
+    """Thumbnails and the scrub sprite sheet (with its WebVTT index) of a finished video job"""
+    previews = await run_in_threadpool(load_previews, OUTPUT_FOLDER, task_id)
+    if previews is None:
+        raise HTTPException(status_code=404, detail="No previews for this task")
+    return {"success": True, **previews}
+
+@app.get("/peaks/{filename:path}")
+async def get_peaks(filename: str, level: Optional[int] = None, start: Optional[float] = None,
+                    end: Optional[float] = None, format: str = 'json'):
+    """Waveform min/max/RMS points, loudness and silent regions of an uploaded audio file.
+
+    ``level`` 0 is the finest zoom; ``start``/``end`` are in seconds;
+    ``format=binary`` returns the whole sidecar for clients that read it themselves.
+    """
+    try:
+        file_path = resolve_output_path(UPLOAD_FOLDER, filename)
+        if not file_path or not os.path.isfile(file_path) or file_path.endswith(PEAKS_SUFFIX):
+            raise HTTPException(status_code=404, detail="File not found")
+        sidecar = await run_in_threadpool(ensure_peaks, file_path)
+        if format == 'binary':
+            return FileResponse(sidecar, media_type='application/octet-stream')
+        response = await run_in_threadpool(peaks_response, sidecar, level, start, end)
+        return {"success": True, **response}
+    except HTTPException:
+        raise
+    except PeaksUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Peaks error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Peaks failed: {str(e)}")
+
+@app.api_route("/stream/{task_id}/{name}", methods=["GET", "HEAD"])
+async def stream_file(task_id: str, name: str, request: Request):
+    """Serve a streaming job's output (fMP4 or HLS playlist/segments) while it is encoded"""
+    file_path = stream_file_path(OUTPUT_FOLDER, task_id, name)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    status = await run_in_threadpool(processing_manager.get_status, task_id)
+    if not os.path.isfile(file_path):
+        # Finished from the result cache: the output lives in another task's folder
+        if status['status'] == 'completed' and status.get('output_file'):
+            return RedirectResponse(f"/download/{os.path.dirname(status['output_file'])}/{name}?inline=1")
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    def is_running():
+        return processing_manager.get_status(task_id)['status'] not in TERMINAL_STATUSES + ('not_found',)
+    
+    running = status['status'] not in TERMINAL_STATUSES + ('not_found',)
+    if name.endswith('.mp4') and running and 'range' not in request.headers:
+        # Growing fragmented MP4: keep sending data until the encode finishes
+        return StreamingResponse(tail_file(file_path, is_running), media_type=media_type(name),
+                                 headers={"Cache-Control": "no-cache"})
+    
+    # The playlist grows while the job runs; segments are complete once listed
+    headers = {"Cache-Control": "no-cache"} if name.endswith('.m3u8') else None
+    return FileResponse(file_path, media_type=media_type(name), headers=headers)
+
 @app.post("/cleanup")
 async def cleanup_files():
     """Clean up uploaded and output files"""
@@ -209,6 +622,11 @@ async def cleanup_files():
                     if file_age > 3600:  # 1 hour
                         os.remove(file_path)
         
+        # Abandoned resumable uploads, old streaming outputs and previews
+        resumable_uploads.cleanup(3600)
+        cleanup_streams(OUTPUT_FOLDER, 3600)
+        cleanup_previews(OUTPUT_FOLDER, 3600)
+        
         return {"success": True, "message": "Cleanup completed"}
     
     except Exception as e:
@@ -0,0 +1,158 @@
+import os
+import json
+from typing import Dict, List, Optional
+
+import ffmpeg
+
+from probe import ProbeCache
+
+# Every track is brought to this format before mixing or concatenation
+MIX_SAMPLE_RATE = 48000
+MIX_CHANNEL_LAYOUT = 'stereo'
+
+# Most inputs one amix takes; bigger mixes become a tree of sub-mixes, each
+# its own ffmpeg process, so memory stays bounded and sub-mixes run in parallel
+MIX_FANIN = 8
+
+# Sub-mix / measurement processes run at once for one job
+MIX_PARALLELISM = int(os.environ.get('MIX_PARALLELISM', 0)) or max(2, (os.cpu_count() or 1) // 2)
+
+# Sub-mixes are kept as 32-bit float so summing levels never clips or requantizes
+SUBMIX_CODEC = 'pcm_f32le'
+
+DURATION_POLICIES = ('longest', 'shortest', 'first')
+
+# EBU R128 targets used when options['loudnorm'] is true
+LOUDNORM_DEFAULTS = {'I': -16.0, 'TP': -1.5, 'LRA': 11.0}
+
+# Measurement pass results keyed by file version and targets
+_measurements = ProbeCache()
+
+
+def loudnorm_targets(options: Dict) -> Optional[Dict[str, float]]:
+    """Integrated loudness, true peak and range targets, or None when normalization is off"""
+    requested = options.get('loudnorm')
+    if not requested:
+        return None
+    targets = dict(LOUDNORM_DEFAULTS)
+    if isinstance(requested, dict):
+        unknown = set(requested) - set(LOUDNORM_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown loudnorm settings: {', '.join(sorted(unknown))}")
+        targets.update({key: float(value) for key, value in requested.items()})
+    return targets
+
+
+def track_settings(options: Dict, count: int) -> List[Dict[str, float]]:
+    """Per-track gain (dB) and start offset (seconds) from options['tracks'], in file order"""
+    tracks = options.get('tracks') or []
+    if len(tracks) > count:
+        raise ValueError(f"{len(tracks)} track settings given for {count} tracks")
+    settings = []
+    for number in range(count):
+        track = tracks[number] if number < len(tracks) else {}
+        offset = float(track.get('offset') or 0)
+        if offset < 0:
+            raise ValueError(f"Track {number + 1}: offset must not be negative")
+        settings.append({'gain_db': float(track.get('gain_db') or 0), 'offset': offset})
+    return settings
+
+
+def duration_policy(options: Dict) -> str:
+    policy = options.get('duration_policy', 'longest')
+    if policy not in DURATION_POLICIES:
+        raise ValueError(f"duration_policy must be one of {', '.join(DURATION_POLICIES)}")
+    return policy
+
+
+def mix_duration(ends: List[float], policy: str) -> float:
+    """Length of the mix from each track's end time (offset + duration)"""
+    if policy == 'shortest':
+        return min(ends)
+    if policy == 'first':
+        return ends[0]
+    return max(ends)
+
+
+def _measurement_key(path: str, targets: Dict[str, float]):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, tuple(sorted(targets.items())))
+
+
+def cached_measurement(path: str, targets: Dict[str, float]) -> Optional[Dict[str, str]]:
+    return _measurements.get(_measurement_key(path, targets))
+
+
+def store_measurement(path: str, targets: Dict[str, float], measurement: Dict[str, str]):
+    _measurements.put(_measurement_key(path, targets), measurement)
+
+
+def _loudnorm_args(targets: Dict[str, float]) -> str:
+    return ':'.join(f'{key}={value:g}' for key, value in targets.items())
+
+
+def measure_command(path: str, targets: Dict[str, float]) -> List[str]:
+    """First loudnorm pass: analyse only, printing the measurement as JSON"""
+    return [
+        'ffmpeg', '-y', '-i', path, '-map', '0:a:0',
+        '-af', f'loudnorm={_loudnorm_args(targets)}:print_format=json',
+        '-f', 'null', '-'
+    ]
+
+
+def parse_measurement(stderr: str) -> Dict[str, str]:
+    """The JSON block loudnorm prints at the end of the first pass"""
+    start, end = stderr.rfind('{'), stderr.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError("loudnorm did not report a measurement")
+    return json.loads(stderr[start:end + 1])
+
+
+def track_stream(path: str, settings: Optional[Dict[str, float]] = None,
+                 targets: Optional[Dict[str, float]] = None, measurement: Optional[Dict[str, str]] = None):
+    """A track's audio, normalized, converted to the mix format, gained and offset"""
+    stream = ffmpeg.input(path).audio
+    if targets and measurement:
+        # Second pass: linear gain from the measurement instead of dynamic compression
+        stream = stream.filter(
+            'loudnorm', **targets, linear='true',
+            measured_I=measurement['input_i'], measured_TP=measurement['input_tp'],
+            measured_LRA=measurement['input_lra'], measured_thresh=measurement['input_thresh'],
+            offset=measurement['target_offset']
+        )
+    # loudnorm resamples to 192 kHz internally, so convert afterwards
+    stream = stream.filter('aresample', MIX_SAMPLE_RATE).filter(
+        'aformat', sample_fmts='fltp', channel_layouts=MIX_CHANNEL_LAYOUT
+    )
+    if settings and settings['gain_db']:
+        stream = stream.filter('volume', f"{settings['gain_db']:g}dB")
+    if settings and settings['offset']:
+        stream = stream.filter('adelay', delays=int(settings['offset'] * 1000), all=1)
+    return stream
+
+
+def mix_streams(streams: List):
+    """Sum streams at unity gain; amix would otherwise scale each input by 1/N"""
+    return ffmpeg.filter(streams, 'amix', inputs=len(streams), duration='longest',
+                         dropout_transition=0, normalize=0)
+
+
+def measured_mix_command(stream, path: str, targets: Dict[str, float], duration: Optional[float] = None):
+    """Render a mix to ``path`` while running the first loudnorm pass over it.
+
+    Tracks normalized one by one add up: N loudness-matched stems sum to
+    about 10*log10(N) dB over the target, with peaks past full scale, so
+    the mix itself is measured and normalized. The float render cannot clip.
+    """
+    trim = {'t': duration} if duration else {}
+    split = stream.filter_multi_output('asplit', 2)
+    measured = split[1].filter('loudnorm', **targets, print_format='json')
+    return ffmpeg.merge_outputs(
+        ffmpeg.output(split[0], path, acodec=SUBMIX_CODEC, **trim),
+        ffmpeg.output(measured, '-', format='null', **trim)
+    )
+
+
+def submix_groups(count: int) -> List[range]:
+    """Split ``count`` inputs into consecutive groups of at most MIX_FANIN"""
+    return [range(start, min(start + MIX_FANIN, count)) for start in range(0, count, MIX_FANIN)]
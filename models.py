@@ -1,6 +1,7 @@
 import os
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import DeclarativeBase
 
 
@@ -20,11 +21,23 @@ class ProcessingTask(db.Model):
     operation = db.Column(db.String(50), nullable=False)
     status = db.Column(db.String(20), nullable=False, default='pending')
     progress = db.Column(db.Integer, default=0)
+    eta_seconds = db.Column(db.Float)
+    encode_speed = db.Column(db.Float)  # ffmpeg speed, multiple of realtime
+    priority = db.Column(db.Integer, default=0)
+    batch_id = db.Column(db.String(36), index=True)  # set for tasks submitted through /batch
+    job_payload = db.Column(db.Text)  # JSON job arguments used to re-queue after a restart
+    cancel_requested = db.Column(db.Boolean)  # set by whichever process receives /cancel
+    # Lease held by the worker running the task; expired leases are re-queued
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime, index=True)
+    attempts = db.Column(db.Integer)  # times a worker has claimed the job
     message = db.Column(db.Text)
     output_file = db.Column(db.String(255))
+    outputs = db.Column(db.Text)  # JSON list of per-target results when a job writes several files
     error_message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
     
     # Relationship to uploaded files
@@ -45,6 +58,17 @@ class UploadedFile(db.Model):
     file_type = db.Column(db.String(20), nullable=False)
     file_size = db.Column(db.BigInteger)
     upload_path = db.Column(db.String(500))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256; identical uploads share one blob
+    # Media metadata from a single ffprobe run
+    duration = db.Column(db.Float)
+    format_name = db.Column(db.String(100))
+    video_codec = db.Column(db.String(32))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    audio_codec = db.Column(db.String(32))
+    sample_rate = db.Column(db.Integer)
+    channels = db.Column(db.Integer)
+    probe_json = db.Column(db.Text)  # full ffprobe streams/format output
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -66,4 +90,40 @@ class ProcessingHistory(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<ProcessingHistory {self.task_id}: {self.operation}>'
\ No newline at end of file
+        return f'<ProcessingHistory {self.task_id}: {self.operation}>'
+
+
+class CachedResult(db.Model):
+    """Model mapping a job (operation, input hashes, options) to its finished output"""
+    __tablename__ = 'cached_results'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    output_file = db.Column(db.String(255), nullable=False)
+    task_id = db.Column(db.String(36))  # task that produced it; its previews are copied to cache hits
+    size_bytes = db.Column(db.BigInteger)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<CachedResult {self.cache_key[:12]}: {self.output_file}>'
+
+
+def sync_schema():
+    """Add columns introduced after a table was first created.
+
+    ``db.create_all()`` never alters existing tables, so databases created by
+    an older version would be missing newer nullable columns.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
@@ -0,0 +1,337 @@
+# Waveform peaks, loudness and silence for uploaded audio. Decoded mono PCM
+# is streamed from ffmpeg in fixed-size chunks and reduced with NumPy, so
+# memory use does not grow with the file. Results go to a <upload>.peaks
+# sidecar: a JSON header, then one little-endian int16 (points, 3) array of
+# min/max/rms per zoom level, which readers memory-map.
+import os
+import json
+import struct
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Any, Optional, Tuple
+
+import ffmpeg
+
+PEAKS_SUFFIX = '.peaks'
+PEAKS_MAGIC = b'AVFPEAK1'
+
+# Analysis runs on a mono downmix at this rate
+PEAKS_SAMPLE_RATE = 22050
+
+# Zoom levels: samples per point at the finest level, and the step between levels
+BASE_SAMPLES_PER_POINT = 256
+ZOOM_FACTOR = 4
+ZOOM_LEVELS = 4  # 256, 1024, 4096 and 16384 samples per point
+
+# Finest-level points decoded per read (1 MiB of float32 samples)
+CHUNK_POINTS = 1024
+
+# Silence: finest-level RMS below the threshold for at least the minimum length
+SILENCE_THRESHOLD_DB = -50.0
+SILENCE_MIN_SECONDS = 0.5
+
+# Default JSON response size; the coarsest level with at least this many points is used
+PREVIEW_POINTS = 2000
+MAX_POINTS_PER_REQUEST = 50000
+
+# Uploads analysed at once in the background
+PEAKS_CONCURRENCY = 2
+
+# End of ffmpeg's log quoted when decoding fails
+STDERR_TAIL_BYTES = 4096
+
+_INT16_SCALE = 32767
+_slots = threading.BoundedSemaphore(PEAKS_CONCURRENCY)
+_locks = {}  # sidecar path -> lock held while it is computed
+_locks_guard = threading.Lock()
+
+
+class PeaksUnavailable(RuntimeError):
+    """NumPy is not installed, so peaks cannot be computed or read"""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise PeaksUnavailable('NumPy is required for waveform peaks')
+    return numpy
+
+
+def sidecar_path(path: str) -> str:
+    return path + PEAKS_SUFFIX
+
+
+def _decode_args(path: str) -> List[str]:
+    stream = ffmpeg.input(path).output(
+        'pipe:', map='0:a:0', ac=1, ar=PEAKS_SAMPLE_RATE, format='f32le'
+    ).global_args('-v', 'error', '-nostdin')
+    return ffmpeg.compile(stream)
+
+
+class _Level:
+    """Accumulates one zoom level and spills its points to a temporary file"""
+
+    def __init__(self, np, samples_per_point: int):
+        self.np = np
+        self.samples_per_point = samples_per_point
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+        self.pending = np.empty((0, 3), dtype=np.float64)  # finer points not yet grouped
+
+    def write(self, points):
+        """``points`` columns: min, max, mean square"""
+        np = self.np
+        if not len(points):
+            return
+        encoded = np.empty((len(points), 3), dtype='<i2')
+        encoded[:, 0] = np.round(np.clip(points[:, 0], -1, 1) * _INT16_SCALE)
+        encoded[:, 1] = np.round(np.clip(points[:, 1], -1, 1) * _INT16_SCALE)
+        encoded[:, 2] = np.round(np.clip(np.sqrt(points[:, 2]), 0, 1) * _INT16_SCALE)
+        self.file.write(encoded.tobytes())
+        self.count += len(points)
+
+    def group(self, finer, final: bool = False):
+        """Combine finer points ZOOM_FACTOR at a time; returns the points produced"""
+        np = self.np
+        points = np.concatenate([self.pending, finer]) if len(self.pending) else finer
+        whole = len(points) // ZOOM_FACTOR * ZOOM_FACTOR
+        grouped = points[:whole].reshape(-1, ZOOM_FACTOR, 3)
+        result = np.column_stack([grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1),
+                                  grouped[:, :, 2].mean(axis=1)])
+        self.pending = points[whole:]
+        if final and len(self.pending):
+            tail = self.pending
+            result = np.concatenate([result, [[tail[:, 0].min(), tail[:, 1].max(), tail[:, 2].mean()]]])
+            self.pending = tail[:0]
+        return result
+
+
+def _reduce_samples(np, samples, final: bool = False):
+    """Finest-level min, max and mean square for whole blocks; returns (points, leftover samples)"""
+    whole = len(samples) // BASE_SAMPLES_PER_POINT * BASE_SAMPLES_PER_POINT
+    blocks = samples[:whole].reshape(-1, BASE_SAMPLES_PER_POINT)
+    points = np.column_stack([blocks.min(axis=1), blocks.max(axis=1),
+                              np.square(blocks, dtype=np.float64).mean(axis=1)])
+    leftover = samples[whole:]
+    if final and len(leftover):
+        points = np.concatenate([points, [[leftover.min(), leftover.max(),
+                                           np.square(leftover, dtype=np.float64).mean()]]])
+        leftover = leftover[:0]
+    return points, leftover
+
+
+class _SilenceTracker:
+    """Finds runs of quiet finest-level points across chunk boundaries"""
+
+    def __init__(self, np):
+        self.np = np
+        self.threshold = 10 ** (SILENCE_THRESHOLD_DB / 10)  # mean square
+        self.min_points = SILENCE_MIN_SECONDS * PEAKS_SAMPLE_RATE / BASE_SAMPLES_PER_POINT
+        self.offset = 0
+        self.start = None
+        self.regions = []
+
+    def feed(self, mean_squares):
+        np = self.np
+        silent = mean_squares < self.threshold
+        previous = np.concatenate([[self.start is not None], silent])
+        for index in np.flatnonzero(previous[1:] != previous[:-1]):
+            if silent[index]:
+                self.start = self.offset + index
+            else:
+                self._close(self.offset + index)
+        self.offset += len(silent)
+
+    def finish(self) -> List[List[float]]:
+        if self.start is not None:
+            self._close(self.offset)
+        return self.regions
+
+    def _close(self, end: int):
+        if end - self.start >= self.min_points:
+            seconds = BASE_SAMPLES_PER_POINT / PEAKS_SAMPLE_RATE
+            self.regions.append([round(self.start * seconds, 3), round(end * seconds, 3)])
+        self.start = None
+
+
+def compute_peaks(path: str, output_path: str) -> Dict[str, Any]:
+    """Analyse ``path`` and write the sidecar to ``output_path``; returns its header"""
+    np = _numpy()
+    levels = [_Level(np, BASE_SAMPLES_PER_POINT * ZOOM_FACTOR ** index) for index in range(ZOOM_LEVELS)]
+    silence = _SilenceTracker(np)
+    total_samples = 0
+    peak = 0.0
+    energy = 0.0
+    leftover = np.empty(0, dtype=np.float32)
+
+    # stderr goes to a file: a damaged input can log more decode errors than a
+    # pipe holds, and ffmpeg would block on it while we wait on stdout
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen(_decode_args(path), stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=errors)
+    try:
+        chunk_bytes = CHUNK_POINTS * BASE_SAMPLES_PER_POINT * 4
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            final = len(data) < chunk_bytes
+            # A read can end mid-sample only at EOF of a broken stream
+            data = data[:len(data) // 4 * 4]
+            samples = np.frombuffer(data, dtype='<f4')
+            total_samples += len(samples)
+            if len(samples):
+                peak = max(peak, float(np.abs(samples).max()))
+                energy += float(np.square(samples, dtype=np.float64).sum())
+            if len(leftover):
+                samples = np.concatenate([leftover, samples])
+
+            points, leftover = _reduce_samples(np, samples, final)
+            silence.feed(points[:, 2])
+            for level in levels:
+                if level is not levels[0]:
+                    points = level.group(points, final)
+                level.write(points)
+            if final:
+                break
+
+        if process.wait() != 0:
+            errors.seek(max(0, errors.seek(0, os.SEEK_END) - STDERR_TAIL_BYTES))
+            stderr = errors.read().decode(errors='replace')
+            raise RuntimeError(f"Could not decode audio: {stderr.strip() or 'ffmpeg failed'}")
+
+        header = {
+            'version': 1,
+            'sample_rate': PEAKS_SAMPLE_RATE,
+            'channels': 1,
+            'duration': round(total_samples / PEAKS_SAMPLE_RATE, 3),
+            'peak_db': _db(peak * peak),
+            'rms_db': _db(energy / total_samples) if total_samples else None,
+            'silence': silence.finish(),
+            'columns': ['min', 'max', 'rms'],
+            'levels': []
+        }
+        offset = 0
+        for level in levels:
+            header['levels'].append({'samples_per_point': level.samples_per_point,
+                                     'count': level.count, 'offset': offset})
+            offset += level.count * 3 * 2
+        _write_sidecar(output_path, header, levels)
+        return header
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        errors.close()
+        for level in levels:
+            level.file.close()
+
+
+def _db(mean_square: float) -> Optional[float]:
+    np = _numpy()
+    return round(float(10 * np.log10(mean_square)), 2) if mean_square > 0 else None
+
+
+def _write_sidecar(output_path: str, header: Dict[str, Any], levels: List[_Level]):
+    """Header and level arrays, written to a temporary file and renamed into place"""
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    directory = os.path.dirname(output_path) or '.'
+    fd, temp_path = tempfile.mkstemp(prefix='.peaks_', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(PEAKS_MAGIC + struct.pack('<I', len(encoded)) + encoded)
+            for level in levels:
+                level.file.seek(0)
+                while True:
+                    block = level.file.read(1024 * 1024)
+                    if not block:
+                        break
+                    out.write(block)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_peaks(path: str) -> Tuple[Dict[str, Any], List[Any]]:
+    """Sidecar header and a read-only memory map of each level"""
+    np = _numpy()
+    with open(path, 'rb') as f:
+        if f.read(len(PEAKS_MAGIC)) != PEAKS_MAGIC:
+            raise ValueError(f"{os.path.basename(path)} is not a peaks file")
+        header_length = struct.unpack('<I', f.read(4))[0]
+        header = json.loads(f.read(header_length))
+    data_start = len(PEAKS_MAGIC) + 4 + header_length
+    arrays = []
+    for level in header['levels']:
+        if not level['count']:
+            arrays.append(np.zeros((0, 3), dtype='<i2'))
+            continue
+        arrays.append(np.memmap(path, dtype='<i2', mode='r', offset=data_start + level['offset'],
+                                shape=(level['count'], 3)))
+    return header, arrays
+
+
+def ensure_peaks(path: str) -> str:
+    """Sidecar for an upload, computing it unless an up-to-date one exists"""
+    output_path = sidecar_path(path)
+    with _locks_guard:
+        lock = _locks.setdefault(output_path, threading.Lock())
+    with lock:
+        if not (os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(path)):
+            compute_peaks(path, output_path)
+    with _locks_guard:
+        _locks.pop(output_path, None)
+    return output_path
+
+
+def schedule_peaks(path: str):
+    """Precompute peaks for a new upload without holding up the request"""
+    def run():
+        with _slots:
+            try:
+                ensure_peaks(path)
+            except PeaksUnavailable:
+                pass
+            except Exception as e:
+                logging.warning(f"Could not compute peaks for {path}: {str(e)}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def peaks_response(path: str, level: Optional[int] = None, start: Optional[float] = None,
+                   end: Optional[float] = None) -> Dict[str, Any]:
+    """JSON-ready slice of one zoom level; raises ValueError on bad parameters"""
+    header, arrays = load_peaks(path)
+    if level is None:
+        # Coarsest level that still has enough detail for a full-width preview
+        level = 0
+        for index, info in enumerate(header['levels']):
+            if info['count'] >= PREVIEW_POINTS:
+                level = index
+    if not 0 <= level < len(arrays):
+        raise ValueError(f"level must be between 0 and {len(arrays) - 1}")
+
+    samples_per_point = header['levels'][level]['samples_per_point']
+    seconds_per_point = samples_per_point / header['sample_rate']
+    first = int((start or 0) / seconds_per_point)
+    last = len(arrays[level]) if end is None else int(end / seconds_per_point + 1)
+    if first < 0 or last < first:
+        raise ValueError("start and end must be non-negative with start before end")
+    last = min(last, len(arrays[level]), first + MAX_POINTS_PER_REQUEST)
+
+    return {
+        'sample_rate': header['sample_rate'],
+        'duration': header['duration'],
+        'peak_db': header['peak_db'],
+        'rms_db': header['rms_db'],
+        'silence': header['silence'],
+        'level': level,
+        'levels': len(arrays),
+        'samples_per_point': samples_per_point,
+        'start': round(first * seconds_per_point, 3),
+        'columns': header['columns'],
+        'data': arrays[level][first:last].tolist()
+    }
@@ -0,0 +1,216 @@
+import re
+from typing import Dict, List, Any
+
+# A pipeline runs a small DAG of the existing operations as one job:
+#   {"stages": [{"id": "mix", "operation": "merge_audio_tracks", "inputs": [0, 1]},
+#               {"id": "video", "operation": "merge_audio_video", "inputs": [2, {"stage": "mix"}]},
+#               {"operation": "convert_format", "inputs": [{"stage": "video"}],
+#                "options": {"target_format": "avi"}}]}
+# File inputs are indexes into the job's files or saved_name values; a stage
+# can only use stages listed before it, and the last stage is the job's output.
+MAX_PIPELINE_STAGES = 8
+
+# Stage ids are referenced by later stages
+STAGE_ID = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+# What each operation hands to the next stage
+STAGE_OUTPUT_TYPES = {
+    'merge_audio_video': 'video',
+    'merge_audio_tracks': 'audio',
+    'audio_to_image': 'video',
+    'convert_format': None,  # the type of its input, or audio for audio-only formats
+    'loop_audio': 'audio'
+}
+
+# Options that describe the job's final output; intermediate stages cannot set them
+FINAL_STAGE_OPTIONS = ('streaming', 'targets')
+
+# Job options that are not passed down to stages
+JOB_ONLY_OPTIONS = ('stages', 'cache', 'previews', 'thumbnails', 'intermediate')
+
+# Linear audio chains (e.g. merge_audio_tracks -> loop_audio -> convert_format)
+# run as one filter graph with a single encode: a chain starts with one of
+# CHAIN_HEADS and each following stage works on the decoded output of the one
+# before it
+CHAIN_HEADS = ('merge_audio_tracks', 'loop_audio')
+CHAIN_LINKS = ('loop_audio', 'convert_format')
+
+# Stages that read an audio input once, front to back, without probing or
+# seeking it; an audio stage feeding only one of them streams into it over a
+# pipe instead of writing an intermediate file
+PIPE_CONSUMERS = ('audio_to_image', 'merge_audio_video')
+
+
+def parse_pipeline(files: List[Dict], options: Dict) -> List[Dict[str, Any]]:
+    """Validate ``options['stages']`` against the job's files.
+
+    Returns the stages in order, each ``{id, operation, inputs, options,
+    output_type, final}`` with inputs resolved to ``{'file': ...}`` or
+    ``{'stage': id}``. Job options (profile, force_reencode, ...) apply
+    to every stage unless a stage overrides them. Raises ValueError.
+    """
+    specs = options.get('stages')
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("A pipeline needs a non-empty stages list")
+    if len(specs) > MAX_PIPELINE_STAGES:
+        raise ValueError(f"A pipeline can have at most {MAX_PIPELINE_STAGES} stages")
+
+    shared_options = {key: value for key, value in options.items() if key not in JOB_ONLY_OPTIONS}
+    by_name = {file['saved_name']: file for file in files}
+    stages = []
+    output_types = {}
+    unused = set()
+    for number, spec in enumerate(specs, start=1):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Stage {number}: must be an object")
+        stage_id = str(spec.get('id') or f'stage{number}')
+        if not STAGE_ID.match(stage_id) or stage_id in output_types:
+            raise ValueError(f"Stage {number}: id must be unique and only contain letters, digits, '-' and '_'")
+        operation = spec.get('operation')
+        if operation not in STAGE_OUTPUT_TYPES:
+            raise ValueError(f"Stage {number}: operation must be one of {', '.join(STAGE_OUTPUT_TYPES)}")
+        stage_options = spec.get('options') or {}
+        if not isinstance(stage_options, dict) or 'intermediate' in stage_options:
+            raise ValueError(f"Stage {number}: invalid options")
+        final = number == len(specs)
+        if not final and any(stage_options.get(key) for key in FINAL_STAGE_OPTIONS):
+            raise ValueError(f"Stage {number}: {' and '.join(FINAL_STAGE_OPTIONS)} only apply to the last stage")
+
+        if not spec.get('inputs'):
+            raise ValueError(f"Stage {number}: inputs are required")
+        inputs = []
+        for ref in spec['inputs']:
+            if isinstance(ref, dict) and ref.get('stage') in output_types:
+                inputs.append({'stage': ref['stage']})
+                unused.discard(ref['stage'])
+            elif isinstance(ref, int) and not isinstance(ref, bool) and 0 <= ref < len(files):
+                inputs.append({'file': files[ref]})
+            elif isinstance(ref, str) and ref in by_name:
+                inputs.append({'file': by_name[ref]})
+            else:
+                raise ValueError(f"Stage {number}: unknown input {ref!r} (stages can only use earlier stages)")
+
+        output_type = STAGE_OUTPUT_TYPES[operation]
+        if output_type is None:
+            if stage_options.get('target_format', shared_options.get('target_format', 'mp4')) in ('mp3', 'wav'):
+                output_type = 'audio'
+            else:
+                output_type = _input_type(inputs[0], output_types)
+
+        stage_options = dict(shared_options, **stage_options)
+        if not final:
+            for key in FINAL_STAGE_OPTIONS:
+                stage_options.pop(key, None)
+
+        stages.append({
+            'id': stage_id,
+            'operation': operation,
+            'inputs': inputs,
+            'options': stage_options,
+            'output_type': output_type,
+            'final': final
+        })
+        output_types[stage_id] = output_type
+        unused.add(stage_id)
+
+    unused.discard(stages[-1]['id'])
+    if unused:
+        raise ValueError(f"Stage output never used: {', '.join(sorted(unused))}")
+    return stages
+
+
+def _input_type(ref: Dict[str, Any], output_types: Dict[str, str]) -> str:
+    return output_types[ref['stage']] if 'stage' in ref else ref['file']['file_type']
+
+
+def plan_pipeline(files: List[Dict], options: Dict) -> List[Dict[str, Any]]:
+    """Stages left to run once the DAG is compiled into as few ffmpeg runs as possible.
+
+    A convert_format stage that only feeds other stages would write a lossy
+    copy the next stage decodes again; instead its consumers read its input
+    directly (typed as the conversion's output), since they encode anyway.
+    Linear audio chains become one stage with ``chain`` listing the stages
+    they fuse, and an audio stage whose only consumer is in PIPE_CONSUMERS is
+    marked ``pipe``.
+    """
+    stages = parse_pipeline(files, options)
+    replaced = {}  # elided stage id -> the input its consumers read instead
+    planned = []
+    for stage in stages:
+        stage = dict(stage, inputs=[_resolve(ref, replaced) for ref in stage['inputs']])
+        if (stage['operation'] == 'convert_format' and not stage['final']
+                and len(stage['inputs']) == 1):
+            source = stage['inputs'][0]
+            replaced[stage['id']] = dict(source, file_type=stage['output_type'])
+            continue
+        planned.append(stage)
+    return _mark_pipes(_fuse_chains(planned))
+
+
+def _consumers(stages: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Stage id -> the stages reading its output, once per reference"""
+    consumers = {}
+    for stage in stages:
+        for ref in stage['inputs']:
+            if 'stage' in ref:
+                consumers.setdefault(ref['stage'], []).append(stage)
+    return consumers
+
+
+def _fuse_chains(stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    consumers = _consumers(stages)
+    fused = []
+    by_id = {}
+    for stage in stages:
+        ref = stage['inputs'][0]
+        producer = by_id.get(ref.get('stage'))
+        if (len(stage['inputs']) == 1 and producer and 'file_type' not in ref
+                and len(consumers[producer['id']]) == 1 and _can_follow(producer, stage)):
+            chain = producer.get('chain') or [producer]
+            stage = dict(stage, inputs=producer['inputs'], chain=chain + [stage],
+                         operation='+'.join(member['operation'] for member in chain + [stage]))
+            fused.remove(producer)
+        fused.append(stage)
+        by_id[stage['id']] = stage
+    return fused
+
+
+def _can_follow(producer: Dict[str, Any], stage: Dict[str, Any]) -> bool:
+    """Whether ``stage`` can run on the decoded output of ``producer`` in one graph"""
+    if producer['output_type'] != 'audio' or stage['operation'] not in CHAIN_LINKS:
+        return False
+    if 'chain' not in producer and producer['operation'] not in CHAIN_HEADS:
+        return False
+    if stage['operation'] == 'convert_format':
+        # Multi-output and streaming conversions keep their own code paths
+        return stage['output_type'] == 'audio' and not any(
+            stage['options'].get(key) for key in FINAL_STAGE_OPTIONS
+        )
+    return True
+
+
+def _mark_pipes(stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    consumers = _consumers(stages)
+    for stage in stages:
+        readers = consumers.get(stage['id'], [])
+        if (not stage['final'] and stage['output_type'] == 'audio' and len(readers) == 1
+                and readers[0]['operation'] in PIPE_CONSUMERS
+                # Looping needs the whole input up front
+                and not readers[0]['options'].get('loop_audio')):
+            stage['pipe'] = True
+    return stages
+
+
+def _resolve(ref: Dict[str, Any], replaced: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Input reference with elided stages replaced; ``file_type`` overrides the input's own"""
+    if 'stage' in ref and ref['stage'] in replaced:
+        return replaced[ref['stage']]
+    return ref
+
+
+def final_stage_options(options: Dict) -> Dict:
+    """Options the last stage of an unvalidated pipeline spec runs with"""
+    specs = options.get('stages')
+    last = specs[-1] if isinstance(specs, list) and specs and isinstance(specs[-1], dict) else {}
+    stage_options = last.get('options')
+    return dict(options, **stage_options) if isinstance(stage_options, dict) else options
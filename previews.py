@@ -0,0 +1,213 @@
+import os
+import json
+import math
+import time
+import shutil
+from typing import Dict, List, Any, Optional, Tuple
+
+# Previews of a finished video go to outputs/previews/<task_id>/, found from
+# the task id alone: a few thumbnails, a scrub sprite sheet and its WebVTT index
+PREVIEW_DIRNAME = 'previews'
+MANIFEST_NAME = 'previews.json'
+SPRITE_NAME = 'sprite.jpg'
+VTT_NAME = 'sprite.vtt'
+
+# Outputs previews are made for (video containers ffmpeg can seek in)
+PREVIEW_EXTENSIONS = ('.mp4', '.avi')
+
+THUMBNAIL_COUNT = 5  # default for options['thumbnails']
+MAX_THUMBNAILS = 20
+THUMBNAIL_WIDTH = 320
+
+# One sprite tile per interval, coarser for long videos. Every tile is its own
+# input with a decoder held open until the run ends, so the cap also bounds
+# memory (a 4K frame is 12 MB), also under an opt-in FFMPEG_MEMORY_LIMIT_MB
+SPRITE_INTERVAL = 10
+SPRITE_MAX_FRAMES = 60
+SPRITE_COLUMNS = 10
+TILE_WIDTH = 160
+
+JPEG_QUALITY = 4  # -q:v, 2 (best) to 31
+
+
+def preview_dir(output_folder: str, task_id: str) -> str:
+    return os.path.join(output_folder, PREVIEW_DIRNAME, task_id)
+
+
+def thumbnail_count(options: Dict) -> Optional[int]:
+    """Thumbnails requested with options['thumbnails'], or None when previews are off"""
+    if not options.get('previews', True):
+        return None
+    count = int(options.get('thumbnails', THUMBNAIL_COUNT))
+    if not 0 <= count <= MAX_THUMBNAILS:
+        raise ValueError(f"thumbnails must be between 0 and {MAX_THUMBNAILS}")
+    return count
+
+
+def wants_previews(output_file: str) -> bool:
+    return output_file.lower().endswith(PREVIEW_EXTENSIONS)
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def scaled_size(width: int, height: int, target_width: int) -> Tuple[int, int]:
+    """Frame size at ``target_width`` keeping the aspect ratio; both dimensions even"""
+    return target_width, _even(target_width * height / width)
+
+
+def sample_times(duration: float, count: int) -> List[float]:
+    """Midpoints of ``count`` equal slices of the video"""
+    return [duration * (index + 0.5) / count for index in range(count)]
+
+
+def sprite_frames(duration: float) -> int:
+    return min(SPRITE_MAX_FRAMES, max(1, math.ceil(duration / SPRITE_INTERVAL)))
+
+
+def _seek_input(path: str, time_seconds: float) -> List[str]:
+    # Input seeking lands on the keyframe at or before the time without decoding
+    # up to it, and only keyframes are decoded; one thread per input keeps the
+    # open decoders cheap
+    return ['-threads', '1', '-skip_frame', 'nokey', '-noaccurate_seek',
+            '-ss', f'{time_seconds:.3f}', '-i', path]
+
+
+def preview_command(video_path: str, duration: float, width: int, height: int,
+                    thumbnails: int, directory: str) -> Tuple[List[str], Dict[str, Any]]:
+    """One ffmpeg invocation writing every thumbnail and the sprite sheet.
+
+    Each sampled time is its own fast-seeked input from which a single
+    keyframe is taken, so the cost depends on the number of previews, not
+    on the video's length. Returns the command and the preview layout.
+    """
+    frames = sprite_frames(duration)
+    tile_width, tile_height = scaled_size(width, height, TILE_WIDTH)
+    thumb_width, thumb_height = scaled_size(width, height, THUMBNAIL_WIDTH)
+    sprite_times = sample_times(duration, frames)
+    thumb_times = sample_times(duration, thumbnails) if thumbnails else []
+
+    args = ['ffmpeg', '-y']
+    for time_seconds in sprite_times + thumb_times:
+        args += _seek_input(video_path, time_seconds)
+
+    graph = []
+    for index in range(frames):
+        graph.append(f'[{index}:v:0]trim=end_frame=1,setpts=PTS-STARTPTS,'
+                     f'scale={tile_width}:{tile_height},setsar=1[s{index}]')
+    columns = min(SPRITE_COLUMNS, frames)
+    rows = math.ceil(frames / columns)
+    graph.append(''.join(f'[s{index}]' for index in range(frames))
+                 + f'concat=n={frames}:v=1:a=0,tile={columns}x{rows}[sprite]')
+    for number in range(thumbnails):
+        graph.append(f'[{frames + number}:v:0]trim=end_frame=1,'
+                     f'scale={thumb_width}:{thumb_height},setsar=1[t{number}]')
+    args += ['-filter_complex', ';'.join(graph)]
+
+    args += ['-map', '[sprite]', '-frames:v', '1', '-q:v', str(JPEG_QUALITY),
+             os.path.join(directory, SPRITE_NAME)]
+    thumbnail_files = []
+    for number in range(thumbnails):
+        name = f'thumb_{number + 1:02d}.jpg'
+        thumbnail_files.append({'time': round(thumb_times[number], 3), 'file': name})
+        args += ['-map', f'[t{number}]', '-frames:v', '1', '-q:v', str(JPEG_QUALITY),
+                 os.path.join(directory, name)]
+
+    layout = {
+        'thumbnails': thumbnail_files,
+        'sprite': {
+            'file': SPRITE_NAME,
+            'vtt': VTT_NAME,
+            'frames': frames,
+            'columns': columns,
+            'rows': rows,
+            'tile_width': tile_width,
+            'tile_height': tile_height,
+            'interval': round(duration / frames, 3)
+        }
+    }
+    return args, layout
+
+
+def _vtt_time(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    return f'{int(hours):02d}:{int(minutes):02d}:{rest:06.3f}'
+
+
+def sprite_vtt(duration: float, sprite: Dict[str, Any]) -> str:
+    """WebVTT cues mapping each slice of the video to its tile (media fragment xywh)"""
+    lines = ['WEBVTT', '']
+    for index in range(sprite['frames']):
+        start = duration * index / sprite['frames']
+        end = duration * (index + 1) / sprite['frames']
+        x = index % sprite['columns'] * sprite['tile_width']
+        y = index // sprite['columns'] * sprite['tile_height']
+        lines += [f'{_vtt_time(start)} --> {_vtt_time(end)}',
+                  f"{sprite['file']}#xywh={x},{y},{sprite['tile_width']},{sprite['tile_height']}", '']
+    return '\n'.join(lines)
+
+
+def write_previews_index(directory: str, duration: float, layout: Dict[str, Any]):
+    """Write the WebVTT index and the manifest read by the /previews endpoint"""
+    with open(os.path.join(directory, VTT_NAME), 'w') as f:
+        f.write(sprite_vtt(duration, layout['sprite']))
+    manifest = dict(layout, duration=round(duration, 3))
+    temp_path = os.path.join(directory, MANIFEST_NAME + '.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, os.path.join(directory, MANIFEST_NAME))
+
+
+def load_previews(output_folder: str, task_id: str) -> Optional[Dict[str, Any]]:
+    """Manifest of a task's previews with download URLs, or None if it has none"""
+    if os.path.basename(task_id) != task_id or task_id in ('', '.', '..'):
+        return None
+    try:
+        with open(os.path.join(preview_dir(output_folder, task_id), MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    def url(name):
+        return f"/download/{PREVIEW_DIRNAME}/{task_id}/{name}?inline=1"
+
+    for thumbnail in manifest['thumbnails']:
+        thumbnail['url'] = url(thumbnail['file'])
+    manifest['sprite']['url'] = url(manifest['sprite']['file'])
+    manifest['sprite']['vtt_url'] = url(manifest['sprite']['vtt'])
+    return manifest
+
+
+def copy_previews(output_folder: str, source_task_id: str, task_id: str) -> bool:
+    """Give ``task_id`` the previews made for another task's identical output"""
+    source = preview_dir(output_folder, source_task_id)
+    if not os.path.exists(os.path.join(source, MANIFEST_NAME)):
+        return False
+    if source_task_id == task_id:
+        return True
+    target = preview_dir(output_folder, task_id)
+    shutil.rmtree(target, ignore_errors=True)
+    try:
+        shutil.copytree(source, target)
+    except OSError:
+        # The source was cleaned up while it was being copied
+        shutil.rmtree(target, ignore_errors=True)
+        return False
+    return True
+
+
+def cleanup_previews(output_folder: str, max_age_seconds: int) -> int:
+    """Remove preview directories older than ``max_age_seconds``"""
+    root = os.path.join(output_folder, PREVIEW_DIRNAME)
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    now = time.time()
+    for task_id in os.listdir(root):
+        directory = os.path.join(root, task_id)
+        if os.path.isdir(directory) and now - os.path.getmtime(directory) > max_age_seconds:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,159 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import ffmpeg
+
+from content_store import stored_content_hash
+
+PROBE_CACHE_SIZE = 512
+
+
+def first_stream(probe: Dict, codec_type: str) -> Optional[Dict]:
+    """First real stream of a type; cover art in audio files is not counted as video"""
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') != codec_type:
+            continue
+        if stream.get('disposition', {}).get('attached_pic'):
+            continue
+        return stream
+    return None
+
+
+def _parse_timestamp(value: str) -> Optional[float]:
+    """Seconds from an 'HH:MM:SS.ffffff' tag value (used by Matroska for DURATION)"""
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+def media_duration(probe: Dict) -> Optional[float]:
+    """Duration in seconds from the container, falling back to the longest stream"""
+    try:
+        return float(probe['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    durations = []
+    for stream in probe.get('streams', []):
+        try:
+            durations.append(float(stream['duration']))
+            continue
+        except (KeyError, TypeError, ValueError):
+            pass
+        tag_duration = _parse_timestamp(stream.get('tags', {}).get('DURATION'))
+        if tag_duration is not None:
+            durations.append(tag_duration)
+    return max(durations) if durations else None
+
+
+def probe_summary(probe: Dict) -> Dict[str, Any]:
+    """The handful of probe fields the processing code and UI care about"""
+    video = first_stream(probe, 'video')
+    audio = first_stream(probe, 'audio')
+    return {
+        'duration': media_duration(probe),
+        'format_name': probe.get('format', {}).get('format_name'),
+        'video_codec': video.get('codec_name') if video else None,
+        'width': video.get('width') if video else None,
+        'height': video.get('height') if video else None,
+        'audio_codec': audio.get('codec_name') if audio else None,
+        'sample_rate': int(audio['sample_rate']) if audio and audio.get('sample_rate') else None,
+        'channels': audio.get('channels') if audio else None
+    }
+
+
+class ProbeCache:
+    """Thread-safe LRU of ffprobe results keyed by path, mtime and size.
+
+    A changed file gets a new key, so stale entries simply age out.
+    """
+
+    def __init__(self, maxsize: int = PROBE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[Dict]:
+        with self._lock:
+            probe = self._entries.get(key)
+            if probe is not None:
+                self._entries.move_to_end(key)
+            return probe
+
+    def put(self, key, probe: Dict):
+        with self._lock:
+            self._entries[key] = probe
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_cache = ProbeCache()
+
+
+def _stored_probe(path: str) -> Optional[Dict]:
+    """Probe result saved on an earlier UploadedFile row with the same content"""
+    content_hash = stored_content_hash(path, compute=False)
+    if not content_hash:
+        return None
+    try:
+        from models import UploadedFile
+        from app import app
+
+        with app.app_context():
+            row = UploadedFile.query.filter(
+                UploadedFile.content_hash == content_hash,
+                UploadedFile.probe_json.isnot(None)
+            ).first()
+            return json.loads(row.probe_json) if row else None
+    except Exception as e:
+        logging.warning(f"Could not read stored probe for {path}: {str(e)}")
+        return None
+
+
+def _cache_key(path: str):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def probe_media(path: str) -> Dict:
+    """ffprobe a file at most once per content version.
+
+    Lookup order: in-process LRU, metadata persisted for the same content
+    hash, then an actual ffprobe run. Returned dicts are shared; do not
+    modify them.
+    """
+    key = _cache_key(path)
+    probe = _cache.get(key)
+    if probe is None:
+        probe = _stored_probe(path)
+        if probe is None:
+            probe = ffmpeg.probe(path)
+        _cache.put(key, probe)
+    return probe
+
+
+def known_probe(path: str) -> Optional[Dict]:
+    """Probe result already cached or stored for a file; never runs ffprobe"""
+    key = _cache_key(path)
+    probe = _cache.get(key)
+    if probe is None:
+        probe = _stored_probe(path)
+        if probe is not None:
+            _cache.put(key, probe)
+    return probe
+
+
+def try_probe_summary(path: str) -> Optional[Dict[str, Any]]:
+    """Probe summary for a file, or None if ffprobe cannot read it"""
+    try:
+        return probe_summary(probe_media(path))
+    except Exception as e:
+        logging.warning(f"Could not probe {path}: {str(e)}")
+        return None
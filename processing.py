@@ -1,74 +1,267 @@
 import os
+import re
+import time
+import shutil
 import ffmpeg
+import tempfile
 import threading
 import logging
-import subprocess
+from collections import Counter
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+from scheduler import TaskScheduler
+from executor import FFmpegExecutor, ExecutionLimits, compile_command
+from status_hub import StatusHub
+from status_store import StatusPersister, TERMINAL_STATUSES
+from state_backend import StateBackend, create_state_backend
+from content_store import ResultCache, result_cache_key
+from probe import probe_media, known_probe, media_duration, first_stream, try_probe_summary
+from streaming import stream_output, keyframe_options, as_argv
+from encoding import encoder_options, profile_name, intermediate_codecs, output_name
+from still_image import prescale_command, still_video_command
+from audio_loop import (looped_audio, looped_stream, loop_duration, crossfade_seconds, write_concat_list,
+                        LOOP_BUFFER_MAX_SECONDS)
+from mixing import (loudnorm_targets, track_settings, duration_policy, mix_duration, cached_measurement,
+                    store_measurement, measure_command, parse_measurement, track_stream, mix_streams,
+                    measured_mix_command, submix_groups, MIX_FANIN, MIX_PARALLELISM, SUBMIX_CODEC,
+                    MIX_SAMPLE_RATE)
+from segments import (segment_count, split_command, split_segments, encode_command, encoded_path,
+                      SEGMENT_PARALLELISM)
+from previews import (thumbnail_count, wants_previews, preview_dir, preview_command, write_previews_index,
+                      copy_previews)
+from pipeline import plan_pipeline, final_stage_options
+
+# Codec each encoder produces, used to detect when a source stream already
+# matches the output and can be stream-copied instead of re-encoded
+ENCODER_OUTPUT_CODECS = {
+    'libx264': 'h264',
+    'aac': 'aac',
+    'mp3': 'mp3',
+    'libmp3lame': 'mp3',
+    'pcm_s16le': 'pcm_s16le'
+}
+
+# Encoders used for each convert_format target
+FORMAT_CODECS = {
+    'mp4': {'vcodec': 'libx264', 'acodec': 'aac'},
+    'mp3': {'acodec': 'mp3'},
+    'wav': {'acodec': 'pcm_s16le'},
+    'avi': {'vcodec': 'libx264', 'acodec': 'mp3'}
+}
+
+# Output containers that carry audio only
+AUDIO_ONLY_FORMATS = {'mp3', 'wav'}
+
+# Upper bound on renditions written by one multi-output convert_format job
+MAX_OUTPUT_TARGETS = 8
+
+# Target labels become part of output file names
+TARGET_LABEL = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+# Upper bound on jobs accepted in one /batch request
+MAX_BATCH_JOBS = 500
+
+# Minimum seconds between progress writes when the percentage has not moved
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+
+def stream_codecs(probe: Dict) -> Dict[str, str]:
+    """Codec name of the first video and audio stream in an ffprobe result"""
+    codecs = {}
+    for codec_type in ('video', 'audio'):
+        stream = first_stream(probe, codec_type)
+        if stream:
+            codecs[codec_type] = stream.get('codec_name')
+    return codecs
+
+
+def require_duration(probe: Dict, path: str) -> float:
+    """Media duration, failing loudly when the container does not report one"""
+    duration = media_duration(probe)
+    if not duration:
+        raise ValueError(f"Could not determine duration of {os.path.basename(path)}")
+    return duration
+
+
+def negotiate_codecs(source_codecs: Dict[str, str], encoders: Dict[str, str],
+                     force_reencode: bool = False) -> Dict[str, str]:
+    """Map each present stream to 'copy' when it already matches its encoder's output"""
+    codecs = {}
+    for stream_type, option in (('video', 'vcodec'), ('audio', 'acodec')):
+        if stream_type not in source_codecs or option not in encoders:
+            continue
+        encoder = encoders[option]
+        if not force_reencode and source_codecs[stream_type] == ENCODER_OUTPUT_CODECS.get(encoder):
+            codecs[option] = 'copy'
+        else:
+            codecs[option] = encoder
+    return codecs
+
+def parse_targets(targets: List[Any]) -> List[Dict[str, Any]]:
+    """Normalize convert_format targets.
+
+    Each target is a format name (``"mp3"``) or ``{"format": "mp4",
+    "height": 480, "label": "480p"}``; height scales video keeping the
+    aspect ratio. Labels, which name the output files, default to the
+    height or format and are made unique. Raises ValueError on bad targets.
+    """
+    if not isinstance(targets, list) or not targets:
+        raise ValueError("targets must be a non-empty list")
+    if len(targets) > MAX_OUTPUT_TARGETS:
+        raise ValueError(f"At most {MAX_OUTPUT_TARGETS} targets can be written in one pass")
+    
+    parsed = []
+    labels = set()
+    for number, target in enumerate(targets, start=1):
+        if isinstance(target, str):
+            target = {'format': target}
+        if not isinstance(target, dict) or target.get('format') not in FORMAT_CODECS:
+            raise ValueError(f"Target {number}: format must be one of {', '.join(FORMAT_CODECS)}")
+        height = target.get('height')
+        if height is not None:
+            height = int(height)
+            if target['format'] in AUDIO_ONLY_FORMATS or height <= 0 or height % 2:
+                raise ValueError(f"Target {number}: height needs a video format and a positive even value")
+        label = str(target.get('label') or (f"{height}p" if height else target['format']))
+        if not TARGET_LABEL.match(label):
+            raise ValueError(f"Target {number}: label may only contain letters, digits, '-' and '_'")
+        if label in labels:
+            label = f"{label}_{number}"
+        labels.add(label)
+        parsed.append({'format': target['format'], 'height': height, 'label': label})
+    return parsed
+
+def expand_batch(files: List[Dict], job_specs: List[Dict], default_options: Dict) -> List[Dict]:
+    """Resolve batch job specs against the shared file list.
+
+    Each spec is ``{"operation": ..., "files": [...], "options": {...}}``
+    where files are indexes into ``files`` or ``saved_name`` values, and
+    options override ``default_options``. Raises ValueError on bad specs.
+    """
+    if not job_specs:
+        raise ValueError("A batch needs at least one job")
+    if len(job_specs) > MAX_BATCH_JOBS:
+        raise ValueError(f"A batch can contain at most {MAX_BATCH_JOBS} jobs")
+    
+    by_name = {file['saved_name']: file for file in files}
+    jobs = []
+    for number, spec in enumerate(job_specs, start=1):
+        if not spec.get('operation') or not spec.get('files'):
+            raise ValueError(f"Job {number}: operation and files are required")
+        job_files = []
+        for ref in spec['files']:
+            if isinstance(ref, int) and 0 <= ref < len(files):
+                job_files.append(files[ref])
+            elif isinstance(ref, str) and ref in by_name:
+                job_files.append(by_name[ref])
+            else:
+                raise ValueError(f"Job {number}: unknown file reference {ref!r}")
+        jobs.append({
+            'operation': spec['operation'],
+            'files': job_files,
+            'options': dict(default_options, **spec.get('options', {}))
+        })
+    return jobs
 
 class ProcessingManager:
     """Manages multimedia processing tasks using ffmpeg-python"""
     
-    def __init__(self):
-        self.tasks = {}  # Store task status and results
-        self.lock = threading.Lock()
+    def __init__(self, max_workers: Optional[int] = None, cache_max_bytes: Optional[int] = None,
+                 limits: Optional[ExecutionLimits] = None, state: Optional[StateBackend] = None,
+                 run_workers: bool = True):
+        self.lock = threading.RLock()
+        self.hub = StatusHub()  # pushes status deltas to streaming clients
+        self.persister = StatusPersister()  # write-behind status persistence
+        # Task status, batches and the job queue; STATE_BACKEND picks memory, sql or redis://
+        self.state = state or create_state_backend(persister=self.persister)
+        self._queue_positions = {}  # task_id -> last queue position pushed to subscribers
+        self._pipeline_stages = {}  # task_id -> (stage number, stage count, operation) while a pipeline runs
+        self._pipe_feeds = {}  # task_id -> {FIFO path: command writing it} for piped pipeline stages
+        if not run_workers and not self.state.shared:
+            raise ValueError('Running without encode workers needs a shared STATE_BACKEND (sql or redis://)')
+        self.scheduler = TaskScheduler(self, max_workers, run_workers)
+        self.result_cache = ResultCache(cache_max_bytes)
+        # Split the cores between the worker slots so concurrent encodes do not oversubscribe
+        self.executor = FFmpegExecutor(
+            limits, threads=max(1, (os.cpu_count() or 1) // self.scheduler.max_workers)
+        )
     
-    def update_database_status(self, task_id: str, status: str, progress: int, message: str, output_file: Optional[str] = None):
-        """Update database with task status"""
-        try:
-            # Import here to avoid circular imports
-            from models import db, ProcessingTask, ProcessingHistory
-            from app import app
-            
-            with app.app_context():
-                task = ProcessingTask.query.filter_by(task_id=task_id).first()
-                if task:
-                    task.status = status
-                    task.progress = progress
-                    task.message = message
-                    task.updated_at = datetime.utcnow()
-                    if output_file:
-                        task.output_file = output_file
-                    if status == 'completed':
-                        task.completed_at = datetime.utcnow()
-                        # Add to processing history
-                        history = ProcessingHistory(
-                            task_id=task_id,
-                            operation=task.operation,
-                            status=status,
-                            input_files_count=len(task.uploaded_files),
-                            output_file=output_file,
-                            file_sizes_total=sum(f.file_size or 0 for f in task.uploaded_files)
-                        )
-                        db.session.add(history)
-                    elif status == 'failed':
-                        task.error_message = message
-                    
-                    db.session.commit()
-        except Exception as e:
-            logging.error(f"Failed to update database status: {str(e)}")
+    def update_database_status(self, task_id: str, status: str, progress: int, message: str,
+                               output_file: Optional[str] = None, metrics: Optional[Dict[str, Any]] = None,
+                               outputs: Optional[List[Dict[str, Any]]] = None):
+        """Queue a task status write; the persister coalesces and flushes them in batches"""
+        self.persister.record(task_id, status, progress, message, output_file, metrics, outputs)
+    
+    def register_task(self, task_id: str, message: str = 'Waiting for a free worker...',
+                      operation: Optional[str] = None, batch_id: Optional[str] = None):
+        """Create the status entry for a queued task"""
+        self.register_tasks([(task_id, operation)], message, batch_id)
+    
+    def register_tasks(self, tasks: List[Tuple[str, Optional[str]]],
+                       message: str = 'Waiting for a free worker...', batch_id: Optional[str] = None):
+        """Create the status entries for queued (task_id, operation) pairs in one backend write"""
+        states = {
+            task_id: {
+                'status': 'queued',
+                'progress': 0,
+                'message': message,
+                'output_file': None,
+                'error': None,
+                'operation': operation,
+                'batch_id': batch_id
+            }
+            for task_id, operation in tasks
+        }
+        self.state.create_tasks(states)
+        if batch_id:
+            self.state.add_to_batch(batch_id, list(states))
+        with self.lock:
+            for task_id, state in states.items():
+                self.hub.publish(task_id, state)
+    
+    def subscribe(self, task_id: str, callback):
+        """Watch a task; returns its current status and an unsubscribe function.
+
+        The callback receives only the fields that changed, starting strictly
+        after the returned snapshot.
+        """
+        with self.lock:
+            snapshot = self.get_status(task_id)
+            unsubscribe = self.hub.subscribe(task_id, callback)
+        return snapshot, unsubscribe
+    
+    def publish_queue_positions(self):
+        """Push new queue positions to clients watching queued tasks"""
+        for task_id in self.hub.subscribed_tasks():
+            task = self.state.get_task(task_id)
+            if not task or task['status'] != 'queued':
+                continue
+            position = self.scheduler.queue_position(task_id)
+            with self.lock:
+                if position != self._queue_positions.get(task_id):
+                    self._queue_positions[task_id] = position
+                    self.hub.publish(task_id, {'queue_position': position})
     
     def process_files(self, task_id: str, operation: str, files: List[Dict], 
-                     options: Dict, upload_folder: str, output_folder: str) -> Dict:
-        """Start processing files in a background thread"""
+                     options: Dict, upload_folder: str, output_folder: str,
+                     priority: int = 0) -> Dict:
+        """Queue files for processing on the worker pool"""
         try:
-            # Initialize task status
-            with self.lock:
-                self.tasks[task_id] = {
-                    'status': 'started',
-                    'progress': 0,
-                    'message': 'Processing started...',
-                    'output_file': None,
-                    'error': None
-                }
-            
-            # Start processing in background thread
-            thread = threading.Thread(
-                target=self._process_in_background,
-                args=(task_id, operation, files, options, upload_folder, output_folder)
+            if operation == 'pipeline':
+                # Reject a bad spec now rather than as a failed task
+                plan_pipeline(files, options)
+            self.register_task(task_id, operation=operation)
+            
+            # Repeat jobs over content-addressed inputs finish without taking a worker slot
+            cache_key = self._result_cache_key(task_id, operation, files, options, upload_folder,
+                                               compute_missing=False)
+            if cache_key and self._complete_from_cache(task_id, cache_key, output_folder, options):
+                return {'success': True, 'task_id': task_id}
+            
+            self.scheduler.submit(
+                task_id, operation, files, options, upload_folder, output_folder,
+                priority=priority
             )
-            thread.daemon = True
-            thread.start()
             
             return {'success': True, 'task_id': task_id}
         
@@ -76,71 +269,399 @@ class ProcessingManager:
             logging.error(f"Failed to start processing: {str(e)}")
             return {'success': False, 'error': str(e)}
     
+    def process_batch(self, batch_id: str, jobs: List[Dict], upload_folder: str,
+                      output_folder: str, priority: int = 0) -> Dict:
+        """Queue a group of jobs (each with task_id, operation, files, options) as one batch"""
+        try:
+            # Probe every distinct input once; all jobs in the batch then hit the probe cache
+            input_paths = {os.path.join(upload_folder, file['saved_name'])
+                           for job in jobs for file in job['files']}
+            for path in input_paths:
+                try_probe_summary(path)
+            
+            self.register_tasks([(job['task_id'], job['operation']) for job in jobs], batch_id=batch_id)
+            queued = []
+            for job in jobs:
+                cache_key = self._result_cache_key(job['task_id'], job['operation'], job['files'],
+                                                   job['options'], upload_folder, compute_missing=False)
+                if cache_key and self._complete_from_cache(job['task_id'], cache_key, output_folder,
+                                                           job['options']):
+                    continue
+                queued.append(dict(job, upload_folder=upload_folder, output_folder=output_folder))
+            
+            self.scheduler.submit_many(queued, priority=priority, batch_id=batch_id)
+            return {'success': True, 'batch_id': batch_id, 'task_ids': [job['task_id'] for job in jobs]}
+        
+        except Exception as e:
+            logging.error(f"Failed to start batch: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def get_batch_status(self, batch_id: str) -> Dict:
+        """Aggregate status and per-task results of a batch"""
+        task_ids = self.state.get_batch(batch_id)
+        tasks = [dict(task or {}, task_id=task_id)
+                 for task_id, task in zip(task_ids, self.state.get_tasks(task_ids))]
+        if not tasks:
+            return {'status': 'not_found', 'error': 'Batch not found'}
+        
+        counts = Counter(task.get('status') for task in tasks)
+        if all(task.get('status') in TERMINAL_STATUSES for task in tasks):
+            status = 'completed' if counts['completed'] == len(tasks) else 'completed_with_errors'
+        elif counts['processing']:
+            status = 'processing'
+        else:
+            status = 'queued'
+        
+        return {
+            'batch_id': batch_id,
+            'status': status,
+            'progress': int(sum(task.get('progress') or 0 for task in tasks) / len(tasks)),
+            'total': len(tasks),
+            'counts': dict(counts),
+            'tasks': [{
+                'task_id': task['task_id'],
+                'operation': task.get('operation'),
+                'status': task.get('status'),
+                'progress': task.get('progress'),
+                'output_file': task.get('output_file'),
+                'message': task.get('message')
+            } for task in tasks]
+        }
+    
+    def _result_cache_key(self, task_id: str, operation: str, files: List[Dict], options: Dict,
+                          upload_folder: str, compute_missing: bool = True) -> Optional[str]:
+        """Result cache key for a job, or None if caching is off or the inputs cannot be hashed"""
+        # The cache maps a job to a single output file
+        final_options = final_stage_options(options) if operation == 'pipeline' else options
+        if not options.get('cache', True) or final_options.get('targets'):
+            return None
+        try:
+            # Resolve the server-side default so changing it does not serve old encodes
+            options = dict(options, profile=profile_name(options))
+            return result_cache_key(operation, files, options, upload_folder, compute_missing)
+        except (KeyError, OSError, ValueError) as e:
+            logging.warning(f"Could not compute cache key for task {task_id}: {str(e)}")
+            return None
+    
+    def _complete_from_cache(self, task_id: str, cache_key: str, output_folder: str, options: Dict,
+                             generate_previews: bool = False) -> bool:
+        """Finish the task with a previously produced output if there is one.
+        
+        The producing task's previews are copied over. If they are gone, a
+        worker (``generate_previews``) makes new ones; a request thread leaves
+        the job to the queue instead.
+        """
+        cached = self.result_cache.lookup(cache_key, output_folder)
+        if not cached:
+            return False
+        cached_output, source_task_id = cached
+        try:
+            thumbnails = thumbnail_count(options)
+        except ValueError:
+            # Reported by the worker
+            return False
+        if thumbnails is not None and wants_previews(cached_output) and not (
+                source_task_id and copy_previews(output_folder, source_task_id, task_id)):
+            if not generate_previews:
+                return False
+            self._generate_previews(task_id, cached_output, thumbnails, output_folder)
+        self._update_task_status(task_id, 'completed', 100, 'Processing completed (cached result)!', cached_output)
+        return True
+    
+    def cancel_task(self, task_id: str) -> Dict:
+        """Cancel a queued or running task, killing its ffmpeg process group"""
+        status = self.get_status(task_id)
+        if status['status'] == 'not_found':
+            return {'success': False, 'error': 'Task not found'}
+        if status['status'] in TERMINAL_STATUSES:
+            return {'success': False, 'error': f"Task already {status['status']}"}
+        
+        if self.scheduler.cancel(task_id):
+            # Never started, so nothing else will report on it
+            self._update_task_status(task_id, 'cancelled', 0, 'Cancelled before processing started')
+        else:
+            # The worker notices the killed process and marks the task cancelled
+            self.executor.cancel(task_id)
+            # With a shared backend the encode may be running in another process
+            self.state.request_cancel(task_id)
+        return {'success': True, 'task_id': task_id}
+    
+    def recover_tasks(self) -> int:
+        """Re-queue tasks left unfinished by a previous run"""
+        return self.scheduler.recover()
+    
     def _process_in_background(self, task_id: str, operation: str, files: List[Dict], 
                               options: Dict, upload_folder: str, output_folder: str):
         """Background processing method"""
         try:
-            self._update_task_status(task_id, 'processing', 10, 'Initializing...')
-            
-            # Map operation to processing method
-            operation_map = {
-                'merge_audio_video': self._merge_audio_video,
-                'merge_audio_tracks': self._merge_audio_tracks,
-                'audio_to_image': self._audio_to_image,
-                'convert_format': self._convert_format,
-                'loop_audio': self._loop_audio
-            }
-            
-            if operation not in operation_map:
-                raise ValueError(f"Unknown operation: {operation}")
+            if self.state.cancel_requested(task_id):
+                self.executor.cancel(task_id)
+            if self.executor.is_cancelled(task_id):
+                raise RuntimeError('Task was cancelled')
+            self._update_task_status(task_id, 'processing', 0, 'Initializing...')
             
-            self._update_task_status(task_id, 'processing', 25, 'Processing files...')
+            run_operation = self._operation(operation)
+            thumbnails = thumbnail_count(options)
+            cache_key = self._result_cache_key(task_id, operation, files, options, upload_folder)
+            if cache_key and self._complete_from_cache(task_id, cache_key, output_folder, options,
+                                                       generate_previews=True):
+                return
             
             # Execute the operation
-            output_file = operation_map[operation](
-                files, options, upload_folder, output_folder, task_id
-            )
+            started = time.monotonic()
+            result = run_operation(files, options, upload_folder, output_folder, task_id)
+            encode_seconds = time.monotonic() - started
+            
+            # Multi-output jobs return one entry per output; the first is the task's output_file
+            outputs = result if isinstance(result, list) else None
+            output_file = outputs[0]['output_file'] if outputs else result
+            
+            if thumbnails is not None:
+                video_files = [entry['output_file'] for entry in outputs] if outputs else [output_file]
+                video_files = [name for name in video_files if wants_previews(name)]
+                if video_files:
+                    self._generate_previews(task_id, video_files[0], thumbnails, output_folder, encode_seconds)
             
-            self._update_task_status(task_id, 'completed', 100, 'Processing completed!', output_file)
+            if cache_key:
+                self.result_cache.store(cache_key, output_file, output_folder, task_id)
+            
+            self._update_task_status(task_id, 'completed', 100, 'Processing completed!', output_file,
+                                     outputs=outputs)
         
         except Exception as e:
-            logging.error(f"Processing failed for task {task_id}: {str(e)}")
-            self._update_task_status(task_id, 'failed', 0, f'Processing failed: {str(e)}')
+            if self.executor.is_cancelled(task_id):
+                logging.info(f"Task {task_id} cancelled")
+                self._update_task_status(task_id, 'cancelled', 0, 'Processing cancelled')
+            else:
+                logging.error(f"Processing failed for task {task_id}: {str(e)}")
+                self._update_task_status(task_id, 'failed', 0, f'Processing failed: {str(e)}')
+        finally:
+            self.executor.release(task_id)
+    
+    def _operation(self, operation: str):
+        """Method that runs an operation"""
+        # Map operation to processing method
+        operation_map = {
+            'merge_audio_video': self._merge_audio_video,
+            'merge_audio_tracks': self._merge_audio_tracks,
+            'audio_to_image': self._audio_to_image,
+            'convert_format': self._convert_format,
+            'loop_audio': self._loop_audio,
+            'pipeline': self._run_pipeline
+        }
+        if operation not in operation_map:
+            raise ValueError(f"Unknown operation: {operation}")
+        return operation_map[operation]
     
     def _update_task_status(self, task_id: str, status: str, progress: int, 
-                           message: str, output_file: Optional[str] = None):
+                           message: str, output_file: Optional[str] = None,
+                           metrics: Optional[Dict[str, Any]] = None,
+                           outputs: Optional[List[Dict[str, Any]]] = None):
         """Update task status thread-safely"""
+        metrics = metrics or {}
+        stage = self._pipeline_stages.get(task_id)
+        if stage and status == 'processing':
+            # Pipeline stages report their own progress; map it onto the whole job
+            number, count, operation = stage
+            progress = int(((number - 1) * 100 + progress) / count)
+            message = f"Stage {number}/{count} ({operation}): {message}"
+        update = {
+            'status': status,
+            'progress': progress,
+            'message': message,
+            'output_file': output_file,
+            'eta_seconds': metrics.get('eta_seconds'),
+            'speed': metrics.get('speed'),
+            'fps': metrics.get('fps')
+        }
+        if outputs is not None:
+            update['outputs'] = outputs
         with self.lock:
-            if task_id in self.tasks:
-                self.tasks[task_id].update({
-                    'status': status,
-                    'progress': progress,
-                    'message': message,
-                    'output_file': output_file,
-                    'updated_at': datetime.now().isoformat()
-                })
+            delta = self.state.update_task(task_id, update)
+            if delta is not None and task_id in self._queue_positions:
+                # No longer waiting; clients drop the queue position
+                self._queue_positions.pop(task_id)
+                delta['queue_position'] = None
+            if delta:
+                self.hub.publish(task_id, delta)
         
         # Also update database
-        self.update_database_status(task_id, status, progress, message, output_file)
+        self.update_database_status(task_id, status, progress, message, output_file, metrics, outputs)
+    
+    def _run_ffmpeg(self, task_id: str, command, duration: Optional[float], message: str) -> str:
+        """Run ffmpeg and report its real progress, speed and ETA on the task; returns its stderr tail.
+        
+        A command reading a piped pipeline stage's FIFO runs together with
+        the command that writes it.
+        """
+        self._update_task_status(task_id, 'processing', 0, message)
+        on_progress = self._progress_reporter(task_id, message)
+        feeds = self._pipe_feeds.get(task_id)
+        if feeds:
+            args = compile_command(command)
+            feeders = [feeds.pop(path) for path in list(feeds) if path in args]
+            if feeders:
+                return self.executor.run_piped(task_id, args, feeders, duration, on_progress)
+        return self.executor.run(task_id, command, duration, on_progress)
+    
+    def _progress_reporter(self, task_id: str, message: str):
+        """Progress callback that throttles status writes and stops on remote cancellation"""
+        last_update = {'progress': None, 'time': 0.0}
+        
+        def on_progress(snapshot: Dict[str, Any]):
+            if snapshot['percent'] is None:
+                return
+            # 100% is reserved for the completed state
+            progress = min(int(snapshot['percent']), 99)
+            now = time.monotonic()
+            if progress == last_update['progress'] and now - last_update['time'] < PROGRESS_UPDATE_INTERVAL:
+                return
+            last_update.update(progress=progress, time=now)
+            if self.state.cancel_requested(task_id):
+                # Cancelled through another process; stopping ffmpeg ends this run
+                self.executor.cancel(task_id)
+                return
+            
+            details = []
+            if snapshot['speed']:
+                details.append(f"{snapshot['speed']:.2f}x")
+            if snapshot['eta_seconds'] is not None:
+                details.append(f"ETA {int(snapshot['eta_seconds'])}s")
+            status_message = f"{message} ({', '.join(details)})" if details else message
+            self._update_task_status(task_id, 'processing', progress, status_message, metrics=snapshot)
+        
+        return on_progress
+    
+    def _run_ffmpeg_parallel(self, task_id: str, commands: List, duration: Optional[float],
+                             message: str, workers: int) -> List[str]:
+        """Run several ffmpeg commands for one task at once, reporting their combined progress.
+        
+        ``duration`` is the total media time of all commands. Returns each
+        command's stderr tail, in order.
+        """
+        report = self._progress_reporter(task_id, message)
+        processed = {}  # command index -> seconds processed so far
+        started = time.monotonic()
+        
+        # Callbacks run on this thread; the processes share the executor's event loop
+        def command_progress(index: int):
+            def on_progress(snapshot: Dict[str, Any]):
+                if snapshot['out_time'] is None or not duration:
+                    return
+                processed[index] = snapshot['out_time']
+                done = sum(processed.values())
+                elapsed = time.monotonic() - started
+                report({
+                    'out_time': done,
+                    'percent': min(done / duration * 100, 100.0),
+                    'eta_seconds': elapsed * max(duration - done, 0.0) / done if done else None,
+                    'speed': done / elapsed if elapsed else None,  # combined, multiple of realtime
+                    'fps': None,
+                    'finished': False
+                })
+            return on_progress
+        
+        self._update_task_status(task_id, 'processing', 0, message)
+        return self.executor.run_many(
+            task_id, commands, progress_callbacks=[command_progress(index) for index in range(len(commands))],
+            concurrency=workers
+        )
+    
+    def _encode_in_segments(self, task_id: str, video_file: str, duration: Optional[float], encoder: str,
+                            options: Dict, operation: str, output_folder: str) -> Optional[str]:
+        """Encode a long video stream as segments on parallel ffmpeg processes.
+        
+        Returns a concat list of the encoded segments, which lives in a work
+        directory the caller removes, or None when the video is too short or
+        parallel encoding is turned off.
+        """
+        count = segment_count(duration, options)
+        if not count:
+            return None
+        
+        encoder = intermediate_codecs(options, {'vcodec': encoder})['vcodec']
+        work_dir = tempfile.mkdtemp(prefix='.segments_', dir=output_folder)
+        try:
+            self._run_ffmpeg(task_id, split_command(video_file, duration, count, work_dir), duration,
+                             f'Splitting video into {count} segments...')
+            segments = split_segments(work_dir)
+            output_options = encoder_options(options, operation, {'vcodec': encoder})
+            
+            commands = [encode_command(segment, encoder, output_options) for segment in segments]
+            self._run_ffmpeg_parallel(task_id, commands, duration, f'Encoding {len(segments)} segments in parallel...',
+                                      SEGMENT_PARALLELISM)
+            
+            return write_concat_list([encoded_path(segment) for segment in segments], directory=work_dir)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+    
+    def _generate_previews(self, task_id: str, output_file: str, thumbnails: int, output_folder: str,
+                           encode_seconds: Optional[float] = None):
+        """Thumbnails and a scrub sprite sheet of a finished video; a failure only loses the previews"""
+        directory = preview_dir(output_folder, task_id)
+        started = time.monotonic()
+        try:
+            output_path = os.path.join(output_folder, output_file)
+            probe = probe_media(output_path)
+            video = first_stream(probe, 'video')
+            duration = media_duration(probe)
+            if not video or not video.get('width') or not duration:
+                return
+            
+            os.makedirs(directory, exist_ok=True)
+            command, layout = preview_command(output_path, duration, int(video['width']), int(video['height']),
+                                              thumbnails, directory)
+            self._update_task_status(task_id, 'processing', 99, 'Generating previews...')
+            self.executor.run(task_id, command)
+            write_previews_index(directory, duration, layout)
+        except Exception as e:
+            if self.executor.is_cancelled(task_id):
+                raise
+            logging.warning(f"Could not generate previews for task {task_id}: {str(e)}")
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        
+        elapsed = time.monotonic() - started
+        share = f" ({elapsed / max(encode_seconds, 0.001):.2%} of the encode)" if encode_seconds is not None else ''
+        logging.info(f"Previews for task {task_id} took {elapsed:.2f}s{share}")
+    
+    def _output_target(self, task_id: str, options: Dict, output_folder: str, output_file: str):
+        """Output file, path and extra ffmpeg options, honouring ``options['streaming']``"""
+        output_file = output_name(options, output_file)
+        mode = options.get('streaming')
+        if not mode:
+            return output_file, os.path.join(output_folder, output_file), {}
+        if not output_file.endswith('.mp4'):
+            raise ValueError("Streaming output is only available for MP4 video")
+        return stream_output(mode, output_folder, task_id)
     
     def get_status(self, task_id: str) -> Dict:
         """Get current status of a task"""
-        with self.lock:
-            return self.tasks.get(task_id, {
+        status = self.state.get_task(task_id)
+        if status is None:
+            return {
                 'status': 'not_found',
                 'error': 'Task not found'
-            })
+            }
+        
+        if status['status'] == 'queued':
+            status['queue_position'] = self.scheduler.queue_position(task_id)
+        return status
     
     def _merge_audio_video(self, files: List[Dict], options: Dict, 
                           upload_folder: str, output_folder: str, task_id: str) -> str:
         """Merge audio with video, optionally looping audio"""
         audio_file = None
+        audio_probe = None
         video_file = None
         
         # Find audio and video files
         for file in files:
             if file['file_type'] == 'audio':
                 audio_file = os.path.join(upload_folder, file['saved_name'])
+                # A piped pipeline stage cannot be probed; it says what it writes
+                audio_probe = file.get('piped_probe')
             elif file['file_type'] == 'video':
                 video_file = os.path.join(upload_folder, file['saved_name'])
         
@@ -149,15 +670,27 @@ class ProcessingManager:
         
         # Generate output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"merged_video_{timestamp}.mp4"
-        output_path = os.path.join(output_folder, output_file)
-        
-        self._update_task_status(task_id, 'processing', 50, 'Merging audio and video...')
+        output_file, output_path, stream_options = self._output_target(
+            task_id, options, output_folder, f"merged_video_{timestamp}.mp4"
+        )
         
+        concat_list = None
+        segment_list = None
         try:
             # Get video duration
-            video_probe = ffmpeg.probe(video_file)
-            video_duration = float(video_probe['streams'][0]['duration'])
+            video_probe = probe_media(video_file)
+            video_duration = require_duration(video_probe, video_file)
+            audio_probe = audio_probe or probe_media(audio_file)
+            
+            # Only re-encode the streams that are not already H.264/AAC
+            codecs = negotiate_codecs(
+                {
+                    'video': stream_codecs(video_probe).get('video'),
+                    'audio': stream_codecs(audio_probe).get('audio')
+                },
+                {'vcodec': 'libx264', 'acodec': 'aac'},
+                force_reencode=options.get('force_reencode', False)
+            )
             
             # Create input streams
             video_input = ffmpeg.input(video_file)
@@ -165,85 +698,178 @@ class ProcessingManager:
             # Handle audio looping if requested
             if options.get('loop_audio', False):
                 # Loop audio to match video duration
-                audio_probe = ffmpeg.probe(audio_file)
-                audio_duration = float(audio_probe['streams'][0]['duration'])
-                
-                if audio_duration < video_duration:
-                    # Calculate loop count
-                    loop_count = int(video_duration / audio_duration) + 1
-                    audio_input = ffmpeg.input(audio_file, stream_loop=loop_count)
-                else:
-                    audio_input = ffmpeg.input(audio_file)
+                crossfade = crossfade_seconds(options)
+                audio_stream, concat_list, loop_mode = looped_audio(
+                    audio_file, audio_probe, video_duration,
+                    copy=codecs.get('acodec') == 'copy', crossfade=crossfade
+                )
+                if loop_mode in ('aloop', 'stream_loop') and codecs.get('acodec') == 'copy':
+                    # Filtered (crossfaded) audio cannot be stream-copied
+                    codecs['acodec'] = 'aac'
             else:
-                audio_input = ffmpeg.input(audio_file)
+                audio_stream = ffmpeg.input(audio_file).audio
+            
+            message = 'Merging audio and video...'
+            if codecs['vcodec'] == 'copy':
+                message = 'Merging audio and video (stream copy)...'
+            elif stream_options:
+                stream_options.update(keyframe_options())
+            else:
+                # Long videos are encoded on parallel processes first, then muxed as is
+                segment_list = self._encode_in_segments(task_id, video_file, video_duration, codecs['vcodec'],
+                                                        options, 'merge_audio_video', output_folder)
+                if segment_list:
+                    video_input = ffmpeg.input(segment_list, f='concat', safe=0)
+                    codecs['vcodec'] = 'copy'
             
             # Merge audio and video
+            codecs = intermediate_codecs(options, codecs)
             output = ffmpeg.output(
-                video_input,
-                audio_input,
+                video_input.video,
+                audio_stream,
                 output_path,
-                vcodec='libx264',
-                acodec='aac',
-                t=video_duration  # Limit to video duration
+                t=video_duration,  # Limit to video duration
+                **codecs,
+                **encoder_options(options, 'merge_audio_video', codecs),
+                **stream_options
             )
             
-            ffmpeg.run(output, overwrite_output=True, quiet=True)
+            self._run_ffmpeg(task_id, output, video_duration, message)
             
             return output_file
         
         except Exception as e:
             raise Exception(f"Failed to merge audio and video: {str(e)}")
+        finally:
+            if concat_list:
+                os.remove(concat_list)
+            if segment_list:
+                shutil.rmtree(os.path.dirname(segment_list), ignore_errors=True)
     
     def _merge_audio_tracks(self, files: List[Dict], options: Dict, 
                            upload_folder: str, output_folder: str, task_id: str) -> str:
         """Merge multiple audio tracks"""
-        audio_files = []
-        
-        # Find all audio files
-        for file in files:
-            if file['file_type'] == 'audio':
-                audio_files.append(os.path.join(upload_folder, file['saved_name']))
-        
-        if len(audio_files) < 2:
-            raise ValueError("At least 2 audio files are required for merging")
+        audio_files = self._audio_tracks(files, upload_folder)
         
         # Generate output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"merged_audio_{timestamp}.mp3"
+        output_file = output_name(options, f"merged_audio_{timestamp}.mp3")
         output_path = os.path.join(output_folder, output_file)
         
-        self._update_task_status(task_id, 'processing', 50, 'Merging audio tracks...')
-        
+        work_dir = tempfile.mkdtemp(prefix='.mix_', dir=output_folder)
         try:
-            # Create input streams
-            inputs = [ffmpeg.input(audio_file) for audio_file in audio_files]
+            mixed, output_duration = self._mixed_audio(task_id, audio_files, options, work_dir)
+            codecs = intermediate_codecs(options, {'acodec': 'libmp3lame'})
+            audio_options = dict(codecs, **encoder_options(options, 'merge_audio_tracks', codecs))
+            # Durations the probe could not report leave the end to amix
+            trim = {'t': output_duration} if output_duration else {}
+            output = ffmpeg.output(mixed, output_path, **trim, **audio_options)
             
-            # Mix audio streams
-            if options.get('mix_mode') == 'concatenate':
-                # Concatenate audio files
-                output = ffmpeg.concat(*inputs, v=0, a=1).output(output_path)
-            else:
-                # Mix audio files (overlay)
-                mixed = ffmpeg.filter(inputs, 'amix', inputs=len(inputs))
-                output = ffmpeg.output(mixed, output_path)
-            
-            ffmpeg.run(output, overwrite_output=True, quiet=True)
+            self._run_ffmpeg(task_id, output, output_duration, f'Merging {len(audio_files)} audio tracks...')
             
             return output_file
         
         except Exception as e:
             raise Exception(f"Failed to merge audio tracks: {str(e)}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    @staticmethod
+    def _audio_tracks(files: List[Dict], upload_folder: str) -> List[str]:
+        """Paths of the audio files a merge_audio_tracks job mixes"""
+        audio_files = [os.path.join(upload_folder, file['saved_name'])
+                       for file in files if file['file_type'] == 'audio']
+        if len(audio_files) < 2:
+            raise ValueError("At least 2 audio files are required for merging")
+        return audio_files
+    
+    def _mixed_audio(self, task_id: str, audio_files: List[str], options: Dict, work_dir: str):
+        """The merged tracks as an unencoded stream, and the length to trim it to (None if unknown).
+        
+        Measurement passes and sub-mixes run right away; their files go in
+        ``work_dir``, which must outlive the run of the returned stream.
+        """
+        durations = [media_duration(probe_media(audio_file)) or 0.0 for audio_file in audio_files]
+        settings = track_settings(options, len(audio_files))
+        targets = loudnorm_targets(options)
+        measurements = [None] * len(audio_files)
+        if targets:
+            measurements = self._measure_loudness(task_id, audio_files, durations, targets)
+        
+        # Every track in one sample rate and layout, with its loudness, gain and offset applied
+        streams = [track_stream(audio_file, track, targets, measurement)
+                   for audio_file, track, measurement in zip(audio_files, settings, measurements)]
+        ends = [track['offset'] + duration for track, duration in zip(settings, durations)]
+        
+        if options.get('mix_mode') == 'concatenate':
+            # Concatenate audio files; offsets become silence before a track
+            return ffmpeg.concat(*streams, v=0, a=1), sum(ends) if all(durations) else None
+        
+        # Mix audio files (overlay)
+        output_duration = mix_duration(ends, duration_policy(options))
+        if len(streams) > MIX_FANIN:
+            streams = self._submix(task_id, streams, ends, work_dir)
+        mixed = mix_streams(streams)
+        if targets:
+            # The per-track pass only levels the tracks against each other
+            mix_path = os.path.join(work_dir, 'mix.wav')
+            report = self._run_ffmpeg(
+                task_id, measured_mix_command(mixed, mix_path, targets, output_duration),
+                output_duration, f'Mixing {len(audio_files)} audio tracks and measuring loudness...'
+            )
+            mixed = track_stream(mix_path, targets=targets, measurement=parse_measurement(report))
+        return mixed, output_duration or None
+    
+    def _measure_loudness(self, task_id: str, audio_files: List[str], durations: List[float],
+                          targets: Dict[str, float]) -> List[Dict[str, str]]:
+        """First loudnorm pass for each input, run in parallel and cached per file version"""
+        measurements = [cached_measurement(audio_file, targets) for audio_file in audio_files]
+        missing = [index for index, measurement in enumerate(measurements) if measurement is None]
+        if missing:
+            reports = self._run_ffmpeg_parallel(
+                task_id, [measure_command(audio_files[index], targets) for index in missing],
+                sum(durations[index] for index in missing),
+                f'Measuring loudness of {len(missing)} tracks...', MIX_PARALLELISM
+            )
+            for index, report in zip(missing, reports):
+                measurements[index] = parse_measurement(report)
+                store_measurement(audio_files[index], targets, measurements[index])
+        return measurements
+    
+    def _submix(self, task_id: str, streams: List, ends: List[float], work_dir: str) -> List:
+        """Mix groups of MIX_FANIN streams into intermediate files until one amix can take the rest"""
+        level = 0
+        while len(streams) > MIX_FANIN:
+            level += 1
+            commands = []
+            paths = []
+            group_ends = []
+            for number, group in enumerate(submix_groups(len(streams))):
+                path = os.path.join(work_dir, f'submix_{level}_{number:03d}.wav')
+                commands.append(ffmpeg.output(
+                    mix_streams([streams[index] for index in group]), path, acodec=SUBMIX_CODEC
+                ))
+                paths.append(path)
+                group_ends.append(max(ends[index] for index in group))
+            self._run_ffmpeg_parallel(task_id, commands, sum(group_ends),
+                                      f'Pre-mixing {len(streams)} tracks in {len(commands)} groups...',
+                                      MIX_PARALLELISM)
+            streams = [track_stream(path) for path in paths]
+            ends = group_ends
+        return streams
     
     def _audio_to_image(self, files: List[Dict], options: Dict, 
                        upload_folder: str, output_folder: str, task_id: str) -> str:
         """Combine audio with image (create video with static image)"""
         audio_file = None
+        audio_probe = None
         image_file = None
         
         # Find audio and image files
         for file in files:
             if file['file_type'] == 'audio':
                 audio_file = os.path.join(upload_folder, file['saved_name'])
+                audio_probe = file.get('piped_probe')
             elif file['file_type'] == 'image':
                 image_file = os.path.join(upload_folder, file['saved_name'])
         
@@ -252,41 +878,40 @@ class ProcessingManager:
         
         # Generate output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"audio_image_{timestamp}.mp4"
-        output_path = os.path.join(output_folder, output_file)
-        
-        self._update_task_status(task_id, 'processing', 50, 'Creating video from audio and image...')
+        output_file, output_path, stream_options = self._output_target(
+            task_id, options, output_folder, f"audio_image_{timestamp}.mp4"
+        )
+        if stream_options:
+            stream_options.update(keyframe_options())
         
+        still_fd, still_path = tempfile.mkstemp(prefix=f'still_{task_id}_', suffix='.png')
+        os.close(still_fd)
         try:
-            # Use subprocess to get audio duration
-            probe_cmd = [
-                'ffprobe', '-v', 'quiet', '-print_format', 'json', 
-                '-show_format', '-show_streams', audio_file
-            ]
-            result = subprocess.run(probe_cmd, capture_output=True, text=True)
-            import json
-            probe_data = json.loads(result.stdout)
-            audio_duration = float(probe_data['format']['duration'])
-            
-            # Create video from static image and audio using subprocess
-            ffmpeg_cmd = [
-                'ffmpeg', '-y',
-                '-loop', '1', '-i', image_file,
-                '-i', audio_file,
-                '-c:v', 'libx264',
-                '-c:a', 'aac',
-                '-t', str(audio_duration),
-                '-pix_fmt', 'yuv420p',
-                '-r', '1',
-                output_path
-            ]
-            
-            subprocess.run(ffmpeg_cmd, check=True, capture_output=True)
+            # Only used for progress and codec choice; -shortest ends the video with the audio
+            audio_probe = audio_probe or known_probe(audio_file) or {}
+            audio_duration = media_duration(audio_probe)
+            codecs = {'vcodec': 'libx264', 'acodec': 'aac'}
+            codecs.update(negotiate_codecs(
+                stream_codecs(audio_probe), {'acodec': 'aac'},
+                force_reencode=options.get('force_reencode', False)
+            ))
+            
+            codecs = intermediate_codecs(options, codecs)
+            
+            self._run_ffmpeg(task_id, prescale_command(image_file, still_path), None, 'Preparing image...')
+            
+            output_args = as_argv(encoder_options(options, 'audio_to_image', codecs)) + as_argv(stream_options)
+            ffmpeg_cmd = still_video_command(still_path, audio_file, output_path, codecs['acodec'], output_args,
+                                             video_codec=codecs['vcodec'])
+            
+            self._run_ffmpeg(task_id, ffmpeg_cmd, audio_duration, 'Creating video from audio and image...')
             
             return output_file
         
         except Exception as e:
             raise Exception(f"Failed to create video from audio and image: {str(e)}")
+        finally:
+            os.remove(still_path)
     
     def _convert_format(self, files: List[Dict], options: Dict, 
                        upload_folder: str, output_folder: str, task_id: str) -> str:
@@ -295,36 +920,134 @@ class ProcessingManager:
             raise ValueError("Format conversion requires exactly one file")
         
         input_file = os.path.join(upload_folder, files[0]['saved_name'])
+        if options.get('targets'):
+            return self._convert_to_targets(input_file, files[0]['saved_name'], options, output_folder, task_id)
         target_format = options.get('target_format', 'mp4')
         
         # Generate output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_name = os.path.splitext(files[0]['saved_name'])[0]
-        output_file = f"{base_name}_converted_{timestamp}.{target_format}"
-        output_path = os.path.join(output_folder, output_file)
-        
-        self._update_task_status(task_id, 'processing', 50, f'Converting to {target_format}...')
+        base_name = os.path.splitext(os.path.basename(files[0]['saved_name']))[0]
+        output_file, output_path, stream_options = self._output_target(
+            task_id, options, output_folder, f"{base_name}_converted_{timestamp}.{target_format}"
+        )
         
+        segment_list = None
         try:
+            probe = probe_media(input_file)
+            duration = media_duration(probe)
             input_stream = ffmpeg.input(input_file)
             
             # Set codec based on target format
-            codec_map = {
-                'mp4': {'vcodec': 'libx264', 'acodec': 'aac'},
-                'mp3': {'acodec': 'mp3'},
-                'wav': {'acodec': 'pcm_s16le'},
-                'avi': {'vcodec': 'libx264', 'acodec': 'mp3'}
-            }
+            codecs = {}
+            message = f'Converting to {target_format}...'
+            if target_format in FORMAT_CODECS:
+                # Remux instead of transcoding streams that already use the target codec
+                source_codecs = stream_codecs(probe)
+                codecs = negotiate_codecs(
+                    source_codecs, FORMAT_CODECS[target_format],
+                    force_reencode=options.get('force_reencode', False)
+                )
+                if target_format in AUDIO_ONLY_FORMATS and 'video' in source_codecs:
+                    codecs['vn'] = None
+                if codecs and all(codec in ('copy', None) for codec in codecs.values()):
+                    message = f'Remuxing to {target_format}...'
+            streams = [input_stream]
+            if stream_options and codecs.get('vcodec') != 'copy':
+                stream_options.update(keyframe_options())
+            elif target_format == 'mp4' and codecs.get('vcodec') == 'libx264':
+                # Long videos are encoded on parallel processes first; audio is handled once, here
+                segment_list = self._encode_in_segments(task_id, input_file, duration, codecs['vcodec'],
+                                                        options, 'convert_format', output_folder)
+                if segment_list:
+                    streams = [ffmpeg.input(segment_list, f='concat', safe=0).video, input_stream['a:0?']]
+                    codecs['vcodec'] = 'copy'
             
-            codecs = codec_map.get(target_format, {})
-            output = ffmpeg.output(input_stream, output_path, **codecs)
+            codecs = intermediate_codecs(options, codecs)
+            output = ffmpeg.output(*streams, output_path, **codecs,
+                                   **encoder_options(options, 'convert_format', codecs), **stream_options)
             
-            ffmpeg.run(output, overwrite_output=True, quiet=True)
+            self._run_ffmpeg(task_id, output, duration, message)
             
             return output_file
         
         except Exception as e:
             raise Exception(f"Failed to convert format: {str(e)}")
+        finally:
+            if segment_list:
+                shutil.rmtree(os.path.dirname(segment_list), ignore_errors=True)
+    
+    def _convert_to_targets(self, input_file: str, saved_name: str, options: Dict,
+                            output_folder: str, task_id: str) -> List[Dict[str, Any]]:
+        """Write every rendition in ``options['targets']`` from a single decode of the input"""
+        targets = parse_targets(options['targets'])
+        if options.get('streaming'):
+            raise ValueError("Streaming output is not available with multiple targets")
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = os.path.splitext(os.path.basename(saved_name))[0]
+        
+        try:
+            probe = probe_media(input_file)
+            duration = media_duration(probe)
+            source_codecs = stream_codecs(probe)
+            input_stream = ffmpeg.input(input_file)
+            
+            # Per target: which streams it takes, and whether each is copied or needs decoded frames
+            plans = []
+            for target in targets:
+                codecs = negotiate_codecs(
+                    source_codecs, FORMAT_CODECS[target['format']],
+                    force_reencode=options.get('force_reencode', False)
+                )
+                if target['height'] and 'vcodec' in codecs:
+                    codecs['vcodec'] = FORMAT_CODECS[target['format']]['vcodec']
+                if not codecs:
+                    raise ValueError(f"Input has no streams for a {target['format']} output")
+                plans.append((target, codecs))
+            
+            # One decode per stream type, split between the targets that re-encode it
+            decoded = {}
+            for stream_type, option in (('video', 'vcodec'), ('audio', 'acodec')):
+                consumers = sum(1 for _, codecs in plans if codecs.get(option, 'copy') != 'copy')
+                source = input_stream.video if stream_type == 'video' else input_stream.audio
+                if consumers > 1:
+                    split = source.filter_multi_output('split' if stream_type == 'video' else 'asplit', consumers)
+                    decoded[stream_type] = iter([split[index] for index in range(consumers)])
+                else:
+                    decoded[stream_type] = iter([source])
+            
+            outputs = []
+            results = []
+            for target, codecs in plans:
+                streams = []
+                if 'vcodec' in codecs:
+                    if codecs['vcodec'] == 'copy':
+                        streams.append(input_stream.video)
+                    else:
+                        video = next(decoded['video'])
+                        if target['height']:
+                            video = video.filter('scale', -2, target['height'])
+                        streams.append(video)
+                if 'acodec' in codecs:
+                    streams.append(input_stream.audio if codecs['acodec'] == 'copy' else next(decoded['audio']))
+                
+                output_options = encoder_options(options, 'convert_format', codecs)
+                if self.executor.threads:
+                    # The executor only adds the thread budget to the last output
+                    output_options.setdefault('threads', self.executor.threads)
+                output_file = f"{base_name}_converted_{timestamp}_{target['label']}.{target['format']}"
+                outputs.append(ffmpeg.output(
+                    *streams, os.path.join(output_folder, output_file), **codecs, **output_options
+                ))
+                results.append({'label': target['label'], 'format': target['format'], 'output_file': output_file})
+            
+            self._run_ffmpeg(task_id, ffmpeg.merge_outputs(*outputs), duration,
+                             f'Converting to {len(targets)} outputs in one pass...')
+            
+            return results
+        
+        except Exception as e:
+            raise Exception(f"Failed to convert format: {str(e)}")
     
     def _loop_audio(self, files: List[Dict], options: Dict, 
                    upload_folder: str, output_folder: str, task_id: str) -> str:
@@ -333,30 +1056,222 @@ class ProcessingManager:
             raise ValueError("Audio looping requires exactly one audio file")
         
         input_file = os.path.join(upload_folder, files[0]['saved_name'])
-        loop_duration = options.get('duration', 60)  # Default 60 seconds
+        duration = loop_duration(options)
+        crossfade = crossfade_seconds(options)
         
         # Generate output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_name = os.path.splitext(files[0]['saved_name'])[0]
-        output_file = f"{base_name}_looped_{timestamp}.mp3"
+        base_name = os.path.splitext(os.path.basename(files[0]['saved_name']))[0]
+        output_file = output_name(options, f"{base_name}_looped_{timestamp}.mp3")
         output_path = os.path.join(output_folder, output_file)
         
-        self._update_task_status(task_id, 'processing', 50, f'Looping audio for {loop_duration} seconds...')
-        
+        concat_list = None
         try:
-            # Get original audio duration
-            audio_probe = ffmpeg.probe(input_file)
-            original_duration = float(audio_probe['streams'][0]['duration'])
+            probe = probe_media(input_file)
+            
+            # MP3 sources are repeated packet for packet instead of being re-encoded
+            codecs = negotiate_codecs(
+                stream_codecs(probe), {'acodec': 'libmp3lame'},
+                force_reencode=options.get('force_reencode', False)
+            )
+            audio_codec = codecs.get('acodec', 'libmp3lame')
+            audio_stream, concat_list, loop_mode = looped_audio(
+                input_file, probe, duration, copy=audio_codec == 'copy', crossfade=crossfade
+            )
+            if loop_mode in ('aloop', 'stream_loop'):
+                audio_codec = 'libmp3lame'
             
-            # Calculate loop count
-            loop_count = int(loop_duration / original_duration) + 1
+            message = f'Looping audio for {duration:g} seconds...'
+            if audio_codec == 'copy':
+                message = f'Looping audio for {duration:g} seconds (stream copy)...'
             
-            input_stream = ffmpeg.input(input_file, stream_loop=loop_count)
-            output = ffmpeg.output(input_stream, output_path, t=loop_duration)
+            audio_codec = intermediate_codecs(options, {'acodec': audio_codec})['acodec']
+            output = ffmpeg.output(
+                audio_stream, output_path, t=duration, acodec=audio_codec,
+                **encoder_options(options, 'loop_audio', {'acodec': audio_codec})
+            )
             
-            ffmpeg.run(output, overwrite_output=True, quiet=True)
+            self._run_ffmpeg(task_id, output, duration, message)
             
             return output_file
         
         except Exception as e:
             raise Exception(f"Failed to loop audio: {str(e)}")
+        finally:
+            if concat_list:
+                os.remove(concat_list)
+    
+    def _run_pipeline(self, files: List[Dict], options: Dict,
+                      upload_folder: str, output_folder: str, task_id: str):
+        """Run a DAG of operations as one job (see pipeline.py).
+        
+        Fused audio chains run as one filter graph. An audio stage marked
+        ``pipe`` streams into its reader over a FIFO; other stages that feed
+        later ones write lossless intermediates into a work directory that is
+        removed afterwards. Only the last stage writes to the output folder,
+        so its encode is the only lossy one.
+        """
+        stages = plan_pipeline(files, options)
+        work_dir = os.path.abspath(tempfile.mkdtemp(prefix='.pipeline_', dir=output_folder))
+        produced = {}  # stage id -> file record of its intermediate output
+        try:
+            for number, stage in enumerate(stages, start=1):
+                stage_files = []
+                for ref in stage['inputs']:
+                    record = dict(produced[ref['stage']] if 'stage' in ref else ref['file'])
+                    if ref.get('file_type'):
+                        record['file_type'] = ref['file_type']
+                    stage_files.append(record)
+                
+                stage_options = stage['options'] if stage['final'] else dict(stage['options'], intermediate=True)
+                stage_folder = output_folder if stage['final'] else work_dir
+                self._pipeline_stages[task_id] = (number, len(stages), stage['operation'])
+                try:
+                    if stage.get('pipe'):
+                        produced[stage['id']] = self._pipe_audio_chain(stage, stage_files, upload_folder,
+                                                                       work_dir, task_id)
+                        continue
+                    if stage.get('chain'):
+                        result = self._run_audio_chain(stage['chain'], stage_files, stage_options, upload_folder,
+                                                       stage_folder, work_dir, task_id)
+                    else:
+                        result = self._operation(stage['operation'])(
+                            stage_files, stage_options, upload_folder, stage_folder, task_id
+                        )
+                finally:
+                    self._pipeline_stages.pop(task_id, None)
+                
+                if not stage['final']:
+                    # An absolute saved_name makes os.path.join ignore the upload folder
+                    produced[stage['id']] = {
+                        'saved_name': os.path.join(work_dir, result),
+                        'original_name': result,
+                        'file_type': stage['output_type']
+                    }
+            return result
+        finally:
+            self._pipe_feeds.pop(task_id, None)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def _audio_chain(self, chain: List[Dict[str, Any]], files: List[Dict], upload_folder: str,
+                     work_dir: str, task_id: str):
+        """Fused audio stages as one unencoded stream, with its length (None if unknown) and a file name stem.
+        
+        The first stage reads ``files``; each later one works on the decoded
+        output of the one before it. Passes that must finish first (loudness
+        measurement, sub-mixes, sources too long to loop in memory) run right
+        away and leave their files in ``work_dir``.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        head = chain[0]
+        if head['operation'] == 'merge_audio_tracks':
+            stream, duration = self._mixed_audio(task_id, self._audio_tracks(files, upload_folder),
+                                                 head['options'], work_dir)
+            stem = f"merged_audio_{timestamp}"
+        else:
+            if len(files) != 1 or files[0]['file_type'] != 'audio':
+                raise ValueError("Audio looping requires exactly one audio file")
+            input_file = os.path.join(upload_folder, files[0]['saved_name'])
+            duration = loop_duration(head['options'])
+            stream, _, _ = looped_audio(input_file, probe_media(input_file), duration,
+                                        crossfade=crossfade_seconds(head['options']))
+            stem = f"{os.path.splitext(os.path.basename(files[0]['saved_name']))[0]}_looped_{timestamp}"
+        
+        for stage in chain[1:]:
+            if stage['operation'] == 'convert_format':
+                # Only changes the encode at the end
+                stem = f"{stem}_converted"
+                continue
+            if not duration:
+                raise ValueError("Could not determine the duration of the audio to loop")
+            target = loop_duration(stage['options'])
+            crossfade = crossfade_seconds(stage['options'])
+            if duration > LOOP_BUFFER_MAX_SECONDS and target > duration:
+                # Too long to repeat in memory: render it once and loop the file
+                source_path = os.path.join(work_dir, f"{stage['id']}_source.wav")
+                self._run_ffmpeg(task_id, ffmpeg.output(stream, source_path, acodec=SUBMIX_CODEC, t=duration),
+                                 duration, 'Rendering audio to loop...')
+                stream, _, _ = looped_audio(source_path, probe_media(source_path), target, crossfade=crossfade)
+            else:
+                stream = looped_stream(stream, duration, target, MIX_SAMPLE_RATE, crossfade)
+            stem = f"{stem}_looped"
+            duration = target
+        return stream, duration, stem
+    
+    def _run_audio_chain(self, chain: List[Dict[str, Any]], files: List[Dict], options: Dict,
+                         upload_folder: str, output_folder: str, work_dir: str, task_id: str) -> str:
+        """Run fused audio stages (see pipeline.py) with a single encode, using the last stage's ``options``"""
+        try:
+            stream, duration, stem = self._audio_chain(chain, files, upload_folder, work_dir, task_id)
+            last = chain[-1]
+            extension = 'mp3'
+            codecs = {'acodec': 'libmp3lame'}
+            if last['operation'] == 'convert_format':
+                extension = options.get('target_format', 'mp4')
+                codecs = {'acodec': FORMAT_CODECS[extension]['acodec']} if extension in FORMAT_CODECS else {}
+            
+            codecs = intermediate_codecs(options, codecs)
+            output_file = output_name(options, f"{stem}.{extension}")
+            trim = {'t': duration} if duration else {}
+            output = ffmpeg.output(stream, os.path.join(output_folder, output_file), **trim, **codecs,
+                                   **encoder_options(options, last['operation'], codecs))
+            
+            self._run_ffmpeg(task_id, output, duration, f'Running {len(chain)} audio stages in one pass...')
+            
+            return output_file
+        
+        except Exception as e:
+            raise Exception(f"Failed to run audio stages: {str(e)}")
+    
+    def _pipe_audio_chain(self, stage: Dict[str, Any], files: List[Dict], upload_folder: str,
+                          work_dir: str, task_id: str) -> Dict[str, Any]:
+        """Queue an audio stage to stream into the one stage that reads it; returns the FIFO's file record.
+        
+        Nothing is encoded yet: the stage's graph writes float PCM in NUT to
+        the FIFO while its reader runs (see ``_run_ffmpeg``), so the audio
+        never reaches the disk.
+        """
+        try:
+            stream, duration, _ = self._audio_chain(stage.get('chain') or [stage], files, upload_folder,
+                                                    work_dir, task_id)
+        except Exception as e:
+            raise Exception(f"Failed to prepare audio stages: {str(e)}")
+        fifo = os.path.join(work_dir, f"{stage['id']}.nut")
+        os.mkfifo(fifo)
+        trim = {'t': duration} if duration else {}
+        self._pipe_feeds.setdefault(task_id, {})[fifo] = ffmpeg.output(
+            stream, fifo, format='nut', acodec=SUBMIX_CODEC, **trim
+        )
+        probe = {'streams': [{'codec_type': 'audio', 'codec_name': SUBMIX_CODEC}]}
+        if duration:
+            probe['format'] = {'duration': str(duration)}
+        return {
+            'saved_name': fifo,
+            'original_name': os.path.basename(fifo),
+            'file_type': 'audio',
+            'piped_probe': probe
+        }
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager(max_workers: Optional[int] = None, cache_max_bytes: Optional[int] = None,
+                run_workers: bool = True, recover: bool = True) -> ProcessingManager:
+    """The process's one ProcessingManager, shared by both web fronts.
+    
+    The first call creates it (its arguments win) and re-queues work left
+    over from a previous run. Later calls, such as the Flask routes being
+    imported under the FastAPI front, get the same manager, so recovered
+    tasks are submitted to a single worker pool.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            return _manager
+        _manager = ProcessingManager(max_workers=max_workers, cache_max_bytes=cache_max_bytes,
+                                     run_workers=run_workers)
+    # Outside the lock: recovery imports the Flask app, whose routes call back in here
+    if recover:
+        _manager.recover_tasks()
+    return _manager
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+from datetime import datetime
+from typing import Dict, Optional
+
+# Sessions live next to finished uploads so the final rename stays on one filesystem
+PARTIAL_DIRNAME = '.partial'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ResumableUploadError(Exception):
+    """Upload session request that cannot be honoured; carries the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkWriter:
+    """Appends one request body to an upload session, holding an exclusive lock on it"""
+
+    def __init__(self, part_file, length: int):
+        self.part_file = part_file
+        self.length = length
+        self.offset = part_file.tell()
+
+    def write(self, data: bytes):
+        if self.offset + len(data) > self.length:
+            raise ResumableUploadError('Chunk extends past the declared upload length', 413)
+        self.part_file.write(data)
+        self.offset += len(data)
+
+    def close(self) -> int:
+        """Flush, release the lock and return the new offset"""
+        self.part_file.flush()
+        os.fsync(self.part_file.fileno())
+        fcntl.flock(self.part_file, fcntl.LOCK_UN)
+        self.part_file.close()
+        return self.offset
+
+
+class ResumableUploadStore:
+    """tus-style upload sessions kept on disk.
+
+    Each session is a ``<id>.json`` metadata file and a ``<id>.part`` data
+    file. The size of the data file is the authoritative offset, so sessions
+    survive restarts and are visible to every worker sharing the folder.
+    """
+
+    def __init__(self, upload_folder: str, max_size: int):
+        self.upload_folder = upload_folder
+        self.partial_folder = os.path.join(upload_folder, PARTIAL_DIRNAME)
+        self.max_size = max_size
+        os.makedirs(self.partial_folder, exist_ok=True)
+
+    def _paths(self, upload_id: str):
+        # Reject anything that is not one of our ids before touching the filesystem
+        try:
+            upload_id = str(uuid.UUID(upload_id))
+        except ValueError:
+            raise ResumableUploadError('Upload session not found', 404)
+        base = os.path.join(self.partial_folder, upload_id)
+        return base + '.json', base + '.part'
+
+    def create(self, filename: str, file_type: str, length: int) -> Dict:
+        """Open a new session for ``length`` bytes"""
+        if length < 0:
+            raise ResumableUploadError('Upload length must not be negative')
+        if length > self.max_size:
+            raise ResumableUploadError('File too large. Maximum size is 500MB.', 413)
+
+        upload_id = str(uuid.uuid4())
+        meta_path, part_path = self._paths(upload_id)
+        meta = {
+            'upload_id': upload_id,
+            'original_name': filename,
+            'file_type': file_type,
+            'length': length,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        return dict(meta, offset=0)
+
+    def get(self, upload_id: str) -> Dict:
+        """Session metadata with the current offset"""
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise ResumableUploadError('Upload session not found', 404)
+        return meta
+
+    def open_chunk(self, upload_id: str, offset: Optional[int]) -> ChunkWriter:
+        """Start appending at ``offset``, which must equal the current offset"""
+        meta = self.get(upload_id)
+        if offset is None:
+            raise ResumableUploadError('Upload-Offset header is required')
+
+        _, part_path = self._paths(upload_id)
+        part_file = open(part_path, 'ab')
+        try:
+            fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            part_file.close()
+            raise ResumableUploadError('Another chunk is being written to this upload', 409)
+
+        current = part_file.seek(0, os.SEEK_END)
+        if offset != current:
+            fcntl.flock(part_file, fcntl.LOCK_UN)
+            part_file.close()
+            raise ResumableUploadError(f'Offset mismatch: upload is at byte {current}', 409)
+        return ChunkWriter(part_file, meta['length'])
+
+    def complete(self, upload_id: str, saved_name: str) -> Dict:
+        """Move a fully received upload into the upload folder and return its file record"""
+        meta = self.get(upload_id)
+        if meta['offset'] != meta['length']:
+            raise ResumableUploadError(
+                f"Upload incomplete: {meta['offset']} of {meta['length']} bytes received", 409
+            )
+
+        meta_path, part_path = self._paths(upload_id)
+        hasher = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ResumableUploadError('Another chunk is being written to this upload', 409)
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+            os.replace(part_path, os.path.join(self.upload_folder, saved_name))
+            os.remove(meta_path)
+        return {
+            'original_name': meta['original_name'],
+            'saved_name': saved_name,
+            'file_type': meta['file_type'],
+            'size': meta['length'],
+            'sha256': hasher.hexdigest()
+        }
+
+    def cleanup(self, max_age_seconds: int) -> int:
+        """Remove sessions that have not received data for ``max_age_seconds``"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.partial_folder):
+            if not name.endswith('.json'):
+                continue
+            meta_path, part_path = self._paths(name[:-len('.json')])
+            paths = [path for path in (meta_path, part_path) if os.path.exists(path)]
+            if now - max(os.path.getmtime(path) for path in paths) > max_age_seconds:
+                for path in paths:
+                    os.remove(path)
+                removed += 1
+        return removed
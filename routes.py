@@ -1,16 +1,34 @@
 import os
+import json
 import uuid
 import asyncio
+import hashlib
 from datetime import datetime
-from flask import render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import render_template, request, jsonify, send_file, flash, redirect, url_for, Response
 from werkzeug.utils import secure_filename
 from app import app
 from models import db, ProcessingTask, UploadedFile, ProcessingHistory
-from processing import ProcessingManager
+from processing import get_manager, TERMINAL_STATUSES, expand_batch
+from resumable import ResumableUploadStore, ResumableUploadError
+from content_store import store_upload, stored_content_hash
+from probe import probe_media, probe_summary, try_probe_summary
+from downloads import wants_inline, media_type, offload_headers, resolve_output_path
+from streaming import STREAM_FILES, stream_url, stream_file_path, tail_file, cleanup_streams
+from peaks import PEAKS_SUFFIX, PeaksUnavailable, ensure_peaks, schedule_peaks, peaks_response
+from previews import load_previews, cleanup_previews
 import logging
 
-# Initialize processing manager
-processing_manager = ProcessingManager()
+# The process's shared processing manager (the FastAPI front may have created it already);
+# its first use picks up work left over from a previous run
+processing_manager = get_manager(
+    max_workers=app.config['MAX_CONCURRENT_JOBS'],
+    cache_max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    run_workers=app.config['RUN_ENCODE_WORKERS']
+)
+
+# Resumable (chunked) upload sessions
+resumable_uploads = ResumableUploadStore(app.config['UPLOAD_FOLDER'], app.config['MAX_CONTENT_LENGTH'])
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {
@@ -31,6 +49,29 @@ def generate_unique_filename(original_filename):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"{name}_{timestamp}_{unique_id}{ext}"
 
+def save_upload(file, file_path):
+    """Write an uploaded file to disk in chunks and return its SHA-256"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'wb') as out:
+        while True:
+            chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            out.write(chunk)
+    return hasher.hexdigest()
+
+def store_probe_metadata(uploaded_file, upload_path):
+    """Copy ffprobe metadata onto an UploadedFile row (cached since upload time)"""
+    try:
+        probe = probe_media(upload_path)
+    except Exception as e:
+        logging.warning(f"Could not probe {upload_path}: {str(e)}")
+        return
+    for field, value in probe_summary(probe).items():
+        setattr(uploaded_file, field, value)
+    uploaded_file.probe_json = json.dumps(probe)
+
 @app.route('/')
 def index():
     """Main page with upload forms and processing options"""
@@ -56,16 +97,23 @@ def upload_files():
                     file_type = 'unknown'
                 
                 if allowed_file(file.filename, file_type):
-                    filename = generate_unique_filename(file.filename)
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    file_size = os.path.getsize(file_path)
+                    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], generate_unique_filename(file.filename))
+                    sha256 = save_upload(file, temp_path)
+                    file_size = os.path.getsize(temp_path)
+                    
+                    # Identical content is stored once, under its hash
+                    filename = store_upload(temp_path, app.config['UPLOAD_FOLDER'], sha256, file.filename)
+                    if file_type == 'audio':
+                        schedule_peaks(os.path.join(app.config['UPLOAD_FOLDER'], filename))
                     
                     uploaded_files.append({
                         'original_name': file.filename,
                         'saved_name': filename,
                         'file_type': file_type,
-                        'size': file_size
+                        'size': file_size,
+                        'sha256': sha256,
+                        # Probing now also warms the probe cache for /process
+                        'metadata': try_probe_summary(os.path.join(app.config['UPLOAD_FOLDER'], filename))
                     })
                 else:
                     return jsonify({
@@ -85,6 +133,107 @@ def upload_files():
             'error': f'Upload failed: {str(e)}'
         }), 500
 
+def detect_file_type(filename, file_type):
+    """Resolve an 'unknown' file type from the file extension"""
+    if file_type in ALLOWED_EXTENSIONS:
+        return file_type
+    ext = filename.rsplit('.', 1)[-1].lower()
+    for ftype, extensions in ALLOWED_EXTENSIONS.items():
+        if ext in extensions:
+            return ftype
+    return 'unknown'
+
+def upload_session_response(session, status_code=200):
+    """JSON body plus tus-style offset headers for an upload session"""
+    response = jsonify({
+        'success': True,
+        'upload_id': session['upload_id'],
+        'offset': session['offset'],
+        'length': session['length']
+    })
+    response.status_code = status_code
+    response.headers['Upload-Offset'] = str(session['offset'])
+    response.headers['Upload-Length'] = str(session['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload; body: {filename, file_type, size}"""
+    try:
+        data = request.get_json() or {}
+        filename = data.get('filename')
+        if not filename or 'size' not in data:
+            return jsonify({'success': False, 'error': 'filename and size are required'}), 400
+        
+        file_type = detect_file_type(filename, data.get('file_type', 'unknown'))
+        if not allowed_file(filename, file_type):
+            return jsonify({'success': False, 'error': f'File type not allowed for {filename}'}), 400
+        
+        session = resumable_uploads.create(filename, file_type, int(data['size']))
+        return upload_session_response(session, 201)
+    
+    except ResumableUploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except Exception as e:
+        logging.error(f"Upload session error: {str(e)}")
+        return jsonify({'success': False, 'error': f'Upload session failed: {str(e)}'}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Current offset of a resumable upload (HEAD returns just the headers)"""
+    try:
+        return upload_session_response(resumable_uploads.get(upload_id))
+    except ResumableUploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+
+@app.route('/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def upload_chunk(upload_id):
+    """Append the request body at the byte given by the Upload-Offset header"""
+    try:
+        offset = request.headers.get('Upload-Offset', type=int)
+        writer = resumable_uploads.open_chunk(upload_id, offset)
+        try:
+            while True:
+                chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        finally:
+            writer.close()
+        
+        return upload_session_response(resumable_uploads.get(upload_id))
+    
+    except ResumableUploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except Exception as e:
+        logging.error(f"Chunk upload error: {str(e)}")
+        return jsonify({'success': False, 'error': f'Chunk upload failed: {str(e)}'}), 500
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Finish a resumable upload and return the same file record as /upload"""
+    try:
+        session = resumable_uploads.get(upload_id)
+        file_record = resumable_uploads.complete(
+            upload_id, generate_unique_filename(session['original_name'])
+        )
+        file_record['saved_name'] = store_upload(
+            os.path.join(app.config['UPLOAD_FOLDER'], file_record['saved_name']),
+            app.config['UPLOAD_FOLDER'], file_record['sha256'], file_record['original_name']
+        )
+        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], file_record['saved_name'])
+        file_record['metadata'] = try_probe_summary(upload_path)
+        if file_record['file_type'] == 'audio':
+            schedule_peaks(upload_path)
+        return jsonify({'success': True, 'files': [file_record]})
+    
+    except ResumableUploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except Exception as e:
+        logging.error(f"Upload completion error: {str(e)}")
+        return jsonify({'success': False, 'error': f'Upload completion failed: {str(e)}'}), 500
+
 @app.route('/process', methods=['POST'])
 def process_files():
     """Process files based on operation type"""
@@ -93,6 +242,7 @@ def process_files():
         operation = data.get('operation')
         files = data.get('files', [])
         options = data.get('options', {})
+        priority = int(data.get('priority', 0))
         
         if not operation or not files:
             return jsonify({
@@ -115,14 +265,17 @@ def process_files():
         # Add uploaded files to database
         total_size = 0
         for file_info in files:
+            upload_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['saved_name'])
             uploaded_file = UploadedFile(
                 task_id=task_id,
                 original_name=file_info['original_name'],
                 saved_name=file_info['saved_name'],
                 file_type=file_info['file_type'],
                 file_size=file_info['size'],
-                upload_path=os.path.join(app.config['UPLOAD_FOLDER'], file_info['saved_name'])
+                upload_path=upload_path,
+                content_hash=stored_content_hash(upload_path, compute=False)
             )
+            store_probe_metadata(uploaded_file, upload_path)
             db.session.add(uploaded_file)
             total_size += file_info['size']
         
@@ -135,15 +288,19 @@ def process_files():
             files=files,
             options=options,
             upload_folder=app.config['UPLOAD_FOLDER'],
-            output_folder=app.config['OUTPUT_FOLDER']
+            output_folder=app.config['OUTPUT_FOLDER'],
+            priority=priority
         )
         
         if result['success']:
-            return jsonify({
+            response = {
                 'success': True,
                 'task_id': task_id,
-                'message': 'Processing started'
-            })
+                'message': 'Processing queued'
+            }
+            if options.get('streaming') in STREAM_FILES:
+                response['stream_url'] = stream_url(task_id, options['streaming'])
+            return jsonify(response)
         else:
             # Update task status to failed
             task.status = 'failed'
@@ -162,6 +319,92 @@ def process_files():
             'error': f'Processing failed: {str(e)}'
         }), 500
 
+@app.route('/batch', methods=['POST'])
+def process_batch():
+    """Queue many operations over a shared set of uploaded files in one request"""
+    try:
+        data = request.get_json() or {}
+        files = data.get('files', [])
+        priority = int(data.get('priority', 0))
+        
+        try:
+            jobs = expand_batch(files, data.get('jobs', []), data.get('options', {}))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        batch_id = str(uuid.uuid4())
+        for job in jobs:
+            job['task_id'] = str(uuid.uuid4())
+        
+        # All task and file rows go in a single transaction
+        for job in jobs:
+            db.session.add(ProcessingTask(
+                task_id=job['task_id'],
+                operation=job['operation'],
+                status='pending',
+                message='Task created, waiting to start...',
+                batch_id=batch_id,
+                priority=priority
+            ))
+            for file_info in job['files']:
+                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['saved_name'])
+                db.session.add(UploadedFile(
+                    task_id=job['task_id'],
+                    original_name=file_info['original_name'],
+                    saved_name=file_info['saved_name'],
+                    file_type=file_info['file_type'],
+                    file_size=file_info['size'],
+                    upload_path=upload_path,
+                    content_hash=stored_content_hash(upload_path, compute=False)
+                ))
+        db.session.commit()
+        
+        result = processing_manager.process_batch(
+            batch_id=batch_id,
+            jobs=jobs,
+            upload_folder=app.config['UPLOAD_FOLDER'],
+            output_folder=app.config['OUTPUT_FOLDER'],
+            priority=priority
+        )
+        
+        if result['success']:
+            return jsonify({
+                'success': True,
+                'batch_id': batch_id,
+                'task_ids': result['task_ids'],
+                'message': f'{len(jobs)} jobs queued'
+            })
+        else:
+            ProcessingTask.query.filter_by(batch_id=batch_id).update(
+                {'status': 'failed', 'error_message': result['error']}
+            )
+            db.session.commit()
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 400
+    
+    except Exception as e:
+        logging.error(f"Batch error: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'Batch failed: {str(e)}'
+        }), 500
+
+@app.route('/batch/<batch_id>')
+def get_batch_status(batch_id):
+    """Aggregate progress and per-task results for a batch"""
+    try:
+        status = processing_manager.get_batch_status(batch_id)
+        return jsonify(status)
+    except Exception as e:
+        logging.error(f"Batch status error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Batch status check failed: {str(e)}'
+        }), 500
+
 @app.route('/status/<task_id>')
 def get_status(task_id):
     """Get processing status for a task"""
@@ -175,16 +418,43 @@ def get_status(task_id):
             'error': f'Status check failed: {str(e)}'
         }), 500
 
-@app.route('/download/<filename>')
+@app.route('/cancel/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """Cancel a queued or running task"""
+    try:
+        result = processing_manager.cancel_task(task_id)
+        if result['success']:
+            return jsonify(result)
+        status_code = 404 if result['error'] == 'Task not found' else 409
+        return jsonify(result), status_code
+    except Exception as e:
+        logging.error(f"Cancel error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Cancel failed: {str(e)}'
+        }), 500
+
+@app.route('/download/<path:filename>')
 def download_file(filename):
-    """Download processed file"""
+    """Download processed file; ?inline=1 plays it in the browser instead.
+
+    Range requests (206) and ETag/Last-Modified conditional GETs are handled
+    by ``send_file``; with DOWNLOAD_OFFLOAD the front-end server sends the file.
+    """
     try:
-        file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-        if os.path.exists(file_path):
+        file_path = resolve_output_path(app.config['OUTPUT_FOLDER'], filename)
+        if file_path and os.path.isfile(file_path):
+            inline = wants_inline(request.args.get('inline'))
+            offload = offload_headers(filename, file_path, inline)
+            if offload:
+                return Response(status=200, headers=offload)
             return send_file(
                 file_path,
-                as_attachment=True,
-                download_name=filename
+                mimetype=media_type(filename),
+                as_attachment=not inline,
+                download_name=os.path.basename(filename),
+                conditional=True,
+                etag=True
             )
         else:
             return jsonify({
@@ -198,6 +468,69 @@ def download_file(filename):
             'error': f'Download failed: {str(e)}'
         }), 500
 
+@app.route('/previews/<task_id>')
+def get_previews(task_id):
+    """Thumbnails and the scrub sprite sheet (with its WebVTT index) of a finished video job"""
+    previews = load_previews(app.config['OUTPUT_FOLDER'], task_id)
+    if previews is None:
+        return jsonify({'success': False, 'error': 'No previews for this task'}), 404
+    return jsonify({'success': True, **previews})
+
+@app.route('/peaks/<path:filename>')
+def get_peaks(filename):
+    """Waveform min/max/RMS points, loudness and silent regions of an uploaded audio file.
+
+    Query: ``level`` (0 is finest), ``start``/``end`` in seconds; ``format=binary``
+    returns the whole sidecar for clients that read it themselves.
+    """
+    try:
+        file_path = resolve_output_path(app.config['UPLOAD_FOLDER'], filename)
+        if not file_path or not os.path.isfile(file_path) or file_path.endswith(PEAKS_SUFFIX):
+            return jsonify({'success': False, 'error': 'File not found'}), 404
+        sidecar = ensure_peaks(file_path)
+        if request.args.get('format') == 'binary':
+            return send_file(sidecar, mimetype='application/octet-stream', conditional=True, etag=True)
+        level = request.args.get('level', type=int)
+        start = request.args.get('start', type=float)
+        end = request.args.get('end', type=float)
+        return jsonify({'success': True, **peaks_response(sidecar, level, start, end)})
+    except PeaksUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 501
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Peaks error: {str(e)}")
+        return jsonify({'success': False, 'error': f'Peaks failed: {str(e)}'}), 500
+
+@app.route('/stream/<task_id>/<name>')
+def stream_file(task_id, name):
+    """Serve a streaming job's output (fMP4 or HLS playlist/segments) while it is encoded"""
+    file_path = stream_file_path(app.config['OUTPUT_FOLDER'], task_id, name)
+    if not file_path:
+        return jsonify({'success': False, 'error': 'File not found'}), 404
+    
+    status = processing_manager.get_status(task_id)
+    if not os.path.isfile(file_path):
+        # Finished from the result cache: the output lives in another task's folder
+        if status['status'] == 'completed' and status.get('output_file'):
+            return redirect(f"/download/{os.path.dirname(status['output_file'])}/{name}?inline=1")
+        return jsonify({'success': False, 'error': 'File not found'}), 404
+    
+    def is_running():
+        return processing_manager.get_status(task_id)['status'] not in TERMINAL_STATUSES + ('not_found',)
+    
+    running = status['status'] not in TERMINAL_STATUSES + ('not_found',)
+    if name.endswith('.mp4') and running and 'Range' not in request.headers:
+        # Growing fragmented MP4: keep sending data until the encode finishes
+        return Response(tail_file(file_path, is_running), mimetype=media_type(name),
+                        headers={'Cache-Control': 'no-cache'})
+    
+    response = send_file(file_path, mimetype=media_type(name), conditional=True)
+    if name.endswith('.m3u8'):
+        # The playlist grows while the job runs
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/cleanup', methods=['POST'])
 def cleanup_files():
     """Clean up uploaded and output files"""
@@ -216,6 +549,11 @@ def cleanup_files():
                     if file_age > 3600:  # 1 hour
                         os.remove(file_path)
         
+        # Abandoned resumable uploads, old streaming outputs and previews
+        resumable_uploads.cleanup(3600)
+        cleanup_streams(app.config['OUTPUT_FOLDER'], 3600)
+        cleanup_previews(app.config['OUTPUT_FOLDER'], 3600)
+        
         return jsonify({'success': True, 'message': 'Cleanup completed'})
     
     except Exception as e:
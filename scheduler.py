@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import threading
+import logging
+from typing import Dict, List, Any, Optional
+
+# Task states that mean the job still has to run. 'started' and 'processing'
+# rows found at startup belong to a worker that died mid-encode.
+RECOVERABLE_STATUSES = ('pending', 'queued', 'started', 'processing')
+
+# Seconds a worker waits on an empty queue before checking again
+WORKER_POP_TIMEOUT = 5.0
+
+# Seconds between lease renewals and sweeps for jobs abandoned by dead processes
+HEARTBEAT_INTERVAL = 15.0
+
+
+def default_worker_count() -> int:
+    """Number of concurrent encode slots when none is configured"""
+    # ffmpeg/libx264 already spreads one encode over several cores
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class TaskScheduler:
+    """Runs processing jobs on a fixed pool of worker threads.
+
+    Jobs wait in the manager's state backend queue (higher priority first,
+    FIFO within a priority). The queue is mirrored in the ``processing_tasks``
+    table so queued and interrupted work can be picked up again after a
+    restart; with a shared backend every process's workers pull from it.
+    With a per-process backend the rows are leased to the process holding
+    the jobs, and live processes adopt rows whose lease has run out.
+    """
+
+    def __init__(self, manager, max_workers: Optional[int] = None, run_workers: bool = True):
+        self.manager = manager
+        self.state = manager.state
+        self.max_workers = max_workers or default_worker_count()
+        # False for web processes that only enqueue; separate workers run the jobs
+        self.run_workers = run_workers
+        self._running = set()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._heartbeat = None
+        self._stopping = threading.Event()
+
+    def submit(self, task_id: str, operation: str, files: List[Dict], options: Dict,
+               upload_folder: str, output_folder: str, priority: int = 0,
+               persist: bool = True):
+        """Queue a job and make sure the worker pool is running"""
+        job = {
+            'task_id': task_id,
+            'operation': operation,
+            'files': files,
+            'options': options,
+            'upload_folder': upload_folder,
+            'output_folder': output_folder
+        }
+        self.state.push_jobs([job], priority, persist=persist)
+        self._ensure_workers()
+
+    def submit_many(self, jobs: List[Dict[str, Any]], priority: int = 0, batch_id: Optional[str] = None):
+        """Queue a group of jobs back to back, persisting them in one transaction.
+
+        Each job is a dict of ``submit`` arguments (task_id, operation, files,
+        options, upload_folder, output_folder).
+        """
+        if not jobs:
+            return
+        self.state.push_jobs(jobs, priority, batch_id)
+        self._ensure_workers()
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """1-based position of a queued task, or None if it is not waiting"""
+        return self.state.queue_position(task_id)
+
+    def cancel(self, task_id: str) -> bool:
+        """Drop a job that has not started yet; returns False if it is not waiting"""
+        return self.state.remove_job(task_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Current pool occupancy"""
+        with self._lock:
+            running = len(self._running)
+        return {
+            'workers': self.max_workers,
+            'running': running,
+            'queued': self.state.queued_count()
+        }
+
+    def recover(self) -> int:
+        """Re-queue jobs that were waiting or running when their process stopped"""
+        if self.state.shared:
+            # The queue outlives this process; just start pulling from it
+            self._ensure_workers()
+            return 0
+
+        try:
+            from models import ProcessingTask
+            from app import app
+
+            with app.app_context():
+                rows = ProcessingTask.query.filter(
+                    ProcessingTask.status.in_(RECOVERABLE_STATUSES),
+                    ProcessingTask.job_payload.isnot(None)
+                ).order_by(ProcessingTask.priority.desc(), ProcessingTask.created_at).all()
+                jobs = [(row.task_id, row.operation, row.priority or 0, row.batch_id,
+                         json.loads(row.job_payload))
+                        for row in rows]
+            # Other processes on the same database may be recovering too
+            adopted = set(self.state.adopt([job[0] for job in jobs]))
+            jobs = [job for job in jobs if job[0] in adopted]
+        except Exception as e:
+            logging.error(f"Failed to recover queued tasks: {str(e)}")
+            return 0
+
+        recovered = 0
+        for task_id, operation, priority, batch_id, payload in jobs:
+            with self._lock:
+                if task_id in self._running:
+                    continue
+            if self.state.queue_position(task_id) is not None:
+                continue
+            self.manager.register_task(task_id, 'Recovered after restart, waiting for a worker...',
+                                       operation=operation, batch_id=batch_id)
+            self.submit(task_id, operation, payload['files'], payload['options'],
+                        payload['upload_folder'], payload['output_folder'],
+                        priority=priority, persist=False)
+            recovered += 1
+
+        if recovered:
+            logging.info(f"Recovered {recovered} queued task(s)")
+        return recovered
+
+    def start(self):
+        """Start the worker pool without waiting for a submission"""
+        self._ensure_workers()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop claiming jobs and wait for running ones; returns False if some are still running"""
+        self._stopping.set()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for worker in list(self._workers):
+            worker.join(max(deadline - time.monotonic(), 0) if deadline is not None else None)
+        return not any(worker.is_alive() for worker in self._workers)
+
+    def _ensure_workers(self):
+        """Start worker threads up to the configured slot count"""
+        if not self.run_workers or self._stopping.is_set():
+            return
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='lease-heartbeat')
+                self._heartbeat.daemon = True
+                self._heartbeat.start()
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"encode-worker-{len(self._workers) + 1}"
+                )
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def _worker_loop(self):
+        """Take the next job off the queue and run it, forever"""
+        while not self._stopping.is_set():
+            job = self.state.pop_job(WORKER_POP_TIMEOUT)
+            if job is None:
+                continue
+            task_id = job['task_id']
+            with self._lock:
+                self._running.add(task_id)
+
+            # Everyone behind this job just moved up one place
+            self.manager.publish_queue_positions()
+            try:
+                self.manager._process_in_background(**job)
+            except Exception as e:
+                logging.error(f"Worker crashed on task {task_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._running.discard(task_id)
+                self.state.release(task_id)
+
+    def _heartbeat_loop(self):
+        """Renew leases on running jobs and re-queue jobs abandoned by dead workers"""
+        while not self._stopping.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.state.heartbeat(running)
+                if self.state.shared:
+                    requeued = self.state.requeue_expired()
+                    if requeued:
+                        logging.warning(f"Re-queued {requeued} task(s) from workers that stopped responding")
+                else:
+                    self.recover()
+            except Exception as e:
+                logging.error(f"Lease heartbeat failed: {str(e)}")
@@ -0,0 +1,56 @@
+import os
+import glob
+from typing import Dict, List, Any
+
+from streaming import as_argv
+
+# Only sources at least this long are split; shorter ones encode in one process
+PARALLEL_ENCODE_MIN_SECONDS = float(os.environ.get('PARALLEL_ENCODE_MIN_SECONDS', 600))
+
+# No segment is cut shorter than this, so per-process start-up stays negligible
+SEGMENT_MIN_SECONDS = 60
+
+# ffmpeg processes encoding segments of one job at the same time
+SEGMENT_PARALLELISM = int(os.environ.get('SEGMENT_PARALLELISM', 0)) or max(2, (os.cpu_count() or 1) // 4)
+
+# Segments per process; a few extra keep the pool busy when segments encode unevenly
+SEGMENTS_PER_PROCESS = 2
+
+# Matroska carries any codec and, unlike MP4, writes no edit lists that would
+# upset the concat demuxer at the seams
+SEGMENT_EXTENSION = '.mkv'
+
+
+def segment_count(duration: float, options: Dict) -> int:
+    """Segments to cut a video into, or 0 to encode it in a single process"""
+    if not options.get('parallel', True) or not duration or duration < PARALLEL_ENCODE_MIN_SECONDS:
+        return 0
+    count = min(int(duration // SEGMENT_MIN_SECONDS), SEGMENT_PARALLELISM * SEGMENTS_PER_PROCESS)
+    return count if count >= 2 else 0
+
+
+def split_command(video_file: str, duration: float, count: int, work_dir: str) -> List[str]:
+    """Stream-copy the first video stream into segments; cuts land on the next keyframe"""
+    split_points = ','.join(f'{duration * index / count:.3f}' for index in range(1, count))
+    return [
+        'ffmpeg', '-y', '-i', video_file,
+        '-map', '0:v:0', '-c', 'copy',
+        '-f', 'segment', '-segment_times', split_points, '-reset_timestamps', '1',
+        os.path.join(work_dir, f'source_%04d{SEGMENT_EXTENSION}')
+    ]
+
+
+def split_segments(work_dir: str) -> List[str]:
+    """Segments written by ``split_command``, in order"""
+    return sorted(glob.glob(os.path.join(work_dir, f'source_*{SEGMENT_EXTENSION}')))
+
+
+def encoded_path(segment: str) -> str:
+    directory, name = os.path.split(segment)
+    return os.path.join(directory, 'encoded_' + name[len('source_'):])
+
+
+def encode_command(segment: str, encoder: str, output_options: Dict[str, Any]) -> List[str]:
+    """Encode one segment; every segment gets identical settings so they concatenate losslessly"""
+    return (['ffmpeg', '-y', '-i', segment, '-map', '0:v:0', '-c:v', encoder]
+            + as_argv(output_options) + [encoded_path(segment)])
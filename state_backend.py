@@ -0,0 +1,781 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import socket
+import logging
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+from status_store import TERMINAL_STATUSES
+
+# Seconds between queue polls for backends that cannot block on a pop
+QUEUE_POLL_INTERVAL = 0.5
+
+# Queued rows examined per claim attempt by the SQL backend
+CLAIM_CANDIDATES = 10
+
+# Seconds a claimed job stays leased without a heartbeat before it is re-queued
+LEASE_SECONDS = 60
+
+# Claims after which a job whose worker keeps dying is failed instead of re-queued
+MAX_JOB_ATTEMPTS = 3
+
+# Redis keys expire this long after a task is created (7 days)
+REDIS_TASK_TTL = 7 * 24 * 3600
+
+# Redis queue scores are -priority * PRIORITY_SCALE + sequence, so FIFO order
+# within a priority holds for |priority| < ~900000 (float precision)
+PRIORITY_SCALE = 1e10
+
+
+def job_payload(job: Dict[str, Any]) -> str:
+    """JSON of the job arguments that are not stored in their own columns"""
+    return json.dumps({key: value for key, value in job.items()
+                       if key not in ('task_id', 'operation')})
+
+
+def persist_jobs(jobs: List[Dict[str, Any]], priority: int, batch_id: Optional[str] = None,
+                 lease_owner: Optional[str] = None):
+    """Store job arguments on the task rows so queued work survives restarts.
+
+    ``lease_owner`` leases the rows to a process that keeps the jobs in memory.
+    """
+    try:
+        from models import db, ProcessingTask
+        from app import app
+
+        with app.app_context():
+            existing = {
+                task.task_id: task for task in ProcessingTask.query.filter(
+                    ProcessingTask.task_id.in_([job['task_id'] for job in jobs])
+                )
+            }
+            for job in jobs:
+                task = existing.get(job['task_id'])
+                if not task:
+                    task = ProcessingTask(task_id=job['task_id'], operation=job['operation'])
+                    db.session.add(task)
+                task.status = 'queued'
+                task.message = 'Waiting for a free worker...'
+                task.priority = priority
+                task.batch_id = batch_id or task.batch_id
+                task.job_payload = job_payload(job)
+                task.updated_at = datetime.utcnow()
+                if lease_owner:
+                    task.lease_owner = lease_owner
+                    task.lease_expires_at = task.updated_at + timedelta(seconds=LEASE_SECONDS)
+            db.session.commit()
+    except Exception as e:
+        logging.error(f"Failed to persist queued tasks: {str(e)}")
+
+
+def worker_identity() -> str:
+    """Lease owner name for this process, unique across hosts and restarts"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def apply_update(current: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge ``fields`` into ``current``; returns the changed fields plus updated_at"""
+    delta = {key: value for key, value in fields.items() if current.get(key) != value}
+    current.update(fields, updated_at=datetime.now().isoformat())
+    if delta:
+        delta['updated_at'] = current['updated_at']
+    return delta
+
+
+class StateBackend:
+    """Where task status, batch membership and the job queue live.
+
+    Queue entries are job dicts (task_id, operation, files, options,
+    upload_folder, output_folder). ``shared`` backends are visible to every
+    process pointed at the same store, so web workers and encode workers on
+    other hosts see the same tasks and pull from the same queue.
+    """
+
+    shared = False
+
+    def create_task(self, task_id: str, state: Dict[str, Any]):
+        raise NotImplementedError
+
+    def create_tasks(self, states: Dict[str, Dict[str, Any]]):
+        """Create several tasks (task_id -> state) as ``create_task`` would, in one write"""
+        for task_id, state in states.items():
+            self.create_task(task_id, state)
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_tasks(self, task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        return [self.get_task(task_id) for task_id in task_ids]
+
+    def update_task(self, task_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge fields into a task's state; returns what changed, or None for unknown tasks"""
+        raise NotImplementedError
+
+    def add_to_batch(self, batch_id: str, task_ids: List[str]):
+        raise NotImplementedError
+
+    def get_batch(self, batch_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def push_jobs(self, jobs: List[Dict[str, Any]], priority: int = 0,
+                  batch_id: Optional[str] = None, persist: bool = True):
+        """Queue jobs behind others of the same priority; ``persist`` mirrors them in the DB"""
+        raise NotImplementedError
+
+    def pop_job(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Claim the next job, waiting up to ``timeout`` seconds; None if there was none"""
+        raise NotImplementedError
+
+    def remove_job(self, task_id: str) -> bool:
+        """Drop a job that has not been claimed; returns False if it is not waiting"""
+        raise NotImplementedError
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """1-based position of a queued task, or None if it is not waiting"""
+        raise NotImplementedError
+
+    def queued_count(self) -> int:
+        raise NotImplementedError
+
+    def request_cancel(self, task_id: str):
+        """Ask whichever process runs the task to stop it (no-op when state is local)"""
+
+    def cancel_requested(self, task_id: str) -> bool:
+        return False
+
+    def heartbeat(self, task_ids: List[str]):
+        """Extend the leases on jobs this process is running"""
+
+    def release(self, task_id: str):
+        """Drop the lease on a job this process has finished"""
+
+    def requeue_expired(self) -> int:
+        """Re-queue jobs whose worker stopped heartbeating; returns how many"""
+        return 0
+
+    def adopt(self, task_ids: List[str]) -> List[str]:
+        """Take over persisted jobs no live process holds; returns the ones this process won"""
+        return list(task_ids)
+
+
+class MemoryBackend(StateBackend):
+    """Per-process state: a dict of tasks and a heap of jobs.
+
+    Fastest option, but only the process that accepted a job can report on it.
+    The task rows of jobs it holds are leased to it, so when several processes
+    recover from the same database each orphaned job is adopted by one of them.
+    """
+
+    def __init__(self):
+        self.worker_id = worker_identity()
+        self._tasks = {}  # task_id -> status dict
+        self._batches = {}  # batch_id -> [task_id, ...]
+        self._queue = []  # heap of (-priority, sequence, task_id)
+        self._jobs = {}  # task_id -> job, for jobs still waiting
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def create_task(self, task_id: str, state: Dict[str, Any]):
+        self.create_tasks({task_id: state})
+
+    def create_tasks(self, states: Dict[str, Dict[str, Any]]):
+        with self._cond:
+            for task_id, state in states.items():
+                self._tasks[task_id] = dict(state)
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update_task(self, task_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            current = self._tasks.get(task_id)
+            if current is None:
+                return None
+            return apply_update(current, fields)
+
+    def add_to_batch(self, batch_id: str, task_ids: List[str]):
+        with self._cond:
+            self._batches.setdefault(batch_id, []).extend(task_ids)
+
+    def get_batch(self, batch_id: str) -> List[str]:
+        with self._cond:
+            return list(self._batches.get(batch_id, []))
+
+    def push_jobs(self, jobs: List[Dict[str, Any]], priority: int = 0,
+                  batch_id: Optional[str] = None, persist: bool = True):
+        if persist:
+            persist_jobs(jobs, priority, batch_id, lease_owner=self.worker_id)
+        with self._cond:
+            for job in jobs:
+                self._jobs[job['task_id']] = job
+                heapq.heappush(self._queue, (-priority, next(self._sequence), job['task_id']))
+            self._cond.notify_all()
+
+    def pop_job(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                while self._queue:
+                    _, _, task_id = heapq.heappop(self._queue)
+                    job = self._jobs.pop(task_id, None)
+                    # Cancelled jobs leave stale heap entries behind
+                    if job is not None:
+                        return job
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def remove_job(self, task_id: str) -> bool:
+        with self._cond:
+            return self._jobs.pop(task_id, None) is not None
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        with self._cond:
+            if task_id not in self._jobs:
+                return None
+            waiting = [entry for entry in sorted(self._queue) if entry[2] in self._jobs]
+            for position, entry in enumerate(waiting, start=1):
+                if entry[2] == task_id:
+                    return position
+        return None
+
+    def queued_count(self) -> int:
+        with self._cond:
+            return len(self._jobs)
+
+    def heartbeat(self, task_ids: List[str]):
+        from models import db, ProcessingTask
+        from app import app
+
+        # Finished jobs are not released: their leases lapse well after the
+        # write-behind status store has flushed the final status
+        with self._cond:
+            held = list(task_ids) + list(self._jobs)
+        if not held:
+            return
+        with app.app_context():
+            ProcessingTask.query.filter(
+                ProcessingTask.task_id.in_(held),
+                ProcessingTask.lease_owner == self.worker_id
+            ).update({'lease_expires_at': datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)},
+                     synchronize_session=False)
+            db.session.commit()
+
+    def adopt(self, task_ids: List[str]) -> List[str]:
+        from models import db, ProcessingTask
+        from app import app
+
+        adopted = []
+        with app.app_context():
+            for task_id in task_ids:
+                now = datetime.utcnow()
+                # Conditional so that of several recovering processes exactly one wins each row
+                claimed = ProcessingTask.query.filter(
+                    ProcessingTask.task_id == task_id,
+                    db.or_(ProcessingTask.lease_owner.is_(None), ProcessingTask.lease_expires_at < now)
+                ).update({'lease_owner': self.worker_id,
+                          'lease_expires_at': now + timedelta(seconds=LEASE_SECONDS)},
+                         synchronize_session=False)
+                db.session.commit()
+                if claimed:
+                    adopted.append(task_id)
+        return adopted
+
+
+class SQLBackend(StateBackend):
+    """State and queue kept in the ``processing_tasks`` table.
+
+    Jobs are claimed with a conditional ``UPDATE ... WHERE status = 'queued'``
+    so concurrent workers never take the same row. Status writes are the ones
+    the manager already sends through the write-behind ``StatusPersister``;
+    reads overlay its unflushed updates so this process sees its own changes
+    immediately and everyone else within one flush interval. Updates are
+    diffed against what this process last wrote, so progress never waits on
+    a database read.
+    """
+
+    shared = True
+
+    def __init__(self, persister=None, poll_interval: float = QUEUE_POLL_INTERVAL):
+        self.persister = persister
+        self.poll_interval = poll_interval
+        self.worker_id = worker_identity()
+        self._written = {}  # task_id -> state as last updated here, until the task finishes
+        self._written_lock = threading.Lock()
+
+    @staticmethod
+    def _row_state(row) -> Dict[str, Any]:
+        state = {
+            'status': row.status,
+            'progress': row.progress or 0,
+            'message': row.message,
+            'output_file': row.output_file,
+            'error': row.error_message,
+            'operation': row.operation,
+            'batch_id': row.batch_id,
+            'eta_seconds': row.eta_seconds,
+            'speed': row.encode_speed,
+            'updated_at': row.updated_at.isoformat() if row.updated_at else None
+        }
+        if row.outputs:
+            state['outputs'] = json.loads(row.outputs)
+        return state
+
+    def _overlay(self, task_id: str, state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Apply status recorded by this process but not yet flushed"""
+        pending = self.persister.pending(task_id) if self.persister and state is not None else None
+        if pending:
+            state.update(
+                status=pending['status'],
+                progress=pending['progress'],
+                message=pending['message'],
+                eta_seconds=pending['eta_seconds'],
+                speed=pending['encode_speed'],
+                updated_at=pending['updated_at'].isoformat()
+            )
+            if pending.get('output_file'):
+                state['output_file'] = pending['output_file']
+            if pending.get('outputs'):
+                state['outputs'] = pending['outputs']
+        return state
+
+    def create_task(self, task_id: str, state: Dict[str, Any]):
+        self.create_tasks({task_id: state})
+
+    def create_tasks(self, states: Dict[str, Dict[str, Any]]):
+        from models import db, ProcessingTask
+        from app import app
+
+        with app.app_context():
+            existing = {
+                row.task_id for row in ProcessingTask.query.with_entities(ProcessingTask.task_id).filter(
+                    ProcessingTask.task_id.in_(list(states))
+                )
+            }
+            rows = [{
+                'task_id': task_id,
+                'operation': state.get('operation') or '',
+                'status': state['status'],
+                'progress': state['progress'],
+                'message': state['message'],
+                'batch_id': state.get('batch_id')
+            } for task_id, state in states.items() if task_id not in existing]
+            if rows:
+                # A bulk INSERT (executemany); ORM objects would be flushed row by row
+                db.session.execute(db.insert(ProcessingTask), rows)
+            # Rows the web front inserted before queueing are kept; they only gain their batch
+            by_batch = {}
+            for task_id in existing:
+                if states[task_id].get('batch_id'):
+                    by_batch.setdefault(states[task_id]['batch_id'], []).append(task_id)
+            for batch_id, task_ids in by_batch.items():
+                ProcessingTask.query.filter(
+                    ProcessingTask.task_id.in_(task_ids),
+                    ProcessingTask.batch_id.is_(None)
+                ).update({'batch_id': batch_id}, synchronize_session=False)
+            db.session.commit()
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        from models import ProcessingTask
+        from app import app
+
+        with app.app_context():
+            row = ProcessingTask.query.filter_by(task_id=task_id).first()
+            state = self._row_state(row) if row else None
+        return self._overlay(task_id, state)
+
+    def get_tasks(self, task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        from models import ProcessingTask
+        from app import app
+
+        with app.app_context():
+            rows = ProcessingTask.query.filter(ProcessingTask.task_id.in_(task_ids)).all()
+            states = {row.task_id: self._row_state(row) for row in rows}
+        return [self._overlay(task_id, states.get(task_id)) for task_id in task_ids]
+
+    def update_task(self, task_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # The row itself is written by the persister; a task first updated here
+        # starts from its unflushed overlay, or from nothing
+        with self._written_lock:
+            current = self._written.get(task_id)
+            if current is None:
+                current = self._written[task_id] = self._overlay(task_id, {})
+            delta = apply_update(current, fields)
+            if current.get('status') in TERMINAL_STATUSES:
+                del self._written[task_id]
+        return delta
+
+    def add_to_batch(self, batch_id: str, task_ids: List[str]):
+        # Membership is the batch_id column, written by create_tasks and persist_jobs
+        pass
+
+    def get_batch(self, batch_id: str) -> List[str]:
+        from models import ProcessingTask
+        from app import app
+
+        with app.app_context():
+            rows = ProcessingTask.query.with_entities(ProcessingTask.task_id).filter_by(
+                batch_id=batch_id
+            ).order_by(ProcessingTask.created_at, ProcessingTask.id)
+            return [row.task_id for row in rows]
+
+    def push_jobs(self, jobs: List[Dict[str, Any]], priority: int = 0,
+                  batch_id: Optional[str] = None, persist: bool = True):
+        # The persisted rows are the queue
+        if persist:
+            persist_jobs(jobs, priority, batch_id)
+
+    def pop_job(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                job = self._claim_next()
+            except Exception as e:
+                logging.error(f"Failed to claim a queued task: {str(e)}")
+                job = None
+            if job is not None:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        from models import db, ProcessingTask
+        from app import app
+
+        with app.app_context():
+            candidates = self._waiting().order_by(
+                ProcessingTask.priority.desc(), ProcessingTask.created_at, ProcessingTask.id
+            ).limit(CLAIM_CANDIDATES).all()
+            for row in candidates:
+                now = datetime.utcnow()
+                claimed = ProcessingTask.query.filter_by(task_id=row.task_id, status='queued').update({
+                    'status': 'started',
+                    'updated_at': now,
+                    'lease_owner': self.worker_id,
+                    'lease_expires_at': now + timedelta(seconds=LEASE_SECONDS),
+                    'attempts': db.func.coalesce(ProcessingTask.attempts, 0) + 1
+                }, synchronize_session=False)
+                db.session.commit()
+                if claimed:
+                    return dict(json.loads(row.job_payload), task_id=row.task_id, operation=row.operation)
+        return None
+
+    @staticmethod
+    def _waiting():
+        from models import ProcessingTask
+        return ProcessingTask.query.filter(
+            ProcessingTask.status == 'queued',
+            ProcessingTask.job_payload.isnot(None)
+        )
+
+    def remove_job(self, task_id: str) -> bool:
+        from models import db, ProcessingTask
+        from app import app
+
+        with app.app_context():
+            removed = ProcessingTask.query.filter_by(task_id=task_id, status='queued').update(
+                {'status': 'cancelled', 'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+        return bool(removed)
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        from models import ProcessingTask
+        from app import app
+
+        with app.app_context():
+            row = ProcessingTask.query.filter_by(task_id=task_id).first()
+            if not row or row.status != 'queued' or not row.job_payload:
+                return None
+            priority = row.priority or 0
+            ahead = self._waiting().filter(
+                (ProcessingTask.priority > priority) |
+                ((ProcessingTask.priority == priority) & (ProcessingTask.created_at < row.created_at))
+            ).count()
+        return ahead + 1
+
+    def queued_count(self) -> int:
+        from app import app
+
+        with app.app_context():
+            return self._waiting().count()
+
+    def request_cancel(self, task_id: str):
+        from models import db, ProcessingTask
+        from app import app
+
+        with app.app_context():
+            ProcessingTask.query.filter_by(task_id=task_id).update(
+                {'cancel_requested': True}, synchronize_session=False
+            )
+            db.session.commit()
+
+    def cancel_requested(self, task_id: str) -> bool:
+        from models import ProcessingTask
+        from app import app
+
+        with app.app_context():
+            row = ProcessingTask.query.with_entities(ProcessingTask.cancel_requested).filter_by(
+                task_id=task_id
+            ).first()
+            return bool(row and row.cancel_requested)
+
+    def heartbeat(self, task_ids: List[str]):
+        from models import db, ProcessingTask
+        from app import app
+
+        if not task_ids:
+            return
+        with app.app_context():
+            ProcessingTask.query.filter(
+                ProcessingTask.task_id.in_(task_ids),
+                ProcessingTask.lease_owner == self.worker_id
+            ).update({'lease_expires_at': datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)},
+                     synchronize_session=False)
+            db.session.commit()
+
+    def release(self, task_id: str):
+        from models import db, ProcessingTask
+        from app import app
+
+        with app.app_context():
+            ProcessingTask.query.filter_by(task_id=task_id, lease_owner=self.worker_id).update(
+                {'lease_owner': None, 'lease_expires_at': None}, synchronize_session=False
+            )
+            db.session.commit()
+
+    def requeue_expired(self) -> int:
+        from models import db, ProcessingTask
+        from app import app
+
+        def expired():
+            return ProcessingTask.query.filter(
+                ProcessingTask.status.in_(('started', 'processing')),
+                ProcessingTask.lease_expires_at < datetime.utcnow()
+            )
+
+        cleared = {'lease_owner': None, 'lease_expires_at': None, 'updated_at': datetime.utcnow()}
+        with app.app_context():
+            message = f'Worker stopped responding {MAX_JOB_ATTEMPTS} times, giving up'
+            failed = expired().filter(db.func.coalesce(ProcessingTask.attempts, 0) >= MAX_JOB_ATTEMPTS).update(
+                dict(cleared, status='failed', message=message, error_message=message),
+                synchronize_session=False
+            )
+            requeued = expired().update(
+                dict(cleared, status='queued', progress=0,
+                     message='Worker stopped responding, waiting for another worker...'),
+                synchronize_session=False
+            )
+            db.session.commit()
+        if failed:
+            logging.warning(f"Failed {failed} task(s) whose workers kept dying")
+        return requeued
+
+
+class RedisBackend(StateBackend):
+    """State and queue in any server speaking the Redis protocol.
+
+    Tasks are hashes of JSON-encoded fields, batches are lists and the queue
+    is a sorted set. A claim moves the job to the running hash and leases it
+    in one WATCH/MULTI transaction, so a worker dying mid-claim never loses
+    it. Pass ``client`` to use an existing connection or a local stand-in
+    such as ``fakeredis.FakeRedis(decode_responses=True)``.
+    """
+
+    shared = True
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = 'avf', persister=None,
+                 poll_interval: float = QUEUE_POLL_INTERVAL):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError('The redis package is required for a redis:// STATE_BACKEND')
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.prefix = prefix
+        self.persister = persister  # mirrors lease-expiry status changes in the database
+        self.poll_interval = poll_interval
+
+    def _key(self, *parts: str) -> str:
+        return ':'.join((self.prefix,) + parts)
+
+    @staticmethod
+    def _decode(data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        return {key: json.loads(value) for key, value in data.items()} if data else None
+
+    def create_task(self, task_id: str, state: Dict[str, Any]):
+        self.create_tasks({task_id: state})
+
+    def create_tasks(self, states: Dict[str, Dict[str, Any]]):
+        pipe = self.redis.pipeline()
+        for task_id, state in states.items():
+            key = self._key('task', task_id)
+            pipe.hset(key, mapping={field: json.dumps(value) for field, value in state.items()})
+            pipe.expire(key, REDIS_TASK_TTL)
+        pipe.execute()
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._decode(self.redis.hgetall(self._key('task', task_id)))
+
+    def get_tasks(self, task_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        pipe = self.redis.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(self._key('task', task_id))
+        return [self._decode(data) for data in pipe.execute()]
+
+    def update_task(self, task_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Each task has a single writer (the worker running it), so read-modify-write is safe
+        current = self.get_task(task_id)
+        if current is None:
+            return None
+        delta = apply_update(current, fields)
+        if delta:
+            self.redis.hset(self._key('task', task_id),
+                            mapping={field: json.dumps(value) for field, value in delta.items()})
+        return delta
+
+    def add_to_batch(self, batch_id: str, task_ids: List[str]):
+        if not task_ids:
+            return
+        key = self._key('batch', batch_id)
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, *task_ids)
+        pipe.expire(key, REDIS_TASK_TTL)
+        pipe.execute()
+
+    def get_batch(self, batch_id: str) -> List[str]:
+        return self.redis.lrange(self._key('batch', batch_id), 0, -1)
+
+    def push_jobs(self, jobs: List[Dict[str, Any]], priority: int = 0,
+                  batch_id: Optional[str] = None, persist: bool = True):
+        if not jobs:
+            return
+        if persist:
+            persist_jobs(jobs, priority, batch_id)
+        self._enqueue(jobs, priority)
+
+    def _enqueue(self, jobs: List[Dict[str, Any]], priority: int, attempts: int = 0):
+        last = self.redis.incrby(self._key('sequence'), len(jobs))
+        pipe = self.redis.pipeline()
+        for offset, job in enumerate(jobs):
+            sequence = last - len(jobs) + 1 + offset
+            entry = {'job': job, 'priority': priority, 'attempts': attempts}
+            pipe.hset(self._key('jobs'), job['task_id'], json.dumps(entry))
+            pipe.zadd(self._key('queue'), {job['task_id']: -priority * PRIORITY_SCALE + sequence})
+        pipe.execute()
+
+    def pop_job(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = self._claim_next()
+            if job is not None:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        """Take the first queued job, moving it to the running hash with a lease, atomically"""
+        queue, jobs = self._key('queue'), self._key('jobs')
+        claimed = {}
+
+        def claim(pipe):
+            claimed.clear()
+            first = pipe.zrange(queue, 0, 0)
+            if not first:
+                return
+            task_id = first[0]
+            entry = pipe.hget(jobs, task_id)
+            pipe.multi()
+            pipe.zrem(queue, task_id)
+            if not entry:
+                return
+            # Running jobs stay recoverable until released: the entry moves to the
+            # running hash and a lease expiry goes into a sorted set
+            entry = json.loads(entry)
+            entry['attempts'] += 1
+            pipe.hdel(jobs, task_id)
+            pipe.hset(self._key('running'), task_id, json.dumps(entry))
+            pipe.zadd(self._key('leases'), {task_id: time.time() + LEASE_SECONDS})
+            claimed['job'] = entry['job']
+
+        # Re-run if another worker touched the queue between the read and EXEC
+        self.redis.transaction(claim, queue, jobs)
+        return claimed.get('job')
+
+    def remove_job(self, task_id: str) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._key('queue'), task_id)
+        pipe.hdel(self._key('jobs'), task_id)
+        removed, _ = pipe.execute()
+        return bool(removed)
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        rank = self.redis.zrank(self._key('queue'), task_id)
+        return rank + 1 if rank is not None else None
+
+    def queued_count(self) -> int:
+        return self.redis.zcard(self._key('queue'))
+
+    def request_cancel(self, task_id: str):
+        self.redis.set(self._key('cancel', task_id), 1, ex=REDIS_TASK_TTL)
+
+    def cancel_requested(self, task_id: str) -> bool:
+        return bool(self.redis.exists(self._key('cancel', task_id)))
+
+    def heartbeat(self, task_ids: List[str]):
+        if task_ids:
+            expires = time.time() + LEASE_SECONDS
+            # xx: never resurrect a lease another process already expired
+            self.redis.zadd(self._key('leases'), {task_id: expires for task_id in task_ids}, xx=True)
+
+    def release(self, task_id: str):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._key('leases'), task_id)
+        pipe.hdel(self._key('running'), task_id)
+        pipe.execute()
+
+    def requeue_expired(self) -> int:
+        requeued = 0
+        for task_id in self.redis.zrangebyscore(self._key('leases'), '-inf', time.time()):
+            # Whoever removes the lease owns the requeue
+            if not self.redis.zrem(self._key('leases'), task_id):
+                continue
+            entry = self.redis.hget(self._key('running'), task_id)
+            self.redis.hdel(self._key('running'), task_id)
+            if not entry:
+                continue
+            entry = json.loads(entry)
+
+            if entry['attempts'] >= MAX_JOB_ATTEMPTS:
+                status, message = 'failed', f'Worker stopped responding {MAX_JOB_ATTEMPTS} times, giving up'
+            else:
+                status, message = 'queued', 'Worker stopped responding, waiting for another worker...'
+                self._enqueue([entry['job']], entry['priority'], entry['attempts'])
+                requeued += 1
+            self.update_task(task_id, {'status': status, 'progress': 0, 'message': message})
+            if self.persister:
+                self.persister.record(task_id, status, 0, message)
+        return requeued
+
+
+def create_state_backend(spec: Optional[str] = None, persister=None) -> StateBackend:
+    """Backend for a STATE_BACKEND value: 'memory' (default), 'sql' or a redis:// URL"""
+    spec = spec or os.environ.get('STATE_BACKEND', 'memory')
+    if spec == 'memory':
+        return MemoryBackend()
+    if spec == 'sql':
+        return SQLBackend(persister)
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url=spec, persister=persister)
+    raise ValueError(f"Unknown STATE_BACKEND: {spec}")
@@ -1,11 +1,18 @@
 // Multimedia Processor JavaScript Application
 
+// Files above this size are sent through the resumable /uploads protocol
+const RESUMABLE_UPLOAD_THRESHOLD = 50 * 1024 * 1024;
+const RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024;
+const RESUMABLE_MAX_RETRIES = 5;
+
 class MultimediaProcessor {
     constructor() {
         this.selectedOperation = null;
         this.uploadedFiles = [];
         this.currentTaskId = null;
         this.statusCheckInterval = null;
+        this.statusSource = null;
+        this.loadingModal = null;
         
         this.init();
     }
@@ -204,6 +211,10 @@ class MultimediaProcessor {
                     <input type="number" class="form-control" name="duration" value="60" min="1" max="3600">
                     <div class="form-text">Maximum: 1 hour (3600 seconds)</div>
                 </div>
+                <div class="mb-3">
+                    <label class="form-label">Crossfade at loop points (seconds):</label>
+                    <input type="number" class="form-control" name="crossfade" value="0" min="0" max="10" step="0.5">
+                </div>
             `
         };
         
@@ -233,29 +244,43 @@ class MultimediaProcessor {
             
             const formData = new FormData();
             const fileInputs = document.querySelectorAll('.file-input');
+            const largeFiles = [];
             
             fileInputs.forEach(input => {
                 if (input.files) {
                     Array.from(input.files).forEach(file => {
-                        formData.append(input.name, file);
+                        // Large files go through resumable sessions so a dropped connection can continue
+                        if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+                            largeFiles.push({ file, fileType: input.name });
+                        } else {
+                            formData.append(input.name, file);
+                        }
                     });
                 }
             });
             
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
-            
-            const result = await response.json();
+            let files = [];
+            if (Array.from(formData.keys()).length > 0) {
+                const response = await fetch('/upload', {
+                    method: 'POST',
+                    body: formData
+                });
+                
+                const result = await response.json();
+                if (!result.success) {
+                    this.showAlert('Upload failed: ' + result.error, 'danger');
+                    return;
+                }
+                files = result.files;
+            }
             
-            if (result.success) {
-                this.uploadedFiles = result.files;
-                this.showUploadResults();
-                this.updateUI();
-            } else {
-                this.showAlert('Upload failed: ' + result.error, 'danger');
+            for (const { file, fileType } of largeFiles) {
+                files.push(await this.uploadResumable(file, fileType, uploadBtn));
             }
+            
+            this.uploadedFiles = files;
+            this.showUploadResults();
+            this.updateUI();
         } catch (error) {
             this.showAlert('Upload error: ' + error.message, 'danger');
         } finally {
@@ -264,6 +289,55 @@ class MultimediaProcessor {
         }
     }
     
+    async uploadResumable(file, fileType, uploadBtn) {
+        const createResponse = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, file_type: fileType })
+        });
+        const session = await createResponse.json();
+        if (!session.success) {
+            throw new Error(session.error);
+        }
+        
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            try {
+                const response = await fetch(`/uploads/${session.upload_id}`, {
+                    method: 'PUT',
+                    headers: { 'Upload-Offset': String(offset) },
+                    body: file.slice(offset, offset + RESUMABLE_CHUNK_SIZE)
+                });
+                if (!response.ok && response.status !== 409) {
+                    throw new Error((await response.json()).error);
+                }
+                // On 409 the server tells us where it actually is
+                offset = parseInt(response.headers.get('Upload-Offset') || (await this.fetchUploadOffset(session.upload_id)));
+                retries = 0;
+            } catch (error) {
+                if (++retries > RESUMABLE_MAX_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                offset = await this.fetchUploadOffset(session.upload_id);
+            }
+            uploadBtn.innerHTML = `<i class="fas fa-spinner fa-spin me-2"></i>Uploading ${file.name} (${Math.floor(offset / file.size * 100)}%)...`;
+        }
+        
+        const completeResponse = await fetch(`/uploads/${session.upload_id}/complete`, { method: 'POST' });
+        const result = await completeResponse.json();
+        if (!result.success) {
+            throw new Error(result.error);
+        }
+        return result.files[0];
+    }
+    
+    async fetchUploadOffset(uploadId) {
+        const response = await fetch(`/uploads/${uploadId}`, { method: 'HEAD' });
+        return parseInt(response.headers.get('Upload-Offset'));
+    }
+    
     showUploadResults() {
         const uploadSection = document.getElementById('upload-section');
         const existingResults = uploadSection.querySelector('.upload-results');
@@ -367,36 +441,83 @@ class MultimediaProcessor {
     
     startStatusCheck() {
         // Show loading modal
-        const loadingModal = new bootstrap.Modal(document.getElementById('loadingModal'));
-        loadingModal.show();
+        this.loadingModal = new bootstrap.Modal(document.getElementById('loadingModal'));
+        this.loadingModal.show();
         
+        if (!window.EventSource) {
+            this.startStatusPolling();
+            return;
+        }
+        
+        // Prefer the server-pushed stream; it only sends fields that changed
+        const status = {};
+        let received = false;
+        this.statusSource = new EventSource(`/events/${this.currentTaskId}`);
+        
+        const applyUpdate = (event) => {
+            received = true;
+            Object.assign(status, JSON.parse(event.data));
+            this.handleStatusUpdate(status);
+        };
+        this.statusSource.addEventListener('status', applyUpdate);
+        this.statusSource.addEventListener('delta', applyUpdate);
+        
+        this.statusSource.onerror = () => {
+            this.stopStatusCheck();
+            if (['completed', 'failed', 'cancelled'].includes(status.status)) {
+                return;
+            }
+            // Stream not available (e.g. the Flask server) or dropped: poll instead
+            if (!received) {
+                console.warn('Status stream unavailable, falling back to polling');
+            }
+            this.startStatusPolling();
+        };
+    }
+    
+    startStatusPolling() {
         this.statusCheckInterval = setInterval(async () => {
             try {
                 const response = await fetch(`/status/${this.currentTaskId}`);
                 const status = await response.json();
-                
-                this.updateProcessingStatus(status.message, status.progress);
-                
-                // Update modal progress
-                const modalProgressBar = document.getElementById('modal-progress-bar');
-                const loadingText = document.getElementById('loading-text');
-                modalProgressBar.style.width = status.progress + '%';
-                loadingText.textContent = status.message;
-                
-                if (status.status === 'completed') {
-                    loadingModal.hide();
-                    this.handleProcessingComplete(status);
-                } else if (status.status === 'failed') {
-                    loadingModal.hide();
-                    this.handleProcessingFailed(status);
-                }
+                this.handleStatusUpdate(status);
             } catch (error) {
                 console.error('Status check error:', error);
-                loadingModal.hide();
+                this.loadingModal.hide();
             }
         }, 1000);
     }
     
+    stopStatusCheck() {
+        if (this.statusSource) {
+            this.statusSource.close();
+            this.statusSource = null;
+        }
+        clearInterval(this.statusCheckInterval);
+    }
+    
+    handleStatusUpdate(status) {
+        const message = status.status === 'queued' && status.queue_position
+            ? `${status.message} (position ${status.queue_position} in queue)`
+            : status.message;
+        
+        this.updateProcessingStatus(message, status.progress || 0);
+        
+        // Update modal progress
+        const modalProgressBar = document.getElementById('modal-progress-bar');
+        const loadingText = document.getElementById('loading-text');
+        modalProgressBar.style.width = (status.progress || 0) + '%';
+        loadingText.textContent = message;
+        
+        if (status.status === 'completed') {
+            this.loadingModal.hide();
+            this.handleProcessingComplete(status);
+        } else if (status.status === 'failed' || status.status === 'cancelled') {
+            this.loadingModal.hide();
+            this.handleProcessingFailed(status);
+        }
+    }
+    
     updateProcessingStatus(message, progress) {
         const progressBar = document.getElementById('progress-bar');
         const statusMessage = document.getElementById('status-message');
@@ -411,7 +532,7 @@ class MultimediaProcessor {
     }
     
     handleProcessingComplete(status) {
-        clearInterval(this.statusCheckInterval);
+        this.stopStatusCheck();
         
         const progressBar = document.getElementById('progress-bar');
         progressBar.classList.remove('processing-pulse');
@@ -419,11 +540,12 @@ class MultimediaProcessor {
         progressBar.classList.add('bg-success');
         
         this.showResults(status.output_file);
+        this.showPreviews(this.currentTaskId);
         this.updateUI();
     }
     
     handleProcessingFailed(status) {
-        clearInterval(this.statusCheckInterval);
+        this.stopStatusCheck();
         
         const progressBar = document.getElementById('progress-bar');
         progressBar.classList.remove('processing-pulse');
@@ -470,6 +592,31 @@ class MultimediaProcessor {
         `;
     }
     
+    async showPreviews(taskId) {
+        // Thumbnails are only made for video outputs; other jobs answer 404
+        try {
+            const response = await fetch(`/previews/${taskId}`);
+            if (!response.ok) return;
+            const previews = await response.json();
+            if (!previews.thumbnails.length) return;
+            
+            const strip = document.createElement('div');
+            strip.className = 'd-flex flex-wrap gap-2 mt-3 fade-in';
+            previews.thumbnails.forEach(thumbnail => {
+                const image = document.createElement('img');
+                image.src = thumbnail.url;
+                image.alt = `Frame at ${thumbnail.time.toFixed(1)}s`;
+                image.title = image.alt;
+                image.className = 'img-thumbnail';
+                image.style.width = '120px';
+                strip.appendChild(image);
+            });
+            document.getElementById('results-content').prepend(strip);
+        } catch (error) {
+            console.error('Could not load previews:', error);
+        }
+    }
+    
     showToast(message, type = 'info') {
         const toastContainer = document.querySelector('.toast-container');
         const template = document.getElementById('toast-template');
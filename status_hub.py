@@ -0,0 +1,46 @@
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, List, Any, Callable
+
+
+class StatusHub:
+    """Publish/subscribe fan-out of task status changes.
+
+    Publishers run on encode worker threads, so callbacks must not block; the
+    web layer typically hands the delta to its event loop and returns.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)  # task_id -> [callback, ...]
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_id: str, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Register a callback for a task; returns a function that unsubscribes it"""
+        with self._lock:
+            self._subscribers[task_id].append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(task_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._subscribers.pop(task_id, None)
+
+        return unsubscribe
+
+    def publish(self, task_id: str, delta: Dict[str, Any]):
+        """Send a status delta to everyone watching the task"""
+        with self._lock:
+            callbacks = list(self._subscribers.get(task_id, []))
+        for callback in callbacks:
+            try:
+                callback(delta)
+            except Exception as e:
+                logging.error(f"Status subscriber for task {task_id} failed: {str(e)}")
+
+    def subscribed_tasks(self) -> List[str]:
+        """Task ids that currently have at least one subscriber"""
+        with self._lock:
+            return list(self._subscribers)
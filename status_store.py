@@ -0,0 +1,158 @@
+import json
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# States after which a task's status never changes again
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Seconds between background flushes of coalesced status updates
+STATUS_FLUSH_INTERVAL = 2.0
+
+# Task rows loaded per SELECT during a flush
+FLUSH_CHUNK_SIZE = 500
+
+
+class StatusPersister:
+    """Write-behind persistence of task status to the ``processing_tasks`` table.
+
+    Workers only record the latest state in memory; updates for the same task
+    are coalesced and written in one transaction every few seconds. Terminal
+    states trigger an immediate flush, and a failed flush puts its updates
+    back so they are retried rather than lost.
+    """
+
+    def __init__(self, flush_interval: float = STATUS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = {}  # task_id -> coalesced column values
+        self._inflight = {}  # updates taken by the flush that is writing right now
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def record(self, task_id: str, status: str, progress: int, message: str,
+               output_file: Optional[str] = None, metrics: Optional[Dict[str, Any]] = None,
+               outputs: Optional[List[Dict[str, Any]]] = None):
+        """Queue a status change for the next flush; never touches the database"""
+        now = datetime.utcnow()
+        metrics = metrics or {}
+        with self._lock:
+            entry = self._pending.setdefault(task_id, {})
+            entry.update(
+                status=status,
+                progress=progress,
+                message=message,
+                eta_seconds=metrics.get('eta_seconds'),
+                encode_speed=metrics.get('speed'),
+                updated_at=now
+            )
+            if output_file:
+                entry['output_file'] = output_file
+            if outputs:
+                entry['outputs'] = outputs
+            # Event times are taken now, not when the flush happens to run
+            if status == 'processing':
+                entry.setdefault('started_at', now)
+            if status == 'completed':
+                entry['completed_at'] = now
+            self._ensure_thread()
+
+        if status in TERMINAL_STATUSES:
+            self._wake.set()
+
+    def pending(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Update recorded for a task that has not reached the database yet"""
+        with self._lock:
+            entry = dict(self._inflight.get(task_id, {}), **self._pending.get(task_id, {}))
+            return entry or None
+
+    def flush(self) -> bool:
+        """Write all pending updates in one transaction; returns False if it failed"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return True
+
+            try:
+                self._write(batch)
+                return True
+            except Exception as e:
+                logging.error(f"Failed to flush {len(batch)} task status update(s): {str(e)}")
+                self._requeue(batch)
+                return False
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+    def _ensure_thread(self):
+        """Start the background flusher (caller holds the lock)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='status-flusher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _requeue(self, batch: Dict[str, Dict[str, Any]]):
+        """Put unwritten updates back underneath anything recorded since"""
+        with self._lock:
+            for task_id, fields in batch.items():
+                newer = self._pending.get(task_id, {})
+                merged = dict(fields, **newer)
+                if 'started_at' in fields:
+                    merged['started_at'] = fields['started_at']
+                self._pending[task_id] = merged
+
+    def _write(self, batch: Dict[str, Dict[str, Any]]):
+        from sqlalchemy.orm import selectinload
+        from models import db, ProcessingTask, ProcessingHistory
+        from app import app
+
+        task_ids = list(batch)
+        with app.app_context():
+            for start in range(0, len(task_ids), FLUSH_CHUNK_SIZE):
+                chunk = task_ids[start:start + FLUSH_CHUNK_SIZE]
+                tasks = ProcessingTask.query.options(selectinload(ProcessingTask.uploaded_files)).filter(
+                    ProcessingTask.task_id.in_(chunk)
+                )
+                for task in tasks:
+                    self._apply(db, ProcessingHistory, task, batch[task.task_id])
+            db.session.commit()
+
+    def _apply(self, db, ProcessingHistory, task, fields: Dict[str, Any]):
+        """Copy coalesced fields onto a task row and record history on completion"""
+        for column in ('status', 'progress', 'message', 'eta_seconds', 'encode_speed', 'updated_at'):
+            setattr(task, column, fields[column])
+        if fields.get('output_file'):
+            task.output_file = fields['output_file']
+        if fields.get('outputs'):
+            task.outputs = json.dumps(fields['outputs'])
+        if fields.get('started_at') and not task.started_at:
+            task.started_at = fields['started_at']
+
+        if fields['status'] == 'completed':
+            task.completed_at = fields.get('completed_at', fields['updated_at'])
+            db.session.add(ProcessingHistory(
+                task_id=task.task_id,
+                operation=task.operation,
+                status='completed',
+                input_files_count=len(task.uploaded_files),
+                output_file=task.output_file,
+                processing_time_seconds=(
+                    (task.completed_at - task.started_at).total_seconds()
+                    if task.started_at else None
+                ),
+                file_sizes_total=sum(f.file_size or 0 for f in task.uploaded_files)
+            ))
+        elif fields['status'] == 'failed':
+            task.error_message = fields['message']
@@ -0,0 +1,44 @@
+from typing import List
+
+# Largest frame an audiogram gets; bigger images are scaled down once up front
+STILL_MAX_WIDTH = 1920
+STILL_MAX_HEIGHT = 1080
+
+# The image is read at this rate instead of image2's default 25 fps, so no
+# frames are decoded only to be dropped again
+STILL_FRAME_RATE = 1
+
+# Keyframe interval in frames (seconds at STILL_FRAME_RATE); a static picture
+# compresses to almost nothing between keyframes
+STILL_GOP_FRAMES = 60
+
+# Fit inside the cap, keep the aspect ratio and round to even sizes for yuv420p
+SCALE_FILTER = (
+    f"scale=w='min(iw,{STILL_MAX_WIDTH})':h='min(ih,{STILL_MAX_HEIGHT})'"
+    ":force_original_aspect_ratio=decrease:force_divisible_by=2"
+)
+
+
+def prescale_command(image_path: str, still_path: str) -> List[str]:
+    """Scale the image once into the frame that gets looped"""
+    return ['ffmpeg', '-y', '-i', image_path, '-vf', SCALE_FILTER, '-frames:v', '1', '-update', '1', still_path]
+
+
+def still_video_command(still_path: str, audio_path: str, output_path: str,
+                        audio_codec: str, output_args: List[str], video_codec: str = 'libx264') -> List[str]:
+    """Loop the pre-scaled frame for as long as the audio runs.
+
+    ``-shortest`` ends the output with the audio, so its duration does not
+    have to be known up front.
+    """
+    return [
+        'ffmpeg', '-y',
+        '-loop', '1', '-framerate', str(STILL_FRAME_RATE), '-i', still_path,
+        '-i', audio_path,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', video_codec,
+        '-pix_fmt', 'yuv420p',
+        '-g', str(STILL_GOP_FRAMES),
+        '-c:a', audio_codec,
+        '-shortest'
+    ] + output_args + [output_path]
@@ -0,0 +1,126 @@
+import os
+import time
+import shutil
+from typing import Dict, List, Any, Tuple, Callable, Iterator, Optional
+
+# Streaming jobs write into outputs/streams/<task_id>/ so clients can find the
+# output from the task id alone while it is still being encoded
+STREAM_DIRNAME = 'streams'
+STREAM_FILES = {'fmp4': 'stream.mp4', 'hls': 'index.m3u8'}
+
+# Fragment / segment length; playback can start once the first one is written
+SEGMENT_SECONDS = 4
+
+TAIL_CHUNK_SIZE = 256 * 1024
+TAIL_POLL_INTERVAL = 0.5
+
+
+def stream_dir(output_folder: str, task_id: str) -> str:
+    return os.path.join(output_folder, STREAM_DIRNAME, task_id)
+
+
+def stream_output_dir(output_folder: str, output_file: str) -> Optional[str]:
+    """Stream directory holding a streaming job's output file, or None for a plain output"""
+    parts = os.path.normpath(output_file).split(os.sep)
+    if len(parts) == 3 and parts[0] == STREAM_DIRNAME:
+        return stream_dir(output_folder, parts[1])
+    return None
+
+
+def stream_url(task_id: str, mode: str) -> str:
+    """Where a client can start playing a streaming job's output"""
+    return f"/stream/{task_id}/{STREAM_FILES[mode]}"
+
+
+def stream_output(mode: str, output_folder: str, task_id: str) -> Tuple[str, str, Dict[str, Any]]:
+    """Output file (relative to the output folder), its path and the ffmpeg output options.
+
+    ``fmp4`` writes a fragmented MP4 whose header comes first, so the file is
+    playable while it grows; ``hls`` writes an EVENT playlist of fMP4
+    segments that grows as encoding proceeds.
+    """
+    if mode not in STREAM_FILES:
+        raise ValueError(f"Unknown streaming mode: {mode} (use one of {', '.join(STREAM_FILES)})")
+
+    directory = stream_dir(output_folder, task_id)
+    os.makedirs(directory, exist_ok=True)
+    output_file = os.path.join(STREAM_DIRNAME, task_id, STREAM_FILES[mode])
+
+    if mode == 'fmp4':
+        options = {
+            'movflags': '+frag_keyframe+empty_moov+default_base_moof',
+            'frag_duration': SEGMENT_SECONDS * 1_000_000  # microseconds
+        }
+    else:
+        options = {
+            'f': 'hls',
+            'hls_time': SEGMENT_SECONDS,
+            'hls_playlist_type': 'event',
+            'hls_segment_type': 'fmp4',
+            'hls_fmp4_init_filename': 'init.mp4',
+            'hls_segment_filename': os.path.join(directory, 'segment_%05d.m4s'),
+            # temp_file: segments appear only once complete, so they can be served as written
+            'hls_flags': 'independent_segments+temp_file'
+        }
+    return output_file, os.path.join(output_folder, output_file), options
+
+
+def keyframe_options() -> Dict[str, Any]:
+    """Force a keyframe at every segment boundary when the video is re-encoded"""
+    return {'force_key_frames': f'expr:gte(t,n_forced*{SEGMENT_SECONDS})'}
+
+
+def as_argv(options: Dict[str, Any]) -> List[str]:
+    """ffmpeg-python style output options as command-line arguments"""
+    args = []
+    for key, value in options.items():
+        args.append(f'-{key}')
+        if value is not None:
+            args.append(str(value))
+    return args
+
+
+def stream_file_path(output_folder: str, task_id: str, name: str) -> Optional[str]:
+    """Path of a file in a task's stream directory, or None if the name is not a plain file name"""
+    if not name or name != os.path.basename(name) or name.startswith('.'):
+        return None
+    if not task_id or task_id != os.path.basename(task_id) or task_id.startswith('.'):
+        return None
+    return os.path.join(stream_dir(output_folder, task_id), name)
+
+
+def tail_file(path: str, is_running: Callable[[], bool]) -> Iterator[bytes]:
+    """Yield a file's bytes, waiting for more while the encode writing it is running"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(TAIL_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+                continue
+            if not is_running():
+                # Pick up anything written between the last read and the final status
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+            time.sleep(TAIL_POLL_INTERVAL)
+
+
+def cleanup_streams(output_folder: str, max_age_seconds: int) -> int:
+    """Remove stream directories that have not been written to for ``max_age_seconds``"""
+    root = os.path.join(output_folder, STREAM_DIRNAME)
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    now = time.time()
+    for task_id in os.listdir(root):
+        directory = os.path.join(root, task_id)
+        if not os.path.isdir(directory):
+            continue
+        # A growing fMP4 does not touch the directory mtime, so look at the files too
+        newest = max([os.path.getmtime(directory)] +
+                     [entry.stat().st_mtime for entry in os.scandir(directory)])
+        if now - newest > max_age_seconds:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
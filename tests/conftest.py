@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    """The Flask app on a throwaway SQLite database (set before app is first imported)"""
+    database = tmp_path_factory.mktemp('db') / 'test.db'
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    from app import app
+    return app
+
+
+@pytest.fixture
+def db_session(flask_app):
+    """Empty tables for each test"""
+    from models import db
+
+    with flask_app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+    yield db
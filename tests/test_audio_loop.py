@@ -0,0 +1,98 @@
+import os
+
+import ffmpeg
+import pytest
+
+from audio_loop import (looped_audio, looped_stream, loop_duration, crossfade_seconds, write_concat_list,
+                        LOOP_BUFFER_MAX_SECONDS, MAX_LOOP_SECONDS)
+
+
+def probe(duration, sample_rate=44100):
+    return {'format': {'duration': str(duration)},
+            'streams': [{'codec_type': 'audio', 'sample_rate': str(sample_rate)}]}
+
+
+def compiled(stream):
+    return ' '.join(ffmpeg.compile(stream.output('out.mp3')))
+
+
+def test_crossfade_seconds():
+    assert crossfade_seconds({}) == 0
+    assert crossfade_seconds({'crossfade': '1.5'}) == 1.5
+    with pytest.raises(ValueError):
+        crossfade_seconds({'crossfade': -1})
+
+
+def test_source_long_enough_is_only_trimmed():
+    stream, concat_list, mode = looped_audio('in.wav', probe(30), 20)
+    assert (mode, concat_list) == ('trim', None)
+    assert 'aloop' not in compiled(stream)
+
+
+def test_copy_loops_through_the_concat_demuxer():
+    stream, concat_list, mode = looped_audio('in.wav', probe(10), 25, copy=True)
+    try:
+        assert mode == 'copy'
+        with open(concat_list) as f:
+            assert f.read().count(f"file '{os.path.abspath('in.wav')}'") == 3
+        assert '-f concat -safe 0' in compiled(stream)
+    finally:
+        os.remove(concat_list)
+
+
+def test_decoded_loop_repeats_samples_once_decoded():
+    stream, concat_list, mode = looped_audio('in.wav', probe(10, 48000), 25)
+    assert (mode, concat_list) == ('aloop', None)
+    assert 'aloop=loop=-1:size=480000' in compiled(stream)
+
+
+def test_crossfaded_loop_overlaps_every_seam():
+    stream, _, mode = looped_audio('in.wav', probe(10, 48000), 25, crossfade=1)
+    args = compiled(stream)
+    assert mode == 'aloop'
+    assert 'acrossfade=d=1' in args
+    # The repeated cycle is the source minus one crossfade
+    assert 'aloop=loop=-1:size=432000' in args
+
+
+def test_long_sources_fall_back_to_stream_loop():
+    stream, _, mode = looped_audio('in.wav', probe(LOOP_BUFFER_MAX_SECONDS + 1), 3000)
+    assert mode == 'stream_loop'
+    assert '-stream_loop 3 -i in.wav' in compiled(stream)  # 4 plays cover 3000 s
+    with pytest.raises(ValueError):
+        looped_audio('in.wav', probe(LOOP_BUFFER_MAX_SECONDS + 1), 3000, crossfade=1)
+
+
+def test_invalid_sources():
+    with pytest.raises(ValueError):
+        looped_audio('in.wav', {'format': {}, 'streams': []}, 10)
+    with pytest.raises(ValueError):
+        looped_audio('in.wav', probe(2), 10, crossfade=1)
+
+
+def test_concat_list_escapes_quotes(tmp_path):
+    list_path = write_concat_list(["it's.wav"], str(tmp_path))
+    with open(list_path) as f:
+        assert f.read() == f"file '{os.path.abspath('it')}'\\''s.wav'\n"
+
+
+def test_loop_duration():
+    assert loop_duration({}) == 60
+    assert loop_duration({'duration': '90'}) == 90
+    for duration in (0, -5, MAX_LOOP_SECONDS + 1, 'inf', 'nan'):
+        with pytest.raises(ValueError):
+            loop_duration({'duration': duration})
+
+
+def test_looped_stream_repeats_a_filtered_source():
+    # e.g. the output of a mix in the same graph
+    stream = looped_stream(ffmpeg.input('in.wav').audio.filter('volume', 2), 10, 25, 48000)
+    args = compiled(stream)
+    assert 'atrim=end=10' in args
+    assert 'aloop=loop=-1:size=480000' in args
+
+
+def test_looped_stream_only_trims_long_enough_sources():
+    assert 'aloop' not in compiled(looped_stream(ffmpeg.input('in.wav').audio, 30, 20, 48000))
+    with pytest.raises(ValueError):
+        looped_stream(ffmpeg.input('in.wav').audio, LOOP_BUFFER_MAX_SECONDS + 1, 2000, 48000)
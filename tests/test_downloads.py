@@ -0,0 +1,71 @@
+import os
+from email.utils import formatdate
+
+import downloads
+from downloads import (resolve_output_path, is_not_modified, file_etag, content_disposition, wants_inline,
+                       offload_headers)
+
+
+def stat_of(tmp_path):
+    path = tmp_path / 'out.mp4'
+    path.write_bytes(b'data')
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+    return os.stat(path)
+
+
+def test_resolve_output_path_allows_sub_folders():
+    assert resolve_output_path('outputs', 'a.mp4') == os.path.join('outputs', 'a.mp4')
+    assert resolve_output_path('outputs', 'streams/t/index.m3u8') == os.path.join('outputs', 'streams/t/index.m3u8')
+
+
+def test_resolve_output_path_rejects_escapes():
+    for name in ('../app.py', 'streams/../../app.py', '/etc/passwd'):
+        assert resolve_output_path('outputs', name) is None
+
+
+def test_if_none_match(tmp_path):
+    stat = stat_of(tmp_path)
+    etag = file_etag(stat)
+
+    assert is_not_modified({'if-none-match': etag}, etag, stat)
+    assert is_not_modified({'if-none-match': f'"other", W/{etag}'}, etag, stat)
+    assert is_not_modified({'if-none-match': '*'}, etag, stat)
+    assert not is_not_modified({'if-none-match': '"other"'}, etag, stat)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(tmp_path):
+    stat = stat_of(tmp_path)
+    headers = {'if-none-match': '"other"', 'if-modified-since': formatdate(stat.st_mtime + 60, usegmt=True)}
+    assert not is_not_modified(headers, file_etag(stat), stat)
+
+
+def test_if_modified_since(tmp_path):
+    stat = stat_of(tmp_path)
+    etag = file_etag(stat)
+
+    assert is_not_modified({'if-modified-since': formatdate(stat.st_mtime, usegmt=True)}, etag, stat)
+    assert is_not_modified({'if-modified-since': formatdate(stat.st_mtime + 60, usegmt=True)}, etag, stat)
+    assert not is_not_modified({'if-modified-since': formatdate(stat.st_mtime - 60, usegmt=True)}, etag, stat)
+    assert not is_not_modified({'if-modified-since': 'not a date'}, etag, stat)
+    assert not is_not_modified({}, etag, stat)
+
+
+def test_etag_changes_with_the_file(tmp_path):
+    stat = stat_of(tmp_path)
+    (tmp_path / 'out.mp4').write_bytes(b'longer data')
+    assert file_etag(os.stat(tmp_path / 'out.mp4')) != file_etag(stat)
+
+
+def test_content_disposition():
+    assert content_disposition('a.mp4', inline=True) == 'inline; filename="a.mp4"'
+    assert content_disposition('é.mp4', inline=False) == \
+        "attachment; filename=\".mp4\"; filename*=UTF-8''%C3%A9.mp4"
+    assert wants_inline('1') and wants_inline('True') and not wants_inline(None)
+
+
+def test_offload_headers_name_only_the_file(monkeypatch):
+    monkeypatch.setattr(downloads, 'DOWNLOAD_OFFLOAD', 'x-accel')
+    headers = offload_headers('stream_1/index.m3u8', '/outputs/stream_1/index.m3u8', inline=False)
+
+    assert headers['X-Accel-Redirect'] == '/protected-outputs/stream_1/index.m3u8'
+    assert headers['Content-Disposition'] == 'attachment; filename="index.m3u8"'
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+from executor import FFmpegExecutor, ExecutionLimits, FFmpegError
+
+
+@pytest.fixture
+def executor():
+    return FFmpegExecutor(ExecutionLimits(ionice=False))
+
+
+@pytest.fixture
+def fifo(tmp_path):
+    path = str(tmp_path / 'stage.nut')
+    os.mkfifo(path)
+    return path
+
+
+def test_timeout_scales_with_duration_within_bounds():
+    limits = ExecutionLimits(timeout_factor=30, min_timeout_seconds=600, max_timeout_seconds=7200,
+                             default_timeout_seconds=1800)
+    assert limits.timeout_for(10) == 600
+    assert limits.timeout_for(100) == 3000
+    # A huge loop_audio duration does not buy an equally huge budget
+    assert limits.timeout_for(10 ** 6) == 7200
+    # Prescale, previews and unprobed inputs still get a limit
+    assert limits.timeout_for(None) == 1800
+
+
+def test_fixed_timeout_wins():
+    assert ExecutionLimits(timeout_seconds=60).timeout_for(10 ** 6) == 60
+
+
+def command(tmp_path, name, body):
+    """Stand-in for ffmpeg: a script that takes the pipe as its last argument"""
+    path = tmp_path / name
+    path.write_text(f"#!{sys.executable}\nimport sys\n{body}\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_feeder_may_end_on_a_broken_pipe(executor, fifo, tmp_path):
+    # The reader stops early (as with -t or -shortest) while the feeder still writes
+    feeder = command(tmp_path, 'feeder', "out = open(sys.argv[-1], 'wb')\nwhile True:\n    out.write(b'x' * 65536)")
+    reader = command(tmp_path, 'reader', "open(sys.argv[-1], 'rb').read(1000)\nprint('progress=end')")
+    executor.run_piped('task', [reader, fifo], [[feeder, fifo]])
+
+
+def test_feeder_failure_stops_the_reader(executor, fifo, tmp_path):
+    # Never opens the pipe, which would leave the reader blocked forever
+    feeder = command(tmp_path, 'feeder', "sys.stderr.write('input.wav: No such file\\n')\nsys.exit(1)")
+    reader = command(tmp_path, 'reader', "open(sys.argv[-1], 'rb').read()")
+    with pytest.raises(FFmpegError, match='No such file'):
+        executor.run_piped('task', [reader, fifo], [[feeder, fifo]])
+
+
+def test_reader_failure_is_reported(executor, fifo, tmp_path):
+    feeder = command(tmp_path, 'feeder', "open(sys.argv[-1], 'wb').write(b'x')")
+    reader = command(tmp_path, 'reader', "open(sys.argv[-1], 'rb').read()\nsys.stderr.write('Invalid data\\n')\nsys.exit(1)")
+    with pytest.raises(FFmpegError, match='Invalid data'):
+        executor.run_piped('task', [reader, fifo], [[feeder, fifo]])
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from state_backend import MemoryBackend
+
+
+def job(task_id, operation='convert_format'):
+    return {'task_id': task_id, 'operation': operation, 'files': [], 'options': {},
+            'upload_folder': 'uploads', 'output_folder': 'outputs'}
+
+
+def lease(flask_app, task_id):
+    from models import ProcessingTask
+
+    with flask_app.app_context():
+        task = ProcessingTask.query.filter_by(task_id=task_id).first()
+        return task.lease_owner, task.lease_expires_at
+
+
+def expire_lease(flask_app, task_id):
+    from models import db, ProcessingTask
+
+    with flask_app.app_context():
+        ProcessingTask.query.filter_by(task_id=task_id).update(
+            {'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.session.commit()
+
+
+def test_queued_jobs_are_leased_to_their_process(flask_app, db_session):
+    backend = MemoryBackend()
+    backend.push_jobs([job('a')])
+
+    owner, expires_at = lease(flask_app, 'a')
+    assert owner == backend.worker_id
+    assert expires_at > datetime.utcnow()
+    assert MemoryBackend().adopt(['a']) == []
+
+
+def test_each_orphan_is_adopted_by_one_process(flask_app, db_session):
+    MemoryBackend().push_jobs([job('a'), job('b')])
+    expire_lease(flask_app, 'a')
+
+    first, second = MemoryBackend(), MemoryBackend()
+    assert first.adopt(['a', 'b']) == ['a']
+    assert second.adopt(['a', 'b']) == []
+    assert lease(flask_app, 'a')[0] == first.worker_id
+
+
+def test_heartbeat_renews_queued_and_running_jobs(flask_app, db_session):
+    backend = MemoryBackend()
+    backend.push_jobs([job('running'), job('queued')])
+    assert backend.pop_job(0)['task_id'] == 'running'
+    for task_id in ('queued', 'running'):
+        expire_lease(flask_app, task_id)
+
+    backend.heartbeat(['running'])
+    assert all(lease(flask_app, task_id)[1] > datetime.utcnow() for task_id in ('queued', 'running'))
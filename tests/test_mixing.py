@@ -0,0 +1,96 @@
+import ffmpeg
+import pytest
+
+import mixing
+from mixing import (loudnorm_targets, track_settings, duration_policy, mix_duration, measure_command,
+                    parse_measurement, track_stream, mix_streams, measured_mix_command, submix_groups,
+                    cached_measurement, store_measurement, LOUDNORM_DEFAULTS)
+
+MEASUREMENT = {'input_i': '-20.1', 'input_tp': '-3.0', 'input_lra': '5.0',
+               'input_thresh': '-30.5', 'target_offset': '0.3'}
+
+
+def compiled(*outputs):
+    return ' '.join(ffmpeg.compile(ffmpeg.merge_outputs(*outputs) if len(outputs) > 1 else outputs[0]))
+
+
+def test_loudnorm_targets():
+    assert loudnorm_targets({}) is None
+    assert loudnorm_targets({'loudnorm': True}) == LOUDNORM_DEFAULTS
+    assert loudnorm_targets({'loudnorm': {'I': '-23'}})['I'] == -23.0
+    with pytest.raises(ValueError):
+        loudnorm_targets({'loudnorm': {'loudness': -23}})
+
+
+def test_track_settings():
+    settings = track_settings({'tracks': [{'gain_db': -3}, {'offset': 2.5}]}, 3)
+    assert settings == [{'gain_db': -3.0, 'offset': 0.0}, {'gain_db': 0.0, 'offset': 2.5},
+                        {'gain_db': 0.0, 'offset': 0.0}]
+    with pytest.raises(ValueError):
+        track_settings({'tracks': [{}, {}]}, 1)
+    with pytest.raises(ValueError):
+        track_settings({'tracks': [{'offset': -1}]}, 1)
+
+
+def test_duration_policies():
+    ends = [10.0, 30.0, 20.0]
+    assert mix_duration(ends, duration_policy({})) == 30.0
+    assert mix_duration(ends, duration_policy({'duration_policy': 'shortest'})) == 10.0
+    assert mix_duration(ends, duration_policy({'duration_policy': 'first'})) == 10.0
+    with pytest.raises(ValueError):
+        duration_policy({'duration_policy': 'average'})
+
+
+def test_measure_command_only_analyses():
+    args = measure_command('in.wav', LOUDNORM_DEFAULTS)
+    assert args[args.index('-af') + 1] == 'loudnorm=I=-16:TP=-1.5:LRA=11:print_format=json'
+    assert args[-3:] == ['-f', 'null', '-']
+
+
+def test_parse_measurement_reads_the_last_json_block():
+    stderr = 'Input #0 {not json}\n[Parsed_loudnorm_0 @ 0x1]\n{\n "input_i" : "-20.1"\n}\n[out#0/null] done\n'
+    assert parse_measurement(stderr) == {'input_i': '-20.1'}
+    with pytest.raises(ValueError):
+        parse_measurement('no report')
+
+
+def test_track_stream_applies_the_second_pass_then_gain_and_offset():
+    stream = track_stream('in.wav', {'gain_db': -6, 'offset': 1.5}, LOUDNORM_DEFAULTS, MEASUREMENT)
+    args = compiled(stream.output('out.wav'))
+    graph = args[args.index('-filter_complex') + len('-filter_complex '):].split(' ')[0]
+    filters = [part.split('=')[0].split(']')[-1] for part in graph.split(';')]
+    assert filters == ['loudnorm', 'aresample', 'aformat', 'volume', 'adelay']
+    assert 'linear=true' in graph and 'measured_I=-20.1' in graph
+    assert 'adelay=all=1:delays=1500' in graph
+
+
+def test_mix_sums_at_unity_gain():
+    args = compiled(mix_streams([track_stream('a.wav'), track_stream('b.wav')]).output('out.wav'))
+    assert 'amix=dropout_transition=0:duration=longest:inputs=2:normalize=0' in args
+
+
+def test_measured_mix_renders_and_measures_in_one_run():
+    mixed = mix_streams([track_stream('a.wav'), track_stream('b.wav')])
+    args = compiled(measured_mix_command(mixed, 'mix.wav', LOUDNORM_DEFAULTS, 12.5))
+    assert args.count(' -i ') == 2
+    assert 'asplit=2' in args
+    assert 'loudnorm=I=-16.0:LRA=11.0:TP=-1.5:print_format=json' in args
+    assert '-acodec pcm_f32le -t 12.5 mix.wav' in args
+    assert args.endswith('-f null -t 12.5 -')
+
+
+def test_submix_groups():
+    assert submix_groups(3) == [range(0, 3)]
+    assert [len(group) for group in submix_groups(2 * mixing.MIX_FANIN + 1)] == \
+        [mixing.MIX_FANIN, mixing.MIX_FANIN, 1]
+
+
+def test_measurements_are_cached_per_file_version(tmp_path):
+    path = tmp_path / 'a.wav'
+    path.write_bytes(b'one')
+    store_measurement(str(path), LOUDNORM_DEFAULTS, MEASUREMENT)
+    assert cached_measurement(str(path), LOUDNORM_DEFAULTS) == MEASUREMENT
+    assert cached_measurement(str(path), dict(LOUDNORM_DEFAULTS, I=-23.0)) is None
+
+    path.write_bytes(b'changed')
+    assert cached_measurement(str(path), LOUDNORM_DEFAULTS) is None
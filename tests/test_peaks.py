@@ -0,0 +1,110 @@
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import peaks
+from peaks import compute_peaks, load_peaks, peaks_response, PEAKS_SAMPLE_RATE, BASE_SAMPLES_PER_POINT
+
+
+@pytest.fixture
+def raw_decoder(monkeypatch):
+    """Stand-in for ffmpeg that 'decodes' a file of raw float32 samples"""
+    def decode_args(path):
+        return [sys.executable, '-c',
+                'import shutil, sys; shutil.copyfileobj(open(sys.argv[1], "rb"), sys.stdout.buffer)', path]
+    monkeypatch.setattr(peaks, '_decode_args', decode_args)
+
+
+def write_samples(tmp_path, samples):
+    path = tmp_path / 'audio.f32'
+    path.write_bytes(np.asarray(samples, dtype='<f4').tobytes())
+    return str(path)
+
+
+def analyse(path, tmp_path, name):
+    output = str(tmp_path / name)
+    header = compute_peaks(path, output)
+    _, arrays = load_peaks(output)
+    return header, [np.array(array) for array in arrays]
+
+
+def tone(seconds, amplitude=0.5):
+    t = np.arange(int(seconds * PEAKS_SAMPLE_RATE)) / PEAKS_SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * 440 * t)
+
+
+def test_results_do_not_depend_on_chunk_boundaries(tmp_path, raw_decoder, monkeypatch):
+    # Not a whole number of points, so every level has a partial last point
+    rng = np.random.default_rng(0)
+    path = write_samples(tmp_path, rng.uniform(-0.9, 0.9, 300_001))
+
+    whole_header, whole = analyse(path, tmp_path, 'whole.peaks')
+    monkeypatch.setattr(peaks, 'CHUNK_POINTS', 3)  # 768 samples per read
+    chunked_header, chunked = analyse(path, tmp_path, 'chunked.peaks')
+
+    assert chunked_header == whole_header
+    for level_whole, level_chunked in zip(whole, chunked):
+        assert np.array_equal(level_whole, level_chunked)
+
+
+def test_levels_match_a_direct_reduction(tmp_path, raw_decoder, monkeypatch):
+    monkeypatch.setattr(peaks, 'CHUNK_POINTS', 5)
+    samples = np.random.default_rng(1).uniform(-1, 1, BASE_SAMPLES_PER_POINT * 64 + 100).astype(np.float32)
+    header, arrays = analyse(write_samples(tmp_path, samples), tmp_path, 'out.peaks')
+
+    for info, array in zip(header['levels'], arrays):
+        size = info['samples_per_point']
+        count = -(-len(samples) // size)
+        assert info['count'] == len(array) == count
+        blocks = [samples[index * size:(index + 1) * size].astype(np.float64) for index in range(count)]
+        expected = np.array([[block.min(), block.max(), np.sqrt(np.square(block).mean())] for block in blocks])
+        assert np.abs(array / 32767 - expected).max() < 1e-4
+    assert header['duration'] == round(len(samples) / PEAKS_SAMPLE_RATE, 3)
+
+
+def test_silence_regions_across_chunks(tmp_path, raw_decoder, monkeypatch):
+    monkeypatch.setattr(peaks, 'CHUNK_POINTS', 4)
+    gap = np.zeros(PEAKS_SAMPLE_RATE)  # long enough
+    blip = np.zeros(PEAKS_SAMPLE_RATE // 10)  # too short to count
+    samples = np.concatenate([tone(1), gap, tone(1), blip, tone(1), gap])
+    header, _ = analyse(write_samples(tmp_path, samples), tmp_path, 'out.peaks')
+
+    regions = header['silence']
+    assert len(regions) == 2
+    (start, end), (last_start, last_end) = regions
+    point = BASE_SAMPLES_PER_POINT / PEAKS_SAMPLE_RATE
+    assert abs(start - 1) <= point and abs(end - 2) <= point
+    assert abs(last_start - 4.1) <= point
+    # Silence running to the end of the file is closed there
+    assert abs(last_end - header['duration']) <= point
+
+
+def test_loudness_summary(tmp_path, raw_decoder):
+    header, _ = analyse(write_samples(tmp_path, tone(2, amplitude=0.5)), tmp_path, 'out.peaks')
+    assert header['peak_db'] == pytest.approx(-6.02, abs=0.05)
+    assert header['rms_db'] == pytest.approx(-9.03, abs=0.05)  # sine RMS is 3 dB below its peak
+
+
+def test_failed_decode_reports_stderr(tmp_path, monkeypatch):
+    monkeypatch.setattr(peaks, '_decode_args', lambda path: [
+        sys.executable, '-c', 'import sys; sys.stderr.write("x" * 200000 + "broken"); sys.exit(1)'
+    ])
+    with pytest.raises(RuntimeError, match='broken'):
+        compute_peaks('unused', str(tmp_path / 'out.peaks'))
+
+
+def test_peaks_response_slices_a_level(tmp_path, raw_decoder):
+    path = write_samples(tmp_path, tone(3))
+    output = str(tmp_path / 'out.peaks')
+    compute_peaks(path, output)
+
+    response = peaks_response(output, level=0, start=1, end=2)
+    seconds_per_point = BASE_SAMPLES_PER_POINT / PEAKS_SAMPLE_RATE
+    assert response['start'] == pytest.approx(1, abs=seconds_per_point)
+    assert len(response['data']) == pytest.approx(1 / seconds_per_point, abs=2)
+    with pytest.raises(ValueError):
+        peaks_response(output, level=99)
+    with pytest.raises(ValueError):
+        peaks_response(output, start=2, end=1)
@@ -0,0 +1,147 @@
+import pytest
+
+from pipeline import parse_pipeline, plan_pipeline, MAX_PIPELINE_STAGES
+
+FILES = [
+    {'saved_name': 'a.mp3', 'original_name': 'a.mp3', 'file_type': 'audio'},
+    {'saved_name': 'b.mp3', 'original_name': 'b.mp3', 'file_type': 'audio'},
+    {'saved_name': 'v.mp4', 'original_name': 'v.mp4', 'file_type': 'video'},
+    {'saved_name': 'i.png', 'original_name': 'i.png', 'file_type': 'image'},
+]
+
+
+def stages(*specs, **options):
+    return dict(options, stages=list(specs))
+
+
+def test_parse_resolves_inputs_and_types():
+    parsed = parse_pipeline(FILES, stages(
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 'b.mp3']},
+        {'operation': 'merge_audio_video', 'inputs': [2, {'stage': 'mix'}]},
+    ))
+
+    mix, video = parsed
+    assert mix['inputs'] == [{'file': FILES[0]}, {'file': FILES[1]}]
+    assert (mix['output_type'], mix['final']) == ('audio', False)
+    assert video['id'] == 'stage2'
+    assert video['inputs'][1] == {'stage': 'mix'}
+    assert (video['output_type'], video['final']) == ('video', True)
+
+
+def test_job_options_apply_to_stages_unless_overridden():
+    parsed = parse_pipeline(FILES, stages(
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 1], 'options': {'profile': 'fast'}},
+        {'operation': 'convert_format', 'inputs': [{'stage': 'mix'}], 'options': {'target_format': 'wav'}},
+        profile='archive', streaming='hls', cache=False, thumbnails=3,
+    ))
+
+    assert parsed[0]['options'] == {'profile': 'fast'}
+    assert parsed[1]['options'] == {'profile': 'archive', 'streaming': 'hls', 'target_format': 'wav'}
+
+
+def test_convert_format_output_type_follows_target():
+    parsed = parse_pipeline(FILES, stages(
+        {'id': 'audio', 'operation': 'convert_format', 'inputs': [2], 'options': {'target_format': 'mp3'}},
+        {'id': 'video', 'operation': 'convert_format', 'inputs': [2], 'options': {'target_format': 'avi'}},
+        {'operation': 'merge_audio_video', 'inputs': [{'stage': 'video'}, {'stage': 'audio'}]},
+    ))
+    assert [stage['output_type'] for stage in parsed] == ['audio', 'video', 'video']
+
+
+@pytest.mark.parametrize('options, message', [
+    ({}, 'non-empty'),
+    ({'stages': []}, 'non-empty'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': [0]}] * (MAX_PIPELINE_STAGES + 1)}, 'at most'),
+    ({'stages': ['loop_audio']}, 'must be an object'),
+    ({'stages': [{'operation': 'rm -rf', 'inputs': [0]}]}, 'operation must be one of'),
+    ({'stages': [{'id': 'bad id', 'operation': 'loop_audio', 'inputs': [0]}]}, 'id must be unique'),
+    ({'stages': [{'id': 'x', 'operation': 'loop_audio', 'inputs': [0]},
+                 {'id': 'x', 'operation': 'loop_audio', 'inputs': [{'stage': 'x'}]}]}, 'id must be unique'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': []}]}, 'inputs are required'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': [4]}]}, 'unknown input'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': [True]}]}, 'unknown input'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': [{'stage': 'later'}]},
+                 {'id': 'later', 'operation': 'loop_audio', 'inputs': [0]}]}, 'unknown input'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': [0], 'options': {'intermediate': True}}]}, 'invalid options'),
+    ({'stages': [{'operation': 'loop_audio', 'inputs': [0], 'options': {'streaming': 'hls'}},
+                 {'operation': 'loop_audio', 'inputs': [{'stage': 'stage1'}]}]}, 'only apply to the last stage'),
+    ({'stages': [{'id': 'unused', 'operation': 'loop_audio', 'inputs': [0]},
+                 {'operation': 'loop_audio', 'inputs': [1]}]}, 'never used'),
+])
+def test_invalid_pipelines(options, message):
+    with pytest.raises(ValueError, match=message):
+        parse_pipeline(FILES, options)
+
+
+def test_plan_drops_intermediate_conversions():
+    planned = plan_pipeline(FILES, stages(
+        {'id': 'audio', 'operation': 'convert_format', 'inputs': [2], 'options': {'target_format': 'mp3'}},
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, {'stage': 'audio'}]},
+        {'operation': 'merge_audio_video', 'inputs': [2, {'stage': 'mix'}]},
+    ))
+
+    assert [stage['id'] for stage in planned] == ['mix', 'stage3']
+    # The mix reads the video directly, typed as the audio the conversion would have made
+    assert planned[0]['inputs'][1] == {'file': FILES[2], 'file_type': 'audio'}
+    assert planned[1]['inputs'] == [{'file': FILES[2]}, {'stage': 'mix'}]
+
+
+def test_plan_keeps_chained_elisions_and_final_conversion():
+    planned = plan_pipeline(FILES, stages(
+        {'id': 'one', 'operation': 'convert_format', 'inputs': [2], 'options': {'target_format': 'avi'}},
+        {'id': 'two', 'operation': 'convert_format', 'inputs': [{'stage': 'one'}],
+         'options': {'target_format': 'mp3'}},
+        {'operation': 'convert_format', 'inputs': [{'stage': 'two'}], 'options': {'target_format': 'mp4'}},
+    ))
+
+    assert len(planned) == 1
+    assert planned[0]['inputs'] == [{'file': FILES[2], 'file_type': 'audio'}]
+    assert planned[0]['final']
+
+
+def test_plan_fuses_linear_audio_chains():
+    planned = plan_pipeline(FILES, stages(
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 1]},
+        {'id': 'loop', 'operation': 'loop_audio', 'inputs': [{'stage': 'mix'}], 'options': {'duration': 600}},
+        {'operation': 'convert_format', 'inputs': [{'stage': 'loop'}], 'options': {'target_format': 'wav'}},
+    ))
+
+    assert len(planned) == 1
+    stage = planned[0]
+    assert stage['operation'] == 'merge_audio_tracks+loop_audio+convert_format'
+    assert [member['id'] for member in stage['chain']] == ['mix', 'loop', 'stage3']
+    assert stage['inputs'] == [{'file': FILES[0]}, {'file': FILES[1]}]
+    assert stage['final'] and not stage.get('pipe')
+
+
+def test_plan_does_not_fuse_shared_or_multi_output_stages():
+    planned = plan_pipeline(FILES, stages(
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 1]},
+        {'id': 'loop', 'operation': 'loop_audio', 'inputs': [{'stage': 'mix'}]},
+        {'id': 'both', 'operation': 'merge_audio_tracks', 'inputs': [{'stage': 'mix'}, {'stage': 'loop'}]},
+        {'operation': 'convert_format', 'inputs': [{'stage': 'both'}], 'options': {'targets': [{'format': 'mp3'}]}},
+    ))
+
+    # mix feeds two stages; the final conversion writes several targets
+    assert [stage['id'] for stage in planned] == ['mix', 'loop', 'both', 'stage4']
+    assert not any(stage.get('chain') or stage.get('pipe') for stage in planned)
+
+
+def test_plan_pipes_audio_into_single_pass_consumers():
+    planned = plan_pipeline(FILES, stages(
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 1]},
+        {'id': 'loop', 'operation': 'loop_audio', 'inputs': [{'stage': 'mix'}]},
+        {'operation': 'audio_to_image', 'inputs': [{'stage': 'loop'}, 3]},
+    ))
+
+    assert [stage['id'] for stage in planned] == ['loop', 'stage3']
+    assert planned[0]['chain'] and planned[0]['pipe']
+
+
+def test_plan_writes_audio_a_looping_merge_reads():
+    planned = plan_pipeline(FILES, stages(
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 1]},
+        {'operation': 'merge_audio_video', 'inputs': [2, {'stage': 'mix'}], 'options': {'loop_audio': True}},
+    ))
+
+    assert not planned[0].get('pipe')
@@ -0,0 +1,44 @@
+import pytest
+
+from processing import ProcessingManager
+from state_backend import MemoryBackend
+
+FILES = [
+    {'saved_name': 'a.mp3', 'original_name': 'a.mp3', 'file_type': 'audio'},
+    {'saved_name': 'b.mp3', 'original_name': 'b.mp3', 'file_type': 'audio'},
+]
+
+
+@pytest.fixture
+def manager():
+    return ProcessingManager(state=MemoryBackend())
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    for file in FILES:
+        (tmp_path / file['saved_name']).write_bytes(file['saved_name'].encode())
+    return str(tmp_path)
+
+
+def pipeline(final_options):
+    return {'stages': [
+        {'id': 'mix', 'operation': 'merge_audio_tracks', 'inputs': [0, 1]},
+        {'operation': 'convert_format', 'inputs': [{'stage': 'mix'}], 'options': final_options},
+    ]}
+
+
+def test_single_output_pipelines_are_cached(manager, uploads):
+    key = manager._result_cache_key('task', 'pipeline', FILES, pipeline({'target_format': 'wav'}), uploads)
+    assert key
+
+
+def test_pipelines_ending_in_several_targets_are_not_cached(manager, uploads):
+    # Only the first rendition would come back from the cache
+    options = pipeline({'targets': [{'format': 'mp3'}, {'format': 'wav'}]})
+    assert manager._result_cache_key('task', 'pipeline', FILES, options, uploads) is None
+
+
+def test_multi_target_jobs_are_not_cached(manager, uploads):
+    options = {'targets': [{'format': 'mp3'}, {'format': 'wav'}]}
+    assert manager._result_cache_key('task', 'convert_format', FILES[:1], options, uploads) is None
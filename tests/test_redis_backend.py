@@ -0,0 +1,112 @@
+import json
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from state_backend import RedisBackend, MAX_JOB_ATTEMPTS
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def backend(client):
+    return RedisBackend(client=client, poll_interval=0.01)
+
+
+def job(task_id, operation='convert_format'):
+    return {'task_id': task_id, 'operation': operation, 'files': [], 'options': {},
+            'upload_folder': 'uploads', 'output_folder': 'outputs'}
+
+
+def expire_lease(client, task_id):
+    client.zadd('avf:leases', {task_id: time.time() - 1})
+
+
+def test_create_get_and_update_tasks(backend):
+    backend.create_tasks({'a': {'status': 'queued', 'progress': 0, 'batch_id': 'b'},
+                          'b': {'status': 'queued', 'progress': 0, 'batch_id': 'b'}})
+    backend.add_to_batch('b', ['a', 'b'])
+
+    delta = backend.update_task('a', {'status': 'processing', 'progress': 0})
+    assert delta['status'] == 'processing' and 'progress' not in delta
+    assert backend.get_task('a')['status'] == 'processing'
+    assert [task['status'] for task in backend.get_tasks(['a', 'b', 'missing'])[:2]] == ['processing', 'queued']
+    assert backend.get_tasks(['missing']) == [None]
+    assert backend.update_task('missing', {'status': 'processing'}) is None
+    assert backend.get_batch('b') == ['a', 'b']
+
+
+def test_pops_by_priority_then_fifo(backend):
+    backend.push_jobs([job('low-1'), job('low-2')], priority=0, persist=False)
+    backend.push_jobs([job('high')], priority=5, persist=False)
+
+    assert backend.queue_position('high') == 1
+    assert backend.queue_position('low-2') == 3
+    assert backend.queued_count() == 3
+    assert [backend.pop_job(0.1)['task_id'] for _ in range(3)] == ['high', 'low-1', 'low-2']
+    assert backend.pop_job(0.05) is None
+    assert backend.queue_position('low-1') is None
+
+
+def test_pop_moves_the_job_to_running_with_a_lease(client, backend):
+    backend.push_jobs([job('task')], persist=False)
+    assert backend.pop_job(0.1)['task_id'] == 'task'
+
+    assert not client.hexists('avf:jobs', 'task')
+    assert json.loads(client.hget('avf:running', 'task'))['attempts'] == 1
+    assert client.zscore('avf:leases', 'task') > time.time()
+
+    backend.release('task')
+    assert not client.hexists('avf:running', 'task')
+    assert client.zscore('avf:leases', 'task') is None
+
+
+def test_remove_job_only_drops_waiting_jobs(backend):
+    backend.push_jobs([job('waiting'), job('running')], persist=False)
+    assert backend.pop_job(0.1)['task_id'] == 'waiting'
+
+    assert backend.remove_job('running')
+    assert not backend.remove_job('running')
+    assert not backend.remove_job('waiting')
+    assert backend.pop_job(0.05) is None
+
+
+def test_expired_lease_is_requeued_then_failed(client, backend):
+    backend.create_tasks({'task': {'status': 'queued', 'progress': 0}})
+    backend.push_jobs([job('task')], persist=False)
+
+    for attempt in range(1, MAX_JOB_ATTEMPTS):
+        assert backend.pop_job(0.1)['task_id'] == 'task'
+        backend.heartbeat(['task'])
+        assert backend.requeue_expired() == 0
+        expire_lease(client, 'task')
+        assert backend.requeue_expired() == 1
+        assert backend.get_task('task')['status'] == 'queued'
+
+    assert backend.pop_job(0.1)['task_id'] == 'task'
+    expire_lease(client, 'task')
+    assert backend.requeue_expired() == 0
+    assert backend.get_task('task')['status'] == 'failed'
+    assert backend.pop_job(0.05) is None
+
+
+def test_heartbeat_does_not_revive_an_expired_lease(client, backend):
+    backend.push_jobs([job('task')], persist=False)
+    backend.pop_job(0.1)
+    expire_lease(client, 'task')
+    backend.requeue_expired()
+
+    backend.heartbeat(['task'])
+    assert client.zscore('avf:leases', 'task') is None
+
+
+def test_cancel_request_is_visible_to_other_workers(client, backend):
+    other = RedisBackend(client=client)
+    backend.request_cancel('task')
+    assert other.cancel_requested('task')
+    assert not other.cancel_requested('other')
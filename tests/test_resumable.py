@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+
+from resumable import ResumableUploadStore, ResumableUploadError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResumableUploadStore(str(tmp_path), max_size=1024)
+
+
+def write_chunk(store, upload_id, offset, data):
+    writer = store.open_chunk(upload_id, offset)
+    writer.write(data)
+    return writer.close()
+
+
+def test_offset_advances_with_each_chunk(store):
+    session = store.create('a.mp3', 'audio', 10)
+    assert session['offset'] == 0
+
+    assert write_chunk(store, session['upload_id'], 0, b'hello') == 5
+    assert store.get(session['upload_id'])['offset'] == 5
+    assert write_chunk(store, session['upload_id'], 5, b'world') == 10
+
+
+def test_chunk_at_wrong_offset_is_rejected_with_current_offset(store):
+    session = store.create('a.mp3', 'audio', 10)
+    write_chunk(store, session['upload_id'], 0, b'abc')
+
+    for offset in (0, 5):
+        with pytest.raises(ResumableUploadError) as error:
+            store.open_chunk(session['upload_id'], offset)
+        assert error.value.status_code == 409
+        assert 'byte 3' in str(error.value)
+    assert store.get(session['upload_id'])['offset'] == 3
+
+
+def test_missing_offset_is_rejected(store):
+    session = store.create('a.mp3', 'audio', 10)
+    with pytest.raises(ResumableUploadError) as error:
+        store.open_chunk(session['upload_id'], None)
+    assert error.value.status_code == 400
+
+
+def test_chunk_past_declared_length_is_rejected(store):
+    session = store.create('a.mp3', 'audio', 4)
+    writer = store.open_chunk(session['upload_id'], 0)
+    with pytest.raises(ResumableUploadError) as error:
+        writer.write(b'too long')
+    writer.close()
+    assert error.value.status_code == 413
+    assert store.get(session['upload_id'])['offset'] == 0
+
+
+def test_concurrent_chunk_is_rejected_while_locked(store):
+    session = store.create('a.mp3', 'audio', 10)
+    writer = store.open_chunk(session['upload_id'], 0)
+    try:
+        with pytest.raises(ResumableUploadError) as error:
+            store.open_chunk(session['upload_id'], 0)
+        assert error.value.status_code == 409
+    finally:
+        writer.close()
+
+
+def test_complete_requires_every_byte(store, tmp_path):
+    session = store.create('a.mp3', 'audio', 6)
+    write_chunk(store, session['upload_id'], 0, b'abc')
+    with pytest.raises(ResumableUploadError) as error:
+        store.complete(session['upload_id'], 'a.mp3')
+    assert error.value.status_code == 409
+
+    write_chunk(store, session['upload_id'], 3, b'def')
+    record = store.complete(session['upload_id'], 'saved.mp3')
+    assert record['size'] == 6
+    assert record['original_name'] == 'a.mp3'
+    assert (tmp_path / 'saved.mp3').read_bytes() == b'abcdef'
+    with pytest.raises(ResumableUploadError):
+        store.get(session['upload_id'])
+
+
+def test_size_limits(store):
+    with pytest.raises(ResumableUploadError) as error:
+        store.create('big.mp3', 'audio', 2048)
+    assert error.value.status_code == 413
+    with pytest.raises(ResumableUploadError):
+        store.create('neg.mp3', 'audio', -1)
+
+
+def test_unknown_or_malformed_ids_are_not_found(store):
+    for upload_id in (str(uuid.uuid4()), '../../etc/passwd'):
+        with pytest.raises(ResumableUploadError) as error:
+            store.get(upload_id)
+        assert error.value.status_code == 404
@@ -0,0 +1,44 @@
+import os
+
+import segments
+from segments import segment_count, split_command, split_segments, encode_command, encoded_path
+
+
+def test_short_or_opted_out_videos_are_not_split():
+    assert segment_count(segments.PARALLEL_ENCODE_MIN_SECONDS - 1, {}) == 0
+    assert segment_count(3600, {'parallel': False}) == 0
+    assert segment_count(None, {}) == 0
+
+
+def test_segment_count_is_bounded(monkeypatch):
+    monkeypatch.setattr(segments, 'PARALLEL_ENCODE_MIN_SECONDS', 100)
+    monkeypatch.setattr(segments, 'SEGMENT_PARALLELISM', 4)
+    # Capped by the pool: SEGMENT_PARALLELISM * SEGMENTS_PER_PROCESS
+    assert segment_count(36000, {}) == 4 * segments.SEGMENTS_PER_PROCESS
+    # Capped by the minimum segment length
+    assert segment_count(150, {}) == 2
+    # A single segment is not worth a split
+    assert segment_count(110, {}) == 0
+
+
+def test_split_command_cuts_at_even_points(tmp_path):
+    args = split_command('in.mp4', 900, 3, str(tmp_path))
+    assert args[args.index('-segment_times') + 1] == '300.000,600.000'
+    assert args[args.index('-c') + 1] == 'copy'
+    assert args[-1] == os.path.join(str(tmp_path), 'source_%04d.mkv')
+
+
+def test_split_segments_are_ordered(tmp_path):
+    for index in (10, 2, 1):
+        (tmp_path / f'source_{index:04d}.mkv').write_bytes(b'')
+    (tmp_path / 'encoded_0001.mkv').write_bytes(b'')
+    assert [os.path.basename(path) for path in split_segments(str(tmp_path))] == \
+        ['source_0001.mkv', 'source_0002.mkv', 'source_0010.mkv']
+
+
+def test_encode_command_uses_identical_settings():
+    segment = os.path.join('work', 'source_0003.mkv')
+    args = encode_command(segment, 'libx264', {'preset': 'fast', 'crf': 23})
+    assert args[:8] == ['ffmpeg', '-y', '-i', segment, '-map', '0:v:0', '-c:v', 'libx264']
+    assert args[8:12] == ['-preset', 'fast', '-crf', '23']
+    assert args[-1] == encoded_path(segment) == os.path.join('work', 'encoded_0003.mkv')
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from state_backend import SQLBackend, MAX_JOB_ATTEMPTS
+
+
+@pytest.fixture
+def backend(db_session):
+    return SQLBackend(poll_interval=0.01)
+
+
+def job(task_id, operation='convert_format'):
+    return {'task_id': task_id, 'operation': operation, 'files': [], 'options': {},
+            'upload_folder': 'uploads', 'output_folder': 'outputs'}
+
+
+def row(flask_app, task_id):
+    from models import ProcessingTask
+
+    with flask_app.app_context():
+        task = ProcessingTask.query.filter_by(task_id=task_id).first()
+        return {column: getattr(task, column) for column in
+                ('status', 'lease_owner', 'lease_expires_at', 'attempts', 'batch_id', 'message')}
+
+
+def expire_lease(flask_app, task_id):
+    from models import db, ProcessingTask
+
+    with flask_app.app_context():
+        ProcessingTask.query.filter_by(task_id=task_id).update(
+            {'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.session.commit()
+
+
+def test_claims_by_priority_then_fifo(backend):
+    backend.push_jobs([job('low-1'), job('low-2')], priority=0)
+    backend.push_jobs([job('high')], priority=5)
+
+    assert backend.queue_position('high') == 1
+    assert backend.queue_position('low-2') == 3
+    assert [backend.pop_job(0)['task_id'] for _ in range(3)] == ['high', 'low-1', 'low-2']
+    assert backend.pop_job(0) is None
+    assert backend.queued_count() == 0
+
+
+def test_claim_takes_a_lease(flask_app, backend):
+    backend.push_jobs([job('a')])
+    claimed = backend.pop_job(0)
+
+    assert claimed['task_id'] == 'a'
+    assert claimed['operation'] == 'convert_format'
+    state = row(flask_app, 'a')
+    assert state['status'] == 'started'
+    assert state['lease_owner'] == backend.worker_id
+    assert state['lease_expires_at'] > datetime.utcnow()
+    assert state['attempts'] == 1
+    assert backend.queue_position('a') is None
+
+
+def test_each_job_is_claimed_by_one_worker(backend):
+    other = SQLBackend(poll_interval=0.01)
+    backend.push_jobs([job('a'), job('b')])
+
+    first, second = backend.pop_job(0), other.pop_job(0)
+    assert {first['task_id'], second['task_id']} == {'a', 'b'}
+    assert backend.pop_job(0) is None and other.pop_job(0) is None
+
+
+def test_heartbeat_only_renews_own_leases(flask_app, backend):
+    other = SQLBackend()
+    backend.push_jobs([job('a')])
+    backend.pop_job(0)
+    expire_lease(flask_app, 'a')
+
+    other.heartbeat(['a'])
+    assert row(flask_app, 'a')['lease_expires_at'] < datetime.utcnow()
+    backend.heartbeat(['a'])
+    assert row(flask_app, 'a')['lease_expires_at'] > datetime.utcnow()
+
+
+def test_release_clears_the_lease(flask_app, backend):
+    backend.push_jobs([job('a')])
+    backend.pop_job(0)
+    backend.release('a')
+
+    state = row(flask_app, 'a')
+    assert state['lease_owner'] is None and state['lease_expires_at'] is None
+    assert backend.requeue_expired() == 0
+
+
+def test_expired_lease_is_requeued_then_failed(flask_app, backend):
+    backend.push_jobs([job('a')])
+    for attempt in range(1, MAX_JOB_ATTEMPTS):
+        assert backend.pop_job(0)['task_id'] == 'a'
+        assert backend.requeue_expired() == 0  # lease still valid
+        expire_lease(flask_app, 'a')
+        assert backend.requeue_expired() == 1
+        state = row(flask_app, 'a')
+        assert state['status'] == 'queued' and state['lease_owner'] is None
+        assert state['attempts'] == attempt
+
+    assert backend.pop_job(0)['task_id'] == 'a'
+    expire_lease(flask_app, 'a')
+    assert backend.requeue_expired() == 0
+    assert row(flask_app, 'a')['status'] == 'failed'
+    assert backend.pop_job(0) is None
+
+
+def test_remove_job_only_drops_waiting_jobs(flask_app, backend):
+    backend.push_jobs([job('a'), job('b')])
+    backend.pop_job(0)
+
+    assert backend.remove_job('a') is False
+    assert backend.remove_job('b') is True
+    assert row(flask_app, 'b')['status'] == 'cancelled'
+    assert backend.pop_job(0) is None
+
+
+def test_cancel_request_is_visible_to_other_workers(backend):
+    backend.push_jobs([job('a')])
+    assert SQLBackend().cancel_requested('a') is False
+    backend.request_cancel('a')
+    assert SQLBackend().cancel_requested('a') is True
+
+
+def test_create_tasks_keeps_existing_rows(flask_app, backend):
+    from models import db, ProcessingTask
+
+    with flask_app.app_context():
+        db.session.add(ProcessingTask(task_id='existing', operation='loop_audio', status='pending'))
+        db.session.commit()
+
+    state = {'status': 'queued', 'progress': 0, 'message': 'Waiting', 'operation': 'loop_audio',
+             'batch_id': 'batch'}
+    backend.create_tasks({'existing': state, 'new': state})
+
+    assert row(flask_app, 'existing')['status'] == 'pending'
+    assert row(flask_app, 'existing')['batch_id'] == 'batch'
+    assert row(flask_app, 'new')['status'] == 'queued'
+    assert backend.get_batch('batch') == ['existing', 'new']
+
+
+def test_update_task_never_reads_the_database(flask_app, backend, monkeypatch):
+    backend.create_tasks({'task': {'status': 'queued', 'progress': 0, 'message': 'Waiting'}})
+    monkeypatch.setattr(backend, 'get_task', lambda task_id: pytest.fail('read on the progress path'))
+
+    first = backend.update_task('task', {'status': 'processing', 'progress': 10})
+    assert first['status'] == 'processing' and first['progress'] == 10
+    delta = backend.update_task('task', {'status': 'processing', 'progress': 20})
+    assert delta['progress'] == 20 and 'status' not in delta
+    assert backend.update_task('task', {'status': 'processing', 'progress': 20}) == {}
+    backend.update_task('task', {'status': 'completed', 'progress': 100})
+    assert 'task' not in backend._written
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Standalone encode worker.
+
+Pulls jobs from the shared queue (STATE_BACKEND=sql or a redis:// URL) and
+runs them, so encoding does not compete with the web processes. Run the web
+tier with RUN_ENCODE_WORKERS=0 and as many of these as the hosts can take:
+
+    STATE_BACKEND=sql python -m worker --concurrency 4
+
+The first SIGTERM/SIGINT stops claiming new jobs and waits for running ones;
+a second one exits at once, and the unfinished jobs are re-queued once their
+leases expire.
+"""
+import os
+import sys
+import signal
+import logging
+import argparse
+import threading
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run multimedia processing jobs from the shared queue')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='jobs to run at once (default: half the CPU cores)')
+    parser.add_argument('--drain-timeout', type=float, default=None,
+                        help='seconds to wait for running jobs on shutdown (default: no limit)')
+    args = parser.parse_args()
+
+    if os.environ.get('STATE_BACKEND', 'memory') == 'memory':
+        sys.exit('worker needs a shared STATE_BACKEND: sql or a redis:// URL')
+
+    # Created before the app is imported so its routes share this manager;
+    # the pool starts below, once the signal handlers are in place
+    from processing import get_manager
+    manager = get_manager(
+        max_workers=args.concurrency,
+        cache_max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 0)) or None,
+        recover=False
+    )
+    from app import app  # noqa: F401 - configures the database
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        if stop.is_set():
+            logging.warning('Second signal received, exiting without waiting for running jobs')
+            abandon(manager)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    manager.scheduler.start()
+    logging.info(f"Encode worker {os.getpid()} started with {manager.scheduler.max_workers} slot(s)")
+    while not stop.wait(1):
+        pass
+
+    logging.info('Shutting down, waiting for running jobs...')
+    if not manager.scheduler.stop(args.drain_timeout):
+        logging.warning('Running jobs did not finish in time')
+        abandon(manager)
+    manager.persister.flush()
+
+
+def abandon(manager):
+    """Exit now, leaving running jobs to be re-queued when their leases expire"""
+    # ffmpeg runs in its own session and would otherwise outlive us
+    manager.executor.kill_all()
+    # Skip atexit: flushing now would record the killed encodes as failed
+    os._exit(1)
+
+
+if __name__ == '__main__':
+    main()